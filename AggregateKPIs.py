@@ -0,0 +1,13 @@
+###############################################################################
+# Handover KPIs of every simulation run in outputs/, with the sweep parameters of
+# the runs: outputs/handoverKPIs.csv has one row per run and
+# outputs/handoverKPIsPerUE.csv one row per run and UE, outputs/handoverKPIsPerCell.csv
+# the time of stay in each serving cell of every run. The KPIs of a run are kept in
+# <run>/kpis/ and only recomputed when its trace or logs change.
+from Scripts.handoverKPIs import aggregateKPIs
+
+summary, UEtable, cellTable = aggregateKPIs('outputs')
+summary.to_csv('outputs/handoverKPIs.csv', index = False)
+UEtable.to_csv('outputs/handoverKPIsPerUE.csv', index = False)
+cellTable.to_csv('outputs/handoverKPIsPerCell.csv', index = False)
+print(summary.to_string(index = False))
@@ -1,36 +1,87 @@
 import pandas as pd
 import numpy as np
-
-np.random.seed(34)
+from pathlib import Path
 
 ###############################################################################
 # Import street network, topology, UEs
 from Scripts.streetNetwork import StreetNetwork
 from Scripts.UEpaths import generateAllRoutes, convertPathsToTimeseries
-from Scripts.settings import nUEs, nMinutes, UeMeasurementsFilterPeriod
+from Scripts.legLibrary import LegLibrary
+from Scripts.inputDataCache import inputDataKey, loadCachedTrajectories, \
+                                   saveCachedTrajectories, outputsUpToDate, recordOutputs
+from Scripts.trajectoryStore import TrajectoryStore, writeLocationsCSV
+from Scripts.settings import nUEs, nMinutes, UeMeasurementsFilterPeriod, useLegLibrary, \
+                            exportUElocationsCSV
 # from Scripts.buildings import generateBuildings
 
-streetNetwork = StreetNetwork()
-
-# Fetch eNB data
-# frequencies = [1900, 850, 700, 1700]
-radioTowers = pd.read_csv('inputData/networkTopo.csv')
-radioTowersX, radioTowersY = streetNetwork.projectionMap(
-    radioTowers['lon'], radioTowers['lat']
-)
-
-radioTowers['x'] = radioTowersX
-radioTowers['y'] = radioTowersY
-radioTowers.to_csv('inputData/networkTopo.csv', index = False)
-
-UEroutes = generateAllRoutes(streetNetwork, (radioTowersX[0], radioTowersY[0]))
-UElocations = convertPathsToTimeseries(UEroutes, streetNetwork)
-
-# Store UE paths and tower locations
-UElocationsDF = pd.concat(UElocations)
-ue_lon, ue_lat = streetNetwork.projectionMap(
-    UElocationsDF['x'], UElocationsDF['y'], inverse = True
-)
-UElocationsDF['lat'] = ue_lat
-UElocationsDF['lon'] = ue_lon
-UElocationsDF.to_csv('inputData/UE_locations.csv')
+towersFile = Path('inputData/networkTopo.csv')
+UElocationsFile = Path('inputData/UE_locations.csv')
+UEtrajectoriesDir = Path('inputData/UE_locations')
+
+
+def main():
+    streetNetwork = StreetNetwork()
+
+    # Fetch eNB data
+    # frequencies = [1900, 850, 700, 1700]
+    radioTowers = pd.read_csv(towersFile)
+    radioTowersX, radioTowersY = streetNetwork.projectionMap(
+        radioTowers['lon'], radioTowers['lat']
+    )
+
+    # Only rewrite the tower file if the projected coordinates changed
+    if not ({'x', 'y'} <= set(radioTowers.columns) and
+            np.array_equal(radioTowers['x'], radioTowersX) and
+            np.array_equal(radioTowers['y'], radioTowersY)):
+        radioTowers['x'] = radioTowersX
+        radioTowers['y'] = radioTowersY
+        radioTowers.to_csv(towersFile, index = False)
+
+    inputKey = inputDataKey(streetNetwork, radioTowers)
+    outputFiles = [UEtrajectoriesDir / 'meta.json']
+    if exportUElocationsCSV:
+        outputFiles.append(UElocationsFile)
+    if outputsUpToDate(inputKey, nUEs, outputFiles):
+        print(f'{UEtrajectoriesDir} is up to date')
+        return
+
+    # Reuse the cached UEs and only generate the ones that are missing
+    cachedLocations = loadCachedTrajectories(inputKey)
+    nCachedUEs = 0 if cachedLocations is None else cachedLocations['UE_ID'].max() + 1
+    newUE_IDs = list(range(nCachedUEs, nUEs))
+
+    UElocations = []
+    if cachedLocations is not None:
+        UElocations.append(cachedLocations)
+
+    if newUE_IDs:
+        targetSite = (radioTowersX[0], radioTowersY[0])
+        if useLegLibrary:
+            # Chain precomputed boundary <-> target area legs instead of routing every UE
+            legLibrary = LegLibrary.fetch(streetNetwork, targetSite)
+            UElocations.extend(legLibrary.sampleLegs(legLibrary.assembleLegs(UE_ID), UE_ID)
+                               for UE_ID in newUE_IDs)
+        else:
+            UEroutes = generateAllRoutes(streetNetwork, targetSite, newUE_IDs)
+            UElocations.extend(convertPathsToTimeseries(UEroutes, streetNetwork, newUE_IDs))
+
+        saveCachedTrajectories(inputKey, pd.concat(UElocations))
+
+    # Store UE paths and tower locations
+    UElocationsDF = pd.concat(UElocations)
+    UElocationsDF = UElocationsDF[UElocationsDF['UE_ID'] < nUEs].copy()
+    ue_lon, ue_lat = streetNetwork.projectionMap(
+        UElocationsDF['x'], UElocationsDF['y'], inverse = True
+    )
+    UElocationsDF['lat'] = ue_lat
+    UElocationsDF['lon'] = ue_lon
+
+    # The CSV export is written first so that the binary store is never older than it
+    if exportUElocationsCSV:
+        writeLocationsCSV(UElocationsDF, UElocationsFile)
+    TrajectoryStore.fromFrame(UElocationsDF).write(UEtrajectoriesDir)
+    recordOutputs(inputKey, nUEs, outputFiles)
+
+
+if __name__ == '__main__':
+    main()
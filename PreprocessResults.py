@@ -0,0 +1,26 @@
+import sys
+import time
+
+###############################################################################
+# Builds the snapshot the dashboard reads for every simulation run, so that it
+# starts and opens runs without parsing any CSV or log file:
+#   inputData/UE_locations/       trajectory store
+#   outputs/ep_X/run_Y/rsrp_rsrq_trace/   trace store
+#   outputs/ep_X/run_Y/dashboard/         logs, HO windows, events, map links
+# Every part is versioned and rebuilt only when its source files changed, so this
+# can be rerun after every simulation. Runs can be given as ep_X/run_Y arguments;
+# runs whose simulation is still writing its output are skipped.
+import visualizeResults as dashboard
+from Scripts.runData import findRuns
+from Scripts.liveRun import runIsLive
+
+runKeys = sys.argv[1:] or findRuns(dashboard.outputsDir)
+
+for key in runKeys:
+    if runIsLive(dashboard.outputsDir / key):
+        print(f'{key}: still running, skipped')
+        continue
+    startTime = time.perf_counter()
+    run = dashboard.loadRun(key)
+    print(f'{key}: {len(run.HOdata)} handovers, {run.nbytes / 2**20:.1f} MiB of derived data, '
+          f'{time.perf_counter() - startTime:.2f} s')
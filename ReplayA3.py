@@ -0,0 +1,30 @@
+import sys
+import time
+
+###############################################################################
+# Screens A3 handover parameters without running ns-3: replays the handover
+# decisions of every Hysteresis/TimeToTrigger combination of the replay settings on
+# the recorded trace of a run (the first argument, default the first run) and writes
+# the handovers and ping-pongs of every combination to <run>/a3Replay.csv. The replay
+# is first checked against the handovers in the run's own logs.
+from Scripts.a3Replay import A3Replay, validateReplay
+from Scripts.runData import findRuns
+from Scripts.settings import replayHysteresis, replayTimeToTrigger
+
+outputsDir = 'outputs'
+runKey = sys.argv[1] if len(sys.argv) > 1 else (findRuns(outputsDir) or ['ep_0/run_0'])[0]
+runDir = f'{outputsDir}/{runKey}'
+
+replay = A3Replay.fromRun(runDir)
+validation = validateReplay(runDir, replay = replay)
+print(f'{runKey} {validation["parameters"]}: {validation["predicted"]} replayed and '
+      f'{validation["recognized"]} simulated handovers, recall {validation["recall"]:.2f}, '
+      f'precision {validation["precision"]:.2f}, '
+      f'median time error {validation["medianTimeError"]:.2f} s')
+
+startTime = time.perf_counter()
+summary = replay.run({'Hysteresis' : replayHysteresis,
+                      'TimeToTrigger' : replayTimeToTrigger}).summary()
+print(f'Replayed {len(summary)} configurations in {time.perf_counter() - startTime:.2f} s')
+summary.to_csv(f'{runDir}/a3Replay.csv', index = False)
+print(summary.to_string(index = False))
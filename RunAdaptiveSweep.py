@@ -0,0 +1,18 @@
+import sys
+
+###############################################################################
+# Adaptive Hysteresis/TimeToTrigger sweep: runs up to adaptiveRuns simulations of
+# the adaptive grid as the runs of one episode (the first argument, default 0),
+# choosing each point from the KPIs of the runs already in outputs/ and abandoning
+# simulations whose partial KPIs are dominated. Prints the runs that no other run
+# dominates in the adaptive objectives.
+from Scripts.adaptiveSweep import AdaptiveSweep, objectiveValues, paretoFronts
+from Scripts.handoverKPIs import aggregateKPIs
+
+episode = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+
+AdaptiveSweep().run(episode)
+
+summary, _, _ = aggregateKPIs('outputs')
+if len(summary):
+    print(summary[paretoFronts(objectiveValues(summary)) == 0].to_string(index = False))
@@ -0,0 +1,19 @@
+import sys
+
+###############################################################################
+# Runs fairfield.cc for every Hysteresis/TimeToTrigger combination of the sweep
+# settings as the runs of one episode (the first argument, default 0). Completed
+# runs are skipped, so an interrupted sweep is resumed by running it again; the
+# parameters of every run are recorded in outputs/ep_X/sweep.json.
+from Scripts.parameterSweep import SweepRunner
+from Scripts.settings import sweepHysteresis, sweepTimeToTrigger
+
+episode = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+
+runs = SweepRunner().run(episode, {'Hysteresis' : sweepHysteresis,
+                                   'TimeToTrigger' : sweepTimeToTrigger})
+
+failed = [name for name, record in runs.items() if record['status'] != 'done']
+if failed:
+    print(f'{len(failed)} run(s) did not complete: {", ".join(failed)}')
+    raise SystemExit(1)
@@ -1,130 +1,178 @@
-from networkx import NetworkXNoPath
-import osmnx as ox
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from .settings import minTravelDist, nMinutes, nUEs
+import shapely
+from .settings import minTravelDist, nMinutes, nUEs, randomSeed, nWorkers, targetAreaRadius
+from .streetNetwork import StreetNetwork
 
 
-weight = lambda d, kpi: min(attr.get(kpi, 1) for attr in d.values())
-lengthFn = lambda d: min(attr['geometry'].length for attr in d.values())
-
-
-def generateRandomBoundaryPoint(streetNetwork):
+def generateRandomBoundaryPoint(streetNetwork, rng):
     # Generate a random point on the boundary of the domain
-    if np.random.choice([True, False]):
-        x = np.random.choice(streetNetwork.x_bounds)
-        y = np.random.uniform(*streetNetwork.y_bounds)
+    if rng.choice([True, False]):
+        x = rng.choice(streetNetwork.x_bounds)
+        y = rng.uniform(*streetNetwork.y_bounds)
     else:
-        x = np.random.uniform(*streetNetwork.x_bounds)
-        y = np.random.choice(streetNetwork.y_bounds)
+        x = rng.uniform(*streetNetwork.x_bounds)
+        y = rng.choice(streetNetwork.y_bounds)
     return (x, y)
 
 
-def generatePts(streetNetwork, target = None, toTarget = True):
+def generatePts(streetNetwork, rng, target = None, toTarget = True):
+    # Returns the index (in streetNetwork.streetGraph) of a random node: either one
+    # drawn uniformly from the nodes within `targetAreaRadius` of the target, or the
+    # node closest to a random point on the boundary
+    streetGraph = streetNetwork.streetGraph
     if toTarget:
-        nearTargetPt = streetNetwork.nodes[['x', 'y']].sample(1)
-        while sum(((nearTargetPt - target)**2).values[0]) > 500**2:
-            nearTargetPt = streetNetwork.nodes[['x', 'y']].sample(1)
-        pointIndex = nearTargetPt.index[0]
-
-    else:
-        randomPts = generateRandomBoundaryPoint(streetNetwork)
-        pointIndex = ox.distance.nearest_nodes(streetNetwork.oxgraph, *randomPts)
-        pointIndex = streetNetwork.nodes.loc[pointIndex, ['x', 'y']].name
+        candidates = streetGraph.nodesWithin(target, targetAreaRadius)
+        if len(candidates) == 0:
+            raise ValueError(f'No street network nodes within {targetAreaRadius} m '
+                             f'of the target {target}')
+        return candidates[rng.integers(len(candidates))]
 
-    return pointIndex
+    randomPts = generateRandomBoundaryPoint(streetNetwork, rng)
+    return streetGraph.nearestNodes(*randomPts)[0]
 
 
-def generateRoute(streetNetwork, start = None, targetSite = None, toTarget = True):
+def generateRoute(streetNetwork, rng, start = None, targetSite = None, toTarget = True):
     if start is None:
-        start = generatePts(streetNetwork, toTarget = False)
-        end = generatePts(streetNetwork, target = targetSite, toTarget = True)
+        start = generatePts(streetNetwork, rng, toTarget = False)
+        end = generatePts(streetNetwork, rng, target = targetSite, toTarget = True)
         toTarget = False
     else:
-        end = generatePts(streetNetwork, target = targetSite, toTarget = toTarget)
+        end = generatePts(streetNetwork, rng, target = targetSite, toTarget = toTarget)
+
+    return streetNetwork.streetGraph.shortestPath(start, end)
+
+
+def generateUERoute(streetNetwork, targetSite, UE_ID, seed = randomSeed):
+    # Generates the full route of a single UE. Every UE draws from its own random
+    # stream derived from (seed, UE_ID), so a route does not depend on which UEs were
+    # generated before it or on which process generated it.
+    rng = np.random.default_rng([seed, UE_ID])
+    streetGraph = streetNetwork.streetGraph
+
+    fullRoute = generateRoute(streetNetwork, rng, targetSite = targetSite, toTarget = True)
+    toTarget = False
+    totalTime = streetGraph.routeTravelTime(fullRoute)
+
+    while totalTime < nMinutes * 60:
+        route = generateRoute(streetNetwork, rng, fullRoute[-1], targetSite = targetSite,
+                              toTarget = toTarget)
+        while route is None:
+            fullRoute = fullRoute[:-1]
+            route = generateRoute(streetNetwork, rng, fullRoute[-1], targetSite = targetSite,
+                                  toTarget = toTarget)
+
+        totalTime += streetGraph.routeTravelTime(route)
+        fullRoute.extend(route[1:])
+        toTarget = not toTarget
+
+    return streetGraph.toNodeIds(fullRoute).tolist()
+
 
-    try:
-        route = ox.routing._single_shortest_path(
-            streetNetwork.oxgraph,
-            start,
-            end,
-            weight = 'travel_time'
-        )
-    except NetworkXNoPath:
-        return None
+# Street network of a route worker process, loaded once by `initRouteWorker`
+workerStreetNetwork = None
 
-    return route
+def initRouteWorker(streetNetworkFactory):
+    global workerStreetNetwork
+    workerStreetNetwork = streetNetworkFactory()
 
 
-def generateAllRoutes(streetNetwork, targetSite):
+def generateUERouteInWorker(targetSite, UE_ID, seed):
+    return generateUERoute(workerStreetNetwork, targetSite, UE_ID, seed)
+
+
+def generateAllRoutes(streetNetwork, targetSite, UE_IDs = None, seed = randomSeed,
+                      nWorkers = nWorkers, streetNetworkFactory = StreetNetwork):
     # Generates random routes for UEs along the street network with the starting
     # and destination points being at least `minDist` meters far apart. Individual routes
     # are generated until their total run time exceeds total simulation time.
-    allRoutes = []
-    for i in range(nUEs):
-        fullRoute = generateRoute(streetNetwork, targetSite = targetSite, toTarget = True)
-        toTarget = False
-        totalTime = 0
-        for u, v in zip(fullRoute[:-1], fullRoute[1:]):
-            totalTime += weight(streetNetwork.oxgraph[u][v], 'travel_time')
-        
-        while totalTime < nMinutes * 60:
-            route = generateRoute(streetNetwork, fullRoute[-1], targetSite = targetSite,
-                                  toTarget = toTarget)
-            while route is None:
-                fullRoute = fullRoute[:-1]
-                route = generateRoute(streetNetwork, fullRoute[-1], targetSite = targetSite,
-                                      toTarget = toTarget)
-            
-            routeTime = 0
-            for u, v in zip(route[:-1], route[1:]):
-                routeTime += weight(streetNetwork.oxgraph[u][v], 'travel_time')
-            
-            totalTime += routeTime
-            fullRoute.extend(route[1:])
-            toTarget = not toTarget
-        
-        allRoutes.append(fullRoute)
+    # With nWorkers != 1 the UEs are routed in a process pool (None uses all cores);
+    # each worker builds its own street network through `streetNetworkFactory` instead
+    # of receiving a pickled copy. The routes do not depend on the number of workers.
+    if UE_IDs is None:
+        UE_IDs = range(nUEs)
+
+    if nWorkers == 1:
+        return [generateUERoute(streetNetwork, targetSite, UE_ID, seed)
+                for UE_ID in UE_IDs]
+
+    nProcesses = nWorkers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers = nProcesses,
+                             initializer = initRouteWorker,
+                             initargs = (streetNetworkFactory,)) as executor:
+        allRoutes = list(executor.map(
+            generateUERouteInWorker,
+            [targetSite] * len(UE_IDs),
+            UE_IDs,
+            [seed] * len(UE_IDs),
+            chunksize = max(1, len(UE_IDs) // (4 * nProcesses))
+        ))
 
     return allRoutes
 
 
-def convertPathsToTimeseries(UEroutes, streetNetwork):
+def sampleRoute(route, streetNetwork):
+    # Samples a route (consisting of OSM street network nodes) once per integer
+    # second. All sample times and edge fractions are computed as arrays and the
+    # edge geometries are interpolated in a single vectorized call.
+    streetGraph = streetNetwork.streetGraph
+    route = streetGraph.toIndex(route)
+    edges = streetGraph.routeEdges(route)
+    travelTimes = streetGraph.travelTime[edges]
+    geometries = streetGraph.geometry[edges]
+
+    # Cumulative sums are accumulated sequentially, so the segment boundaries match
+    # the ones obtained by adding travel times one edge at a time
+    segmentEndTimes = np.cumsum(travelTimes)
+    segmentStartTimes = np.concatenate(([0.0], segmentEndTimes[:-1]))
+
+    # Integer seconds in [segmentStartTime, segmentEndTime) for every edge
+    firstSamples = np.ceil(segmentStartTimes)
+    nSamples = np.maximum(np.ceil(segmentEndTimes - firstSamples), 0).astype(int)
+
+    edgeIndex = np.repeat(np.arange(len(edges)), nSamples)
+    sampleOffsets = np.arange(nSamples.sum()) - np.repeat(np.cumsum(nSamples) - nSamples,
+                                                          nSamples)
+    sampleTimes = firstSamples[edgeIndex] + sampleOffsets
+    fractions = (sampleTimes - segmentStartTimes[edgeIndex]) / travelTimes[edgeIndex]
+
+    sampleLocations = shapely.get_coordinates(
+        shapely.line_interpolate_point(geometries[edgeIndex], fractions, normalized = True)
+    )
+
+    # Finish at the last node of the route one second after the last sample
+    sampleTimes = np.append(sampleTimes, sampleTimes[-1] + 1)
+    sampleLocations = np.vstack((
+        sampleLocations,
+        (streetGraph.x[route[-1]], streetGraph.y[route[-1]])
+    ))
+
+    return sampleTimes, sampleLocations
+
+
+def convertPathsToTimeseries(UEroutes, streetNetwork, UE_IDs = None):
     # Converts a collection of routes (consisting of OSM street network nodes) to
     # a uniform time-series of UE locations.
     UElocations = []
+    if UE_IDs is None:
+        UE_IDs = range(len(UEroutes))
+
+    for UE_ID, route in zip(UE_IDs, UEroutes):
+        directPathTimes, directPathLocations = sampleRoute(route, streetNetwork)
 
-    for UE_ID, route in enumerate(UEroutes):
-        segmentStartTime = 0
-        directPathLocations = []
-        directPathTimes = []
-
-        for u, v in zip(route[:-1], route[1:]):
-            segmentTravelTime = weight(streetNetwork.oxgraph[u][v], 'travel_time')
-            for tStamp in np.arange(np.ceil(segmentStartTime),
-                                    segmentStartTime + segmentTravelTime):
-                fraction = (tStamp - segmentStartTime) / segmentTravelTime
-                newCoord = np.ravel(
-                    streetNetwork.oxgraph[u][v][0]['geometry'].interpolate(
-                        fraction,
-                        normalized = True
-                    ).xy
-                )
-
-                directPathTimes.append(tStamp)
-                directPathLocations.append(newCoord)
-            segmentStartTime += segmentTravelTime
-
-        directPathTimes.append(tStamp + 1)
-        directPathLocations.append(tuple(streetNetwork.nodes.loc[route[-1]][['x', 'y']]))
-
-        previousTimes = list(np.arange(0, directPathTimes[0] - 1))
-        nextTimes = list(np.arange(directPathTimes[-1] + 1, nMinutes * 60 + 1))
+        # UEs wait at the first and last node of the route before and after moving
+        previousTimes = np.arange(0, directPathTimes[0] - 1)
+        nextTimes = np.arange(directPathTimes[-1] + 1, nMinutes * 60 + 1)
 
         pathData = pd.DataFrame(
-            index = previousTimes + directPathTimes + nextTimes,
-            data = [directPathLocations[0]] * len(previousTimes)
-                 + directPathLocations + [directPathLocations[-1]] * len(nextTimes),
+            index = np.concatenate((previousTimes, directPathTimes, nextTimes)),
+            data = np.concatenate((
+                np.repeat(directPathLocations[:1], len(previousTimes), axis = 0),
+                directPathLocations,
+                np.repeat(directPathLocations[-1:], len(nextTimes), axis = 0)
+            )),
             columns = ['x', 'y'])
         pathData['UE_ID'] = UE_ID
         pathData.index.name = 'Time(s)'
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from .settings import replayFilterCoefficient, replayTolerance, kpiPingPongTime
+from .traceStore import loadTraceStore, missingENB
+from .visualizationHelp import readLogs, RRCEventRecognizer
+from .signalBundles import strongestPerTime
+from .parameterSweep import expandGrid
+from .handoverKPIs import runParameters
+
+# fairfield.cc command line defaults, the parameters of runs not made by a sweep
+simulatorDefaults = {'Hysteresis' : 0.1, 'TimeToTrigger' : 100}
+
+
+def signalledHysteresis(hysteresis):
+    # ns-3 signals the A3 hysteresis in steps of 0.5 dB
+    return np.round(np.asarray(hysteresis, dtype = float) * 2) / 2
+
+
+class A3Replay:
+    # Replays the A3 handover decisions of ns-3's A3RsrpHandoverAlgorithm on a recorded
+    # trace: a handover to the strongest neighbour is triggered once some neighbour's
+    # RSRP stayed above the serving cell's RSRP + hysteresis for the time to trigger.
+    # All UEs and all (hysteresis, time to trigger) configurations are advanced together
+    # through the sample times of the trace.
+    #
+    # The trace holds the RSRP the UE PHY reports every UeMeasurementsFilterPeriod; like
+    # the UE RRC, the replay applies layer 3 filtering with `filterCoefficient` before
+    # evaluating the A3 condition. The replay uses the recorded RSRP whichever cell
+    # serves the UE, so it does not model radio link failures, handover execution time
+    # or scheduling effects of other cells' load.
+    def __init__(self, traceStore, filterCoefficient = replayFilterCoefficient):
+        self.UE_IDs = np.asarray(traceStore.UE_IDs)
+        eNBs = traceStore.column('eNB_ID')
+        self.cells = np.unique(eNBs[eNBs != missingENB]).astype(np.int16)
+        self.sampleTimes = np.unique(traceStore.column('time'))  # [ms]
+
+        # rsrp[t, UE, cell]: strongest sample per time and cell, NaN where not measured
+        nTimes, nUEs, nCells = len(self.sampleTimes), len(self.UE_IDs), len(self.cells)
+        rsrp = np.full((nTimes, nUEs, nCells), np.nan, dtype = np.float32)
+        self.initialServing = np.full(nUEs, -1, dtype = np.int64)  # cell index
+        for u, UE_ID in enumerate(self.UE_IDs):
+            times = traceStore.UEcolumn('time', UE_ID)
+            UEeNBs = traceStore.UEcolumn('eNB_ID', UE_ID)
+            RSRP = traceStore.UEcolumn('RSRP', UE_ID)
+            known = np.flatnonzero(UEeNBs != missingENB)
+            rows = known[strongestPerTime(UEeNBs[known], times[known], RSRP[known])]
+            cellIndex = np.searchsorted(self.cells, UEeNBs[rows])
+            rsrp[np.searchsorted(self.sampleTimes, times[rows]), u, cellIndex] = RSRP[rows]
+
+            serving = known[traceStore.UEcolumn('serving', UE_ID)[known].astype(bool)]
+            if len(serving):
+                first = serving[np.argmin(times[serving])]
+                self.initialServing[u] = np.searchsorted(self.cells, UEeNBs[first])
+
+        # Layer 3 filter F = (1 - a) F + a M per measured sample; the filter state of a
+        # cell is kept while it is not measured, as the UE keeps its stored measurement.
+        # An empty trace has no samples and replays to no handovers.
+        a = 0.5 ** (filterCoefficient / 4)
+        state = rsrp[0].copy() if nTimes else None
+        for t in range(1, nTimes):
+            measured = ~np.isnan(rsrp[t])
+            state = np.where(measured, np.where(np.isnan(state), rsrp[t],
+                                                (1 - a) * state + a * rsrp[t]), state)
+            rsrp[t] = np.where(measured, state, np.nan)
+        self.rsrp = rsrp
+        self.measured = ~np.isnan(rsrp).all(axis = 2)
+
+    @classmethod
+    def fromRun(cls, runDir, **kwargs):
+        return cls(loadTraceStore(runDir), **kwargs)
+
+    def run(self, configs):
+        # Replays every configuration of `configs`: a grid {'Hysteresis' : [...],
+        # 'TimeToTrigger' : [...]} (see expandGrid) or a list of parameter dicts
+        configs = pd.DataFrame(expandGrid(configs) if isinstance(configs, dict) else list(configs))
+        hysteresis = signalledHysteresis(configs['Hysteresis']).astype(np.float32)
+        timeToTrigger = configs['TimeToTrigger'].to_numpy(dtype = np.float64)
+        nUEs, nConfigs, nCells = len(self.UE_IDs), len(configs), len(self.cells)
+        cellIndex = np.arange(nCells)[:, None, None]
+
+        # State per (UE, configuration); the per-neighbour timers are (cell, UE,
+        # configuration), so that reductions over the cells are elementwise
+        serving = np.repeat(self.initialServing[:, None], nConfigs, axis = 1)
+        enteredAt = np.full((nCells, nUEs, nConfigs), np.inf)  # start of the A3 condition
+        expiresAt = np.full((nUEs, nConfigs), np.inf)           # earliest timer expiry
+        last = np.full((nUEs, nCells), np.nan, dtype = np.float32)  # stored measurements
+        events = []
+
+        for t, sampleTime in enumerate(self.sampleTimes):
+            # Time to trigger timers that expired since the previous sample trigger a
+            # handover to the strongest neighbour in the stored measurements
+            fired = expiresAt <= sampleTime
+            if fired.any():
+                UEs, configIndex = np.nonzero(fired)
+                neighbours = np.where(cellIndex[:, 0, 0] == serving[UEs, configIndex, None],
+                                      -np.inf, np.nan_to_num(last[UEs], nan = -np.inf))
+                target = np.argmax(neighbours, axis = 1)
+                events.append((configIndex, UEs, expiresAt[UEs, configIndex],
+                               serving[UEs, configIndex], target))
+                serving[UEs, configIndex] = target
+                enteredAt[:, UEs, configIndex] = np.inf
+                expiresAt[UEs, configIndex] = np.inf
+
+            # Entering / leaving the A3 condition at this sample for the measured UEs
+            active = self.measured[t]
+            if not active.any():
+                continue
+            RSRP = self.rsrp[t]
+            last[active] = np.where(np.isnan(RSRP[active]), last[active], RSRP[active])
+            UEs = slice(None) if active.all() else np.flatnonzero(active)
+            servingCells = serving[UEs]
+            threshold = np.where(servingCells >= 0,
+                                 last[UEs][np.arange(len(servingCells))[:, None],
+                                           np.maximum(servingCells, 0)], np.nan)
+            threshold += hysteresis
+            entering = RSRP[UEs].T[:, :, None] > threshold
+            entering &= cellIndex != servingCells
+
+            UEentered = np.where(entering, np.minimum(enteredAt[:, UEs], sampleTime), np.inf)
+            enteredAt[:, UEs] = UEentered
+            expiresAt[UEs] = UEentered.min(axis = 0) + timeToTrigger
+
+        columns = [np.concatenate([e[i] for e in events]) if events else np.zeros(0)
+                   for i in range(5)]
+        return A3ReplayResult(self, configs, *columns)
+
+
+class A3ReplayResult:
+    # Handovers predicted for every configuration, as flat arrays sorted by
+    # configuration, UE and time (times in seconds, cells as eNB IDs)
+    def __init__(self, replay, configs, configIndex, UEindex, times, source, target):
+        order = np.lexsort((times, UEindex, configIndex))
+        self.configs = configs
+        self.UE_IDs = replay.UE_IDs
+        self.startTime = replay.sampleTimes[0] / 1000 if len(replay.sampleTimes) else 0.0
+        self.initialServing = np.where(replay.initialServing >= 0,
+                                       replay.cells[np.maximum(replay.initialServing, 0)], -1)
+        self.HOconfig = configIndex[order].astype(np.int64)
+        self.HO_UE = replay.UE_IDs[UEindex[order].astype(np.int64)]
+        self.HOtime = times[order] / 1000
+        self.HOsource = replay.cells[source[order].astype(np.int64)]
+        self.HOtarget = replay.cells[target[order].astype(np.int64)]
+
+    def handovers(self, config):
+        # Handovers of one configuration (row of `configs`)
+        lo, hi = np.searchsorted(self.HOconfig, [config, config + 1])
+        return pd.DataFrame({'UE_ID' : self.HO_UE[lo:hi], 'Time(s)' : self.HOtime[lo:hi],
+                             'source' : self.HOsource[lo:hi], 'target' : self.HOtarget[lo:hi]})
+
+    def servingTimeline(self, config, UE_ID):
+        # (start times, cells) of the serving periods of a UE under one configuration
+        HOs = self.handovers(config)
+        HOs = HOs[HOs['UE_ID'] == UE_ID]
+        initial = self.initialServing[np.searchsorted(self.UE_IDs, UE_ID)]
+        return np.append(self.startTime, HOs['Time(s)'].to_numpy()), \
+               np.append(initial, HOs['target'].to_numpy())
+
+    def summary(self, pingPongTime = kpiPingPongTime):
+        # Handovers and ping-pongs (see handoverKPIs) of every configuration
+        sameUE = (self.HOconfig[1:] == self.HOconfig[:-1]) & (self.HO_UE[1:] == self.HO_UE[:-1])
+        pingPong = sameUE & (self.HOtarget[1:] == self.HOsource[:-1]) & \
+                   (self.HOsource[1:] == self.HOtarget[:-1]) & \
+                   (np.diff(self.HOtime) < pingPongTime)
+        nConfigs = len(self.configs)
+        return self.configs.assign(
+            handovers = np.bincount(self.HOconfig, minlength = nConfigs),
+            pingPongs = np.bincount(self.HOconfig[1:][pingPong], minlength = nConfigs))
+
+
+def matchHandovers(predicted, actual, tolerance):
+    # Whether each time of `predicted` has a time of `actual` within `tolerance`, and the
+    # signed difference to the nearest one (both sorted)
+    if len(actual) == 0:
+        return np.zeros(len(predicted), dtype = bool), np.full(len(predicted), np.nan)
+    position = np.clip(np.searchsorted(actual, predicted), 1, max(len(actual) - 1, 1))
+    candidates = np.stack((actual[position - 1], actual[np.minimum(position, len(actual) - 1)]))
+    difference = predicted - candidates[np.argmin(np.abs(predicted - candidates), axis = 0),
+                                        np.arange(len(predicted))]
+    return np.abs(difference) <= tolerance, difference
+
+
+def validateReplay(runDir, parameters = None, tolerance = replayTolerance, replay = None):
+    # Replays a run with its own parameters (from its sweep manifest, or the fairfield.cc
+    # defaults) and compares the predicted handovers with the ones recognized in its
+    # logs. Returns per-UE counts and the overall recall, precision and time errors.
+    runDir = Path(runDir)
+    if parameters is None:
+        runKey = '/'.join(runDir.parts[-2:])
+        parameters = runParameters(runDir.parent.parent).get(runKey, simulatorDefaults)
+    replay = replay or A3Replay.fromRun(runDir)
+    predicted = replay.run([parameters]).handovers(0)
+
+    logs = readLogs(runDir / 'out.txt')
+    isHO = (RRCEventRecognizer().recognize(logs) == 'Handover').to_numpy()
+    actual = logs.loc[isHO, ['UE_ID', 'Time(s)']]
+
+    UEs, errors = [], []
+    for UE_ID in replay.UE_IDs:
+        P = np.sort(predicted.loc[predicted['UE_ID'] == UE_ID, 'Time(s)'].to_numpy())
+        A = np.sort(actual.loc[actual['UE_ID'] == UE_ID, 'Time(s)'].to_numpy())
+        matchedP, difference = matchHandovers(P, A, tolerance)
+        matchedA, _ = matchHandovers(A, P, tolerance)
+        errors.append(difference[matchedP])
+        UEs.append({'UE_ID' : UE_ID, 'recognized' : len(A), 'predicted' : len(P),
+                    'matchedRecognized' : int(matchedA.sum()),
+                    'matchedPredicted' : int(matchedP.sum())})
+    UEs = pd.DataFrame(UEs, columns = ['UE_ID', 'recognized', 'predicted',
+                                       'matchedRecognized', 'matchedPredicted'])
+    errors = np.concatenate(errors) if errors else np.zeros(0)
+
+    nRecognized, nPredicted = UEs['recognized'].sum(), UEs['predicted'].sum()
+    return {
+        'parameters' : parameters,
+        'recognized' : int(nRecognized),
+        'predicted' : int(nPredicted),
+        'recall' : UEs['matchedRecognized'].sum() / nRecognized if nRecognized else np.nan,
+        'precision' : UEs['matchedPredicted'].sum() / nPredicted if nPredicted else np.nan,
+        'medianTimeError' : float(np.median(errors)) if len(errors) else np.nan,
+        'UEs' : UEs
+    }
@@ -0,0 +1,224 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .settings import adaptiveHysteresis, adaptiveTimeToTrigger, adaptiveRuns, \
+                      adaptiveObjectives, adaptiveRungs, adaptiveReduction, adaptivePollInterval
+from .parameterSweep import SweepRunner, expandGrid, pointKey, readManifest, writeManifest
+from .handoverKPIs import aggregateKPIs, runKPIs, partialRunKPIs, runRecords
+from .traceStore import traceEndTime
+
+# An adaptive sweep spends its simulations on the promising part of a parameter grid
+# instead of running every point. It keeps every worker slot of a SweepRunner busy:
+#  - the next point is proposed from the KPIs of the points evaluated so far, by a
+#    nearest neighbour surrogate: untried points whose nearest evaluated point did best
+#    come first, and among those the ones farthest from everything tried
+#  - a running simulation is compared at the simulated times `rungs` with every run
+#    that reached the same time (asynchronous successive halving); it is abandoned when
+#    its partial KPIs are not among the best 1/reduction of them
+# Runs are recorded in the episode's sweep manifest with the partial KPIs of each rung,
+# so later sweeps build on them. Results compare KPI vectors by Pareto dominance.
+
+
+def objectiveValues(summaries, objectives = adaptiveObjectives):
+    # Minimized KPI vectors of run summaries (dicts or a DataFrame); undefined KPIs,
+    # like the ping-pong ratio of a run without handovers, count as 0
+    return np.nan_to_num(pd.DataFrame(summaries, columns = objectives).to_numpy(dtype = float))
+
+
+def paretoFronts(values):
+    # Front of every row of `values` (objectives minimized): 0 for the non-dominated
+    # rows, 1 for the rows only dominated by front 0 and so on
+    values = np.asarray(values, dtype = float)
+    if values.ndim == 1:
+        values = values[:, None]
+    dominates = (values[:, None] <= values[None]).all(axis = 2) & \
+                (values[:, None] < values[None]).any(axis = 2)
+    fronts = np.zeros(len(values), dtype = np.int64)
+    remaining = np.ones(len(values), dtype = bool)
+    front = 0
+    while remaining.any():
+        current = remaining & ~dominates[remaining].any(axis = 0)
+        fronts[current] = front
+        remaining &= ~current
+        front += 1
+    return fronts
+
+
+class AdaptiveSweep:
+    def __init__(self, runner = None, grid = None, objectives = adaptiveObjectives,
+                 rungs = adaptiveRungs, reduction = adaptiveReduction,
+                 pollInterval = adaptivePollInterval):
+        self.runner = runner or SweepRunner()
+        grid = grid or {'Hysteresis' : adaptiveHysteresis,
+                        'TimeToTrigger' : adaptiveTimeToTrigger}
+        self.candidates = expandGrid(grid)
+        self.objectives = list(objectives)
+        self.rungs = sorted(float(rung) for rung in rungs)
+        self.reduction = reduction
+        self.pollInterval = pollInterval
+
+        # Distances between points are measured with every parameter scaled to [0, 1]
+        # over the grid, the time to trigger on a log scale
+        self.scales = {}
+        for name, values in grid.items():
+            transform = np.log1p if name == 'TimeToTrigger' else np.asarray
+            low, high = np.min(transform(values)), np.max(transform(values))
+            self.scales[name] = (transform, low, high - low if high > low else 1.0)
+
+        # KPI vectors by level (rung index, len(rungs) for complete runs) and point key
+        self.results = [{} for _ in range(len(self.rungs) + 1)]
+        self.points = {}    # parameters by point key of the tried and evaluated points
+        self.tried = set()  # point keys that were run (or are running)
+
+    def coordinates(self, points):
+        return np.array([[(transform(float(point[name])) - low) / scale
+                          for name, (transform, low, scale) in self.scales.items()]
+                         for point in points]).reshape(len(points), len(self.scales))
+
+    def record(self, level, parameters, summary):
+        key = pointKey(parameters)
+        self.points[key] = parameters
+        self.results[level][key] = objectiveValues([summary], self.objectives)[0]
+
+    def loadResults(self):
+        # KPIs of the complete runs in outputs/ that have the grid's parameters, and the
+        # rung KPIs of earlier adaptive runs
+        outputsDir = self.runner.outputsDir
+        summaries, _, _ = aggregateKPIs(outputsDir)
+        for summary in summaries.to_dict('records'):
+            parameters = {name : summary.get(name, np.nan) for name in self.scales}
+            if not any(pd.isna(value) for value in parameters.values()):
+                self.record(len(self.rungs), parameters, summary)
+                self.tried.add(pointKey(parameters))
+
+        for record in runRecords(outputsDir).values():
+            if any(name not in record['parameters'] for name in self.scales):
+                continue
+            for rung, summary in record.get('rungs', {}).items():
+                if float(rung) in self.rungs:
+                    self.record(self.rungs.index(float(rung)), record['parameters'], summary)
+            if record['status'] == 'abandoned':
+                self.tried.add(pointKey(record['parameters']))
+
+    def scores(self):
+        # (levels short of a complete run, Pareto front at its highest level) of every
+        # evaluated point; lower is better
+        scores = {}
+        for level, results in enumerate(self.results):
+            for key, front in zip(results, paretoFronts(list(results.values()))):
+                scores[key] = (len(self.rungs) - level, front)
+        return scores
+
+    def propose(self, nSlots):
+        # Next untried grid point, None once all were tried. The first nSlots points are
+        # spread over the grid, later ones follow the surrogate.
+        untried = [point for point in self.candidates if pointKey(point) not in self.tried]
+        if not untried:
+            return None
+        untriedXY = self.coordinates(untried)
+        triedXY = self.coordinates([self.points[key] for key in self.tried])
+        if not len(triedXY):
+            return untried[np.argmin(np.linalg.norm(untriedXY - 0.5, axis = 1))]
+        spread = np.linalg.norm(untriedXY[:, None] - triedXY[None], axis = 2).min(axis = 1)
+
+        scores = self.scores()
+        if len(scores) < nSlots:
+            return untried[np.argmax(spread)]
+        evaluatedXY = self.coordinates([self.points[key] for key in scores])
+        nearest = np.argmin(np.linalg.norm(untriedXY[:, None] - evaluatedXY[None], axis = 2),
+                            axis = 1)
+        nearestScores = np.array(list(scores.values()))[nearest]
+        return untried[np.lexsort((-spread, nearestScores[:, 1], nearestScores[:, 0]))[0]]
+
+    def continues(self, level, key):
+        # Whether a run is among the best 1/reduction of the runs that reached rung
+        # `level` (fewer than `reduction` runs there are not compared)
+        results = self.results[level]
+        if len(results) < self.reduction:
+            return True
+        fronts = paretoFronts(list(results.values()))
+        better = np.sum(fronts < fronts[list(results).index(key)])
+        return better < np.ceil(len(results) / self.reduction)
+
+    def evaluateRungs(self, record, runDir, endTime):
+        # Records the partial KPIs of the rungs before endTime [s] that a run has not
+        # been evaluated at; False if it should be abandoned
+        for level, rung in enumerate(self.rungs):
+            if rung >= endTime:
+                break
+            if f'{rung:g}' in record['rungs']:
+                continue
+            summary = partialRunKPIs(runDir, rung)
+            record['rungs'][f'{rung:g}'] = summary
+            self.record(level, record['parameters'], summary)
+            if not self.continues(level, pointKey(record['parameters'])):
+                return False
+        return True
+
+    def run(self, episode, nRuns = adaptiveRuns):
+        # Runs up to nRuns simulations as runs of `episode` and returns the manifest runs
+        runner = self.runner
+        runs = readManifest(runner.outputsDir, episode)
+        self.loadResults()
+        print(f'Episode {episode}: {len(self.candidates)} grid points, '
+              f'{len(self.results[-1])} complete runs in {runner.outputsDir}')
+
+        runner.stopping = False
+        running = {}  # run names by future
+        started = 0
+        with ThreadPoolExecutor(max_workers = runner.nWorkers) as executor:
+            try:
+                while True:
+                    while len(running) < runner.nWorkers and started < nRuns:
+                        parameters = self.propose(runner.nWorkers)
+                        if parameters is None:
+                            break
+                        runName = runner.assignRuns(episode, [parameters], runs)[0]
+                        runID = int(runName[4:])
+                        runs[runName] = {'parameters' : parameters,
+                                         'outputDir' : runner.runDir(episode, runID).as_posix(),
+                                         'status' : 'running', 'rungs' : {}}
+                        self.points[pointKey(parameters)] = parameters
+                        self.tried.add(pointKey(parameters))
+                        future = executor.submit(runner.runSimulation, episode, runID, parameters)
+                        running[future] = runName
+                        started += 1
+                    writeManifest(runner.outputsDir, episode, runs)
+                    if not running:
+                        break
+
+                    finished, _ = wait(running, timeout = self.pollInterval,
+                                       return_when = FIRST_COMPLETED)
+                    for future in finished:
+                        runName = running.pop(future)
+                        record = runs[runName]
+                        record.update(future.result())
+                        runDir = runner.runDir(episode, int(runName[4:]))
+                        if record['status'] == 'done':
+                            self.evaluateRungs(record, runDir, np.inf)
+                            self.record(len(self.rungs), record['parameters'],
+                                        runKPIs(runDir)[1]['summary'])
+                        print(f'ep_{episode}/{runName} {record["parameters"]}: '
+                              f'{record["status"]} after {record["duration"]:.0f} s')
+
+                    # Compare the running simulations at the rungs they passed
+                    for runName in running.values():
+                        runDir = runner.runDir(episode, int(runName[4:]))
+                        csvFile = runDir / 'rsrp_rsrq_trace.csv'
+                        if runDir in runner.abandoned or not csvFile.is_file():
+                            continue
+                        endTime = traceEndTime(csvFile)
+                        if endTime is not None and \
+                           not self.evaluateRungs(runs[runName], runDir, endTime):
+                            rung = list(runs[runName]['rungs'])[-1]
+                            print(f'ep_{episode}/{runName} {runs[runName]["parameters"]}: '
+                                  f'dominated after {rung} s simulated time, abandoning')
+                            runner.abandon(runDir)
+            except BaseException:
+                # Interrupted: stop the queued and running simulations
+                runner.interrupt(running, runs)
+                writeManifest(runner.outputsDir, episode, runs)
+                raise
+        writeManifest(runner.outputsDir, episode, runs)
+        return runs
@@ -0,0 +1,32 @@
+import numpy as np
+
+autoplayDecimals = 6  # lat/lon decimals of the frames sent to the browser (~0.1 m)
+
+
+def compactList(values):
+    # Rounded JSON-ready list, with NaN (e.g. the line breaks of the links) as None
+    values = np.round(np.asarray(values, dtype = float), autoplayDecimals)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def autoplayWindow(UEtrajectories, servingLinks, startTime, nFrames, step, endTime = None):
+    # Map data of the autoplay frames at startTime, startTime + step, ... (at most nFrames,
+    # up to endTime, by default the end of the trajectories), in the layout read by the
+    # autoplay clientside callback (assets/autoplay.js). Frame i holds the UE markers and
+    # the serving links of the map at time start + i * step.
+    endTime = UEtrajectories.endTime if endTime is None else endTime
+    frames = {'start' : startTime, 'step' : step, 'endTime' : endTime,
+              'graphEndTime' : UEtrajectories.endTime,
+              'UE_ID' : [], 'UElat' : [], 'UElon' : [], 'linkLat' : [], 'linkLon' : []}
+
+    for t in startTime + step * np.arange(nFrames):
+        if t > endTime:
+            break
+        positions = UEtrajectories.positionsAt(t)
+        linkLat, linkLon = servingLinks.at(t)
+        frames['UE_ID'].append(positions['UE_ID'].tolist())
+        frames['UElat'].append(compactList(positions['lat']))
+        frames['UElon'].append(compactList(positions['lon']))
+        frames['linkLat'].append(compactList(linkLat))
+        frames['linkLon'].append(compactList(linkLon))
+    return frames
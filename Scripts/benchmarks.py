@@ -0,0 +1,181 @@
+import re
+import time
+import numpy as np
+import pandas as pd
+
+from .settings import nMinutes
+from .UEpaths import convertPathsToTimeseries
+from .visualizationHelp import readLogs, messageSequences, RRCEventRecognizer
+
+
+def timeIt(fn, *args, repeats = 3):
+    # Returns the result of fn(*args) and the best wall-clock time out of `repeats` calls
+    bestTime = np.inf
+    for _ in range(repeats):
+        startTime = time.perf_counter()
+        result = fn(*args)
+        bestTime = min(bestTime, time.perf_counter() - startTime)
+    return result, bestTime
+
+
+###############################################################################
+# Reference implementations kept to verify and time the optimized versions
+
+# Minimum attribute over the parallel edges of a networkx adjacency entry
+weight = lambda d, kpi: min(attr.get(kpi, 1) for attr in d.values())
+
+def convertPathsToTimeseriesReference(UEroutes, streetNetwork):
+    # Per-second loop that interpolates the edge geometries one sample at a time.
+    UElocations = []
+
+    for UE_ID, route in enumerate(UEroutes):
+        segmentStartTime = 0
+        directPathLocations = []
+        directPathTimes = []
+
+        for u, v in zip(route[:-1], route[1:]):
+            segmentTravelTime = weight(streetNetwork.oxgraph[u][v], 'travel_time')
+            for tStamp in np.arange(np.ceil(segmentStartTime),
+                                    segmentStartTime + segmentTravelTime):
+                fraction = (tStamp - segmentStartTime) / segmentTravelTime
+                newCoord = np.ravel(
+                    streetNetwork.oxgraph[u][v][0]['geometry'].interpolate(
+                        fraction,
+                        normalized = True
+                    ).xy
+                )
+
+                directPathTimes.append(tStamp)
+                directPathLocations.append(newCoord)
+            segmentStartTime += segmentTravelTime
+
+        directPathTimes.append(tStamp + 1)
+        directPathLocations.append(tuple(streetNetwork.nodes.loc[route[-1]][['x', 'y']]))
+
+        previousTimes = list(np.arange(0, directPathTimes[0] - 1))
+        nextTimes = list(np.arange(directPathTimes[-1] + 1, nMinutes * 60 + 1))
+
+        pathData = pd.DataFrame(
+            index = previousTimes + directPathTimes + nextTimes,
+            data = [directPathLocations[0]] * len(previousTimes)
+                 + directPathLocations + [directPathLocations[-1]] * len(nextTimes),
+            columns = ['x', 'y'])
+        pathData['UE_ID'] = UE_ID
+        pathData.index.name = 'Time(s)'
+
+        UElocations.append(pathData[pathData.index <= nMinutes * 60].copy())
+
+    return UElocations
+
+
+timeStampPattern = re.compile(r'^\+?(\d+\.\d+)s')
+IMSIIDPattern = re.compile(r'IMSI\s+(\d+)')
+RRCmessagePattern = re.compile(r'UeManager\s+(.*)')
+
+def readLogsReference(logFile):
+    # Line-by-line regex parsing of an ns-3 log
+    logData = []
+
+    with open(logFile, 'r') as fileIn:
+        for line in fileIn:
+            if re.search(r' IMSI \d+ ', line):
+                logData.append([
+                    float(timeStampPattern.match(line).group(1)),
+                    int(IMSIIDPattern.search(line).group(1)) - 1,
+                    RRCmessagePattern.search(line).group(1),
+                ])
+
+    return pd.DataFrame(logData, columns = ['Time(s)', 'UE_ID', 'Message'])
+
+
+def recognizeMessagesReference(logs):
+    # Per-UE, per-event groupby classification of RRC messages
+    logs = logs.copy()
+    logs['RecognizedMessage'] = 'Uncategorized'
+    for _, UElogs in logs[['Time(s)', 'Message', 'UE_ID']].groupby('UE_ID'):
+        singleEvent = UElogs['Time(s)'].diff().gt(0.03).cumsum()
+        for _, subDF in UElogs.groupby(singleEvent):
+            messageSequence = tuple(subDF['Message'])
+            if messageSequence in messageSequences:
+                logs.loc[subDF.index[-1], 'RecognizedMessage'] = messageSequences[messageSequence]
+                logs.loc[subDF.index[:-1], 'RecognizedMessage'] = None
+
+    stillUncategorized = (logs['RecognizedMessage'] == 'Uncategorized')
+    logs.loc[stillUncategorized, 'RecognizedMessage'] = logs.loc[stillUncategorized, 'Message']
+    return logs['RecognizedMessage']
+
+
+def syntheticLogs(nEvents, nUEs = 1000, seed = 0):
+    # Parsed logs made of handovers, initial connections and unrecognized fragments
+    rng = np.random.default_rng(seed)
+    sequences = list(messageSequences)
+    fragments = [sequence[:3] for sequence in sequences]
+    eventSequences = sequences + fragments
+
+    eventTypes = rng.integers(len(eventSequences), size = nEvents)
+    eventTimes = np.sort(rng.uniform(0, 3600, nEvents))
+    eventUEs = rng.integers(nUEs, size = nEvents)
+
+    rows = [(eventTime + 1e-4 * i, UE_ID, message)
+            for eventTime, UE_ID, eventType in zip(eventTimes, eventUEs, eventTypes)
+            for i, message in enumerate(eventSequences[eventType])]
+    logs = pd.DataFrame(rows, columns = ['Time(s)', 'UE_ID', 'Message'])
+    return logs.astype({'Message' : 'category'})
+
+
+###############################################################################
+
+def benchmarkTimeseries(UEroutes, streetNetwork):
+    # Compares the vectorized trajectory sampler against the per-second loop
+    reference, referenceTime = timeIt(convertPathsToTimeseriesReference,
+                                      UEroutes, streetNetwork)
+    optimized, optimizedTime = timeIt(convertPathsToTimeseries, UEroutes, streetNetwork)
+
+    for expected, actual in zip(reference, optimized):
+        pd.testing.assert_frame_equal(expected, actual, check_exact = True)
+
+    print(f'convertPathsToTimeseries: {len(UEroutes)} UEs, '
+          f'reference {referenceTime:.3f} s, vectorized {optimizedTime:.3f} s '
+          f'({referenceTime / optimizedTime:.1f}x)')
+
+
+def benchmarkLogParsing(logFile):
+    # Compares the chunked log parser against line-by-line parsing
+    reference, referenceTime = timeIt(readLogsReference, logFile, repeats = 1)
+    optimized, optimizedTime = timeIt(readLogs, logFile, repeats = 1)
+
+    pd.testing.assert_frame_equal(reference, optimized.astype({'UE_ID' : int,
+                                                                'Message' : object}))
+    print(f'readLogs: {len(reference)} messages, reference {referenceTime:.3f} s, '
+          f'chunked {optimizedTime:.3f} s ({referenceTime / optimizedTime:.1f}x)')
+
+
+def benchmarkEventRecognition(nEvents = 2400000):
+    # Compares the automaton-based event recognition against per-event groupbys. The
+    # default is a log of about 10M messages; the reference takes ~15 minutes on it.
+    logs = syntheticLogs(nEvents)
+    reference, referenceTime = timeIt(recognizeMessagesReference,
+                                      logs.astype({'Message' : object}), repeats = 1)
+    optimized, optimizedTime = timeIt(RRCEventRecognizer().recognize, logs)
+
+    pd.testing.assert_series_equal(reference, optimized)
+    print(f'RRC event recognition: {len(logs)} messages, reference {referenceTime:.3f} s, '
+          f'automaton {optimizedTime:.3f} s ({referenceTime / optimizedTime:.1f}x)')
+
+
+if __name__ == '__main__':
+    from pathlib import Path
+    from .streetNetwork import StreetNetwork, roadNetworkFile
+    from .UEpaths import generateAllRoutes
+
+    logFile = Path('outputs/ep_0/run_0/out.txt')
+    if logFile.is_file():
+        benchmarkLogParsing(logFile)
+    benchmarkEventRecognition()
+
+    if roadNetworkFile.is_file():
+        streetNetwork = StreetNetwork()
+        radioTowers = pd.read_csv('inputData/networkTopo.csv')
+
+        UEroutes = generateAllRoutes(streetNetwork, (radioTowers['x'][0], radioTowers['y'][0]))
+        benchmarkTimeseries(UEroutes, streetNetwork)
@@ -0,0 +1,58 @@
+import numpy as np
+
+lodReduction = 4  # growth of the bucket size between two pyramid levels
+lodMinPoints = 500  # the coarsest level has at most about this many samples
+
+
+def minMaxIndices(y, bucketSize):
+    # Sorted positions of the minimum and maximum of every bucket of `bucketSize`
+    # consecutive samples, plus the first and last sample
+    nBuckets = -(-len(y) // bucketSize)
+    lowest = np.full(nBuckets * bucketSize, np.inf)
+    highest = np.full(nBuckets * bucketSize, -np.inf)
+    lowest[:len(y)] = np.where(np.isnan(y), np.inf, y)
+    highest[:len(y)] = np.where(np.isnan(y), -np.inf, y)
+
+    bucketStarts = np.arange(nBuckets) * bucketSize
+    minima = bucketStarts + lowest.reshape(nBuckets, bucketSize).argmin(axis = 1)
+    maxima = bucketStarts + highest.reshape(nBuckets, bucketSize).argmax(axis = 1)
+    return np.unique(np.concatenate((minima, maxima, [0, len(y) - 1])))
+
+
+class SeriesPyramid:
+    # Multi-resolution view of a time series. Level 0 holds every sample and level k
+    # keeps the minimum and maximum of each bucket of lodReduction**k samples, so
+    # peaks survive at every level. The `keep` positions (e.g. samples around
+    # handovers) are part of every level. Levels are stored as sample positions, with
+    # None standing for all samples.
+    def __init__(self, x, y, keep = None, minPoints = lodMinPoints, reduction = lodReduction):
+        self.x = x
+        self.y = y
+        keep = np.zeros(0, dtype = np.int64) if keep is None else np.asarray(keep)
+
+        self.levels = [None]
+        nPoints = len(x)
+        bucketSize = reduction
+        while nPoints > minPoints and bucketSize < 2 * len(x):
+            indices = np.union1d(minMaxIndices(y, bucketSize), keep).astype(np.int32)
+            self.levels.append(indices)
+            nPoints = len(indices)
+            bucketSize *= reduction
+
+    @property
+    def nbytes(self):
+        # The full resolution level is implicit in x and y
+        return sum(level.nbytes for level in self.levels[1:])
+
+    def select(self, xStart, xEnd, maxPoints):
+        # Samples within [xStart, xEnd] at the finest level with at most maxPoints of
+        # them (the coarsest level otherwise), plus one sample on each side so lines
+        # continue to the edges of the view
+        for level in self.levels:
+            levelX = self.x if level is None else self.x[level]
+            lo = max(np.searchsorted(levelX, xStart, side = 'left') - 1, 0)
+            hi = min(np.searchsorted(levelX, xEnd, side = 'right') + 1, len(levelX))
+            if hi - lo <= maxPoints:
+                break
+        samples = slice(lo, hi) if level is None else level[lo:hi]
+        return self.x[samples], self.y[samples]
@@ -0,0 +1,275 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .settings import kpiPingPongTime, kpiRSRPthreshold, kpiHOwindow, kpiWorkers
+from .sharedArrays import sourceSignature, readMeta, arraysUpToDate, materializeArrays
+from .traceStore import loadTraceStore, MemoryTraceStore, readPartialTrace, cellIDs
+from .visualizationHelp import readLogs, RRCEventRecognizer
+from .signalBundles import strongestPerTime
+from .parameterSweep import readManifest
+from .runData import findRuns
+
+handoverKPIsVersion = 2
+HOmargin = 1  # serving cells are read this long before/after a handover [s]
+
+# KPI columns of the per-UE table and the run summary
+UEcolumns = ['measuredTime', 'handovers', 'HOrate', 'pingPongs', 'meanStay', 'meanHOdelay',
+             'timeBelowThreshold', 'fractionBelowThreshold']
+# Time of stay columns of the per-cell table
+cellColumns = ['stays', 'meanStay', 'medianStay', 'p10Stay', 'p90Stay', 'timeOfStay']
+countColumns = ['UEs', 'handovers', 'pingPongs', 'stays']
+
+
+def kpiInputs(runDir):
+    # Everything the KPIs of a run depend on; cheap to evaluate, so up-to-date runs are
+    # skipped without opening them
+    runDir = Path(runDir)
+    csvFile = runDir / 'rsrp_rsrq_trace.csv'
+    trace = sourceSignature(csvFile) if csvFile.is_file() else \
+            readMeta(runDir / 'rsrp_rsrq_trace')['source']
+    return {
+        'version' : handoverKPIsVersion,
+        'trace' : trace,
+        'logs' : sourceSignature(runDir / 'out.txt'),
+        'settings' : {'pingPongTime' : kpiPingPongTime, 'RSRPthreshold' : kpiRSRPthreshold,
+                      'HOwindow' : kpiHOwindow, 'HOmargin' : HOmargin}
+    }
+
+
+def servingTimeline(times, eNBs, serving, RSRP):
+    # Time-sorted (times, cells, RSRP) of the serving cell, one sample per time
+    rows = np.flatnonzero(serving)
+    rows = rows[strongestPerTime(np.zeros(len(rows), dtype = np.int8), times[rows], RSRP[rows])]
+    return times[rows], eNBs[rows], RSRP[rows]
+
+
+def RSRPmatrix(times, eNBs, RSRP):
+    # (sample times, cells, RSRP[time, cell]) with the strongest sample per time and cell
+    # and NaN where a cell was not measured
+    rows = strongestPerTime(eNBs, times, RSRP)
+    sampleTimes, timeIndex = np.unique(times[rows], return_inverse = True)
+    cells, cellIndex = np.unique(eNBs[rows], return_inverse = True)
+    matrix = np.full((len(sampleTimes), len(cells)), np.nan, dtype = np.float32)
+    matrix[timeIndex, cellIndex] = RSRP[rows]
+    return sampleTimes, cells, matrix
+
+
+def UEhandovers(traceStore, UE_ID, HOtimes):
+    # Source/target cell, ping-pong flag, time of stay in the target cell and delay after
+    # the source/target RSRP crossing of every handover of a UE (HOtimes sorted)
+    times = traceStore.UEcolumn('time', UE_ID) / 1000
+    eNBs = cellIDs(traceStore.UEcolumn('eNB_ID', UE_ID))
+    serving = traceStore.UEcolumn('serving', UE_ID).astype(bool)
+    RSRP = traceStore.UEcolumn('RSRP', UE_ID)
+    servingTimes, servingCells, servingRSRP = servingTimeline(times, eNBs, serving, RSRP)
+
+    # Serving cells around each handover; a handover without a serving sample within
+    # kpiHOwindow on either side, from or to an unknown cell or without a cell change has
+    # no source/target
+    nHOs, nSamples = len(HOtimes), len(servingTimes)
+    before = np.searchsorted(servingTimes, HOtimes - HOmargin, side = 'left') - 1
+    after = np.searchsorted(servingTimes, HOtimes + HOmargin, side = 'right')
+    valid = (before >= 0) & (after < nSamples)
+    before = np.clip(before, 0, max(nSamples - 1, 0))
+    after = np.clip(after, 0, max(nSamples - 1, 0))
+    if nSamples:
+        valid &= (servingTimes[before] > HOtimes - kpiHOwindow) & \
+                 (servingTimes[after] < HOtimes + kpiHOwindow)
+        source = np.where(valid, servingCells[before], -1)
+        target = np.where(valid, servingCells[after], -1)
+    else:
+        source = target = np.full(nHOs, -1, dtype = np.int16)
+    valid &= (source >= 0) & (target >= 0) & (source != target)
+
+    # A ping-pong returns to the source cell of the previous handover shortly after it
+    pingPong = np.zeros(nHOs, dtype = bool)
+    pingPong[1:] = valid[1:] & valid[:-1] & (target[1:] == source[:-1]) & \
+                   (source[1:] == target[:-1]) & (np.diff(HOtimes) < kpiPingPongTime)
+    stay = np.append(np.diff(HOtimes), np.nan)
+
+    # Delay of the handover after the target cell became stronger than the source cell
+    delay = np.full(nHOs, np.nan)
+    sampleTimes, cells, matrix = RSRPmatrix(times, eNBs, RSRP)
+    lo = np.searchsorted(sampleTimes, HOtimes - kpiHOwindow, side = 'right')
+    hi = np.searchsorted(sampleTimes, HOtimes + kpiHOwindow, side = 'left')
+    sourceColumn = np.searchsorted(cells, source)
+    targetColumn = np.searchsorted(cells, target)
+    for i in np.flatnonzero(valid):
+        stronger = matrix[lo[i]:hi[i], targetColumn[i]] > matrix[lo[i]:hi[i], sourceColumn[i]]
+        if stronger.any():
+            delay[i] = HOtimes[i] - sampleTimes[lo[i] + np.argmax(stronger)]
+
+    # Time with the serving RSRP below kpiRSRPthreshold, each sample lasting until the next
+    steps = np.diff(servingTimes)
+    below = servingRSRP[:-1] < kpiRSRPthreshold
+    measuredTime = float(steps.sum())
+
+    HOs = {'source' : source, 'target' : target, 'pingPong' : pingPong, 'stay' : stay,
+           'delay' : delay}
+    return HOs, measuredTime, float(steps[below].sum())
+
+
+def nanStat(fn, values):
+    values = np.asarray(values, dtype = float)
+    values = values[~np.isnan(values)]
+    return float(fn(values)) if len(values) else np.nan
+
+
+def cellArray(column):
+    # Name of the KPI array of a per-cell column ('meanStay' -> 'cellMeanStay')
+    return 'cell' + column[0].upper() + column[1:]
+
+
+def cellStays(target, stay):
+    # Time of stay per serving cell: count, mean, distribution and total of the stays
+    # after the handovers into each cell (the last handover of a UE has no known stay)
+    valid = (target >= 0) & ~np.isnan(stay)
+    stays = pd.Series(stay[valid]).groupby(target[valid])
+    table = pd.DataFrame({
+        'stays' : stays.size(), 'meanStay' : stays.mean(), 'medianStay' : stays.median(),
+        'p10Stay' : stays.quantile(0.1), 'p90Stay' : stays.quantile(0.9),
+        'timeOfStay' : stays.sum()
+    })
+    return {'cell_ID' : table.index.to_numpy(dtype = np.int16),
+            **{cellArray(column) : table[column].to_numpy(dtype = int if column in countColumns
+                                                          else float)
+               for column in cellColumns}}
+
+
+def computeKPIs(traceStore, logs):
+    # (arrays, meta) of the KPIs of a trace and its logs: per-handover, per-UE and
+    # per-serving-cell arrays and the run summary in meta['summary']
+    isHO = (RRCEventRecognizer().recognize(logs) == 'Handover').to_numpy()
+    HO_UEs = logs['UE_ID'].to_numpy()[isHO]
+    HOtimes = logs['Time(s)'].to_numpy()[isHO]
+    order = np.lexsort((HOtimes, HO_UEs))
+    order = order[np.isin(HO_UEs[order], traceStore.UE_IDs)]
+    HO_UEs, HOtimes = HO_UEs[order], HOtimes[order]
+
+    HOs, UEs = [], {column : [] for column in UEcolumns}
+    for UE_ID in traceStore.UE_IDs:
+        lo, hi = np.searchsorted(HO_UEs, [UE_ID, UE_ID + 1])
+        UEHOs, measuredTime, timeBelow = UEhandovers(traceStore, UE_ID, HOtimes[lo:hi])
+        HOs.append(UEHOs)
+        nHOs = hi - lo
+        UEs['measuredTime'].append(measuredTime)
+        UEs['handovers'].append(nHOs)
+        UEs['HOrate'].append(nHOs / measuredTime * 3600 if measuredTime > 0 else np.nan)
+        UEs['pingPongs'].append(int(UEHOs['pingPong'].sum()))
+        UEs['meanStay'].append(nanStat(np.mean, UEHOs['stay']))
+        UEs['meanHOdelay'].append(nanStat(np.mean, UEHOs['delay']))
+        UEs['timeBelowThreshold'].append(timeBelow)
+        UEs['fractionBelowThreshold'].append(timeBelow / measuredTime if measuredTime > 0
+                                             else np.nan)
+
+    concat = lambda name, dtype: np.concatenate([h[name] for h in HOs] +
+                                                [np.zeros(0, dtype = dtype)])
+    arrays = {
+        'HO_UE' : HO_UEs, 'HOtime' : HOtimes,
+        'HOsource' : concat('source', np.int16), 'HOtarget' : concat('target', np.int16),
+        'HOpingPong' : concat('pingPong', bool), 'HOstay' : concat('stay', float),
+        'HOdelay' : concat('delay', float),
+        'UE_ID' : np.asarray(traceStore.UE_IDs),
+        **{column : np.asarray(values, dtype = int if column in countColumns else float)
+           for column, values in UEs.items()}
+    }
+    arrays.update(cellStays(arrays['HOtarget'], arrays['HOstay']))
+
+    measuredTime = arrays['measuredTime'].sum()
+    handovers = len(HOtimes)
+    summary = {
+        'UEs' : len(traceStore.UE_IDs),
+        'handovers' : handovers,
+        'HOrate' : handovers / measuredTime * 3600 if measuredTime > 0 else np.nan,
+        'pingPongs' : int(arrays['HOpingPong'].sum()),
+        'pingPongRatio' : arrays['HOpingPong'].sum() / handovers if handovers else np.nan,
+        'meanStay' : nanStat(np.mean, arrays['HOstay']),
+        'medianStay' : nanStat(np.median, arrays['HOstay']),
+        'meanHOdelay' : nanStat(np.mean, arrays['HOdelay']),
+        'medianHOdelay' : nanStat(np.median, arrays['HOdelay']),
+        'fractionBelowThreshold' : arrays['timeBelowThreshold'].sum() / measuredTime
+                                   if measuredTime > 0 else np.nan
+    }
+    return arrays, {'summary' : {name : int(value) if name in countColumns else float(value)
+                                 for name, value in summary.items()}}
+
+
+def computeRunKPIs(runDir):
+    runDir = Path(runDir)
+    return computeKPIs(loadTraceStore(runDir), readLogs(runDir / 'out.txt'))
+
+
+def partialRunKPIs(runDir, untilTime):
+    # Summary KPIs of the first untilTime seconds of a run that may still be running
+    runDir = Path(runDir)
+    traceStore = MemoryTraceStore(readPartialTrace(runDir / 'rsrp_rsrq_trace.csv', untilTime))
+    logs = readLogs(runDir / 'out.txt', untilTime = untilTime)
+    return computeKPIs(traceStore, logs)[1]['summary']
+
+
+def runKPIs(runDir):
+    # KPIs of a run from <run>/kpis/, computed first if they are missing or stale
+    return materializeArrays(Path(runDir) / 'kpis', kpiInputs(runDir),
+                             lambda: computeRunKPIs(runDir))
+
+
+def runRecords(outputsDir):
+    # Sweep manifest records of every run made by a sweep, by run key
+    records = {}
+    for episodeDir in Path(outputsDir).glob('ep_*'):
+        episode = episodeDir.name[3:]
+        if episode.isdigit():
+            for runName, record in readManifest(outputsDir, int(episode)).items():
+                records[f'ep_{episode}/{runName}'] = record
+    return records
+
+
+def runParameters(outputsDir):
+    # Sweep parameters of every run recorded in an episode's sweep manifest, by run key
+    return {key : record['parameters'] for key, record in runRecords(outputsDir).items()}
+
+
+def aggregateKPIs(outputsDir = 'outputs', nWorkers = kpiWorkers):
+    # KPI tables of all runs in outputsDir: (summary per run, table per UE, time of stay
+    # table per serving cell), all with the run's sweep parameters. Only runs whose KPIs are missing or stale are processed,
+    # in a process pool unless nWorkers == 1. Runs a sweep abandoned or interrupted are
+    # left out, as their partial KPIs do not compare with complete runs.
+    outputsDir = Path(outputsDir)
+    records = runRecords(outputsDir)
+    runKeys = [key for key in findRuns(outputsDir)
+               if records.get(key, {}).get('status') not in ('abandoned', 'interrupted')]
+    stale = [key for key in runKeys
+             if not arraysUpToDate(outputsDir / key / 'kpis', kpiInputs(outputsDir / key))]
+    if stale:
+        print(f'Computing KPIs of {len(stale)} of {len(runKeys)} runs')
+        if nWorkers == 1 or len(stale) == 1:
+            for key in stale:
+                runKPIs(outputsDir / key)
+        else:
+            with ProcessPoolExecutor(max_workers = min(nWorkers or os.cpu_count(),
+                                                       len(stale))) as executor:
+                list(executor.map(runKPIs, [outputsDir / key for key in stale]))
+
+    summaries, UEtables, cellTables = [], [], []
+    for key in runKeys:
+        arrays, meta = runKPIs(outputsDir / key)
+        runInfo = {'run' : key, **records.get(key, {}).get('parameters', {})}
+        summaries.append({**runInfo, **meta['summary']})
+        UEtables.append(pd.DataFrame({column : np.array(arrays[column])
+                                      for column in ['UE_ID'] + UEcolumns}).assign(**runInfo))
+        cellTables.append(pd.DataFrame({'cell_ID' : np.array(arrays['cell_ID']),
+                                        **{column : np.array(arrays[cellArray(column)])
+                                           for column in cellColumns}}).assign(**runInfo))
+    if not runKeys:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    # Run and sweep parameter columns first
+    def parametersFirst(table, KPIcolumns):
+        return table[[c for c in table.columns if c not in KPIcolumns] + KPIcolumns]
+    UEtable = parametersFirst(pd.concat(UEtables, ignore_index = True), ['UE_ID'] + UEcolumns)
+    cellTable = parametersFirst(pd.concat(cellTables, ignore_index = True),
+                                ['cell_ID'] + cellColumns)
+    return pd.DataFrame(summaries), UEtable, cellTable
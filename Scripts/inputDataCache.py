@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from . import settings
+from .sharedArrays import sourceSignature
+from .streetNetwork import streetNetworkCacheDir
+
+inputDataVersion = 1
+
+# Settings the generated UE trajectories depend on. nUEs is deliberately left out:
+# every UE is generated from its own random stream, so the first n UEs are the same
+# for any nUEs >= n and a larger run only has to generate the new ones.
+trajectorySettings = ['nMinutes', 'randomSeed', 'targetAreaRadius', 'useLegLibrary',
+                      'nLibraryBoundaryNodes', 'nLibraryTargetNodes']
+
+# Describes the inputs and the files of the UE_locations outputs currently in inputData/
+outputManifestFile = streetNetworkCacheDir / 'generateInputData.json'
+
+
+def inputDataKey(streetNetwork, radioTowers):
+    # Content hash of everything UE_locations.csv depends on besides nUEs
+    key = hashlib.sha256(json.dumps({
+        'version' : inputDataVersion,
+        'streetNetwork' : streetNetwork.cacheKey,
+        'radioTowers' : radioTowers[['eNB_ID', 'lat', 'lon']].to_numpy().tolist(),
+        'settings' : {name : getattr(settings, name) for name in trajectorySettings}
+    }).encode())
+    return key.hexdigest()[:20]
+
+
+def trajectoryCacheFile(key):
+    return streetNetworkCacheDir / f'UElocations-{key}.npz'
+
+
+def loadCachedTrajectories(key):
+    # Cached UE locations for this key (indexed by Time(s)), or None
+    cacheFile = trajectoryCacheFile(key)
+    if not cacheFile.is_file():
+        return None
+
+    with np.load(cacheFile) as arrays:
+        UElocations = pd.DataFrame(
+            {'x' : arrays['x'], 'y' : arrays['y'], 'UE_ID' : arrays['UE_ID']},
+            index = pd.Index(arrays['time'], name = 'Time(s)')
+        )
+    return UElocations
+
+
+def saveCachedTrajectories(key, UElocations):
+    cacheFile = trajectoryCacheFile(key)
+    cacheFile.parent.mkdir(parents = True, exist_ok = True)
+    tmpFile = cacheFile.with_suffix('.tmp')
+    with open(tmpFile, 'wb') as fileOut:
+        np.savez(fileOut,
+                 time = UElocations.index.to_numpy(dtype = float),
+                 x = UElocations['x'].to_numpy(),
+                 y = UElocations['y'].to_numpy(),
+                 UE_ID = UElocations['UE_ID'].to_numpy())
+    os.replace(tmpFile, cacheFile)
+
+
+def outputsManifest(key, nUEs, outputFiles):
+    # The output files are recorded with their size and modification time, so a file
+    # this script did not write (e.g. the committed UE_locations.csv, or one left from
+    # before the CSV export was turned on) never counts as up to date
+    return {'key' : key, 'nUEs' : nUEs,
+            'exportUElocationsCSV' : settings.exportUElocationsCSV,
+            'outputs' : {Path(f).as_posix() : sourceSignature(f) for f in outputFiles}}
+
+
+def outputsUpToDate(key, nUEs, outputFiles):
+    # True if the output files exist and were generated from the same inputs
+    if not outputManifestFile.is_file() or not all(Path(f).is_file() for f in outputFiles):
+        return False
+    with open(outputManifestFile) as fileIn:
+        manifest = json.load(fileIn)
+    return manifest == outputsManifest(key, nUEs, outputFiles)
+
+
+def recordOutputs(key, nUEs, outputFiles):
+    outputManifestFile.parent.mkdir(parents = True, exist_ok = True)
+    with open(outputManifestFile, 'w') as fileOut:
+        json.dump(outputsManifest(key, nUEs, outputFiles), fileOut)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from .settings import nMinutes, randomSeed, targetAreaRadius, \
+                      nLibraryBoundaryNodes, nLibraryTargetNodes
+from .streetNetwork import streetNetworkCacheDir
+from .UEpaths import generateRandomBoundaryPoint
+
+legLibraryVersion = 1
+
+
+def raggedTake(offsets, ids):
+    # Flat positions of the ragged rows `ids`, where row i spans offsets[i]:offsets[i + 1]
+    starts = offsets[ids]
+    lengths = offsets[np.asarray(ids) + 1] - starts
+    rowStarts = np.cumsum(lengths) - lengths
+    return np.repeat(starts - rowStarts, lengths) + np.arange(lengths.sum())
+
+
+def legPolyline(streetGraph, path):
+    # Vertices of the edge geometries along `path` and the time (from the start of
+    # the leg) at which a UE moving at the edge travel times passes each of them
+    edges = streetGraph.routeEdges(path)
+    travelTimes = streetGraph.travelTime[edges]
+    edgeStartTimes = np.cumsum(travelTimes) - travelTimes
+
+    vertices = raggedTake(streetGraph.geometryOffsets, edges)
+    nVertices = np.diff(streetGraph.geometryOffsets)[edges]
+    vertexEdge = np.repeat(np.arange(len(edges)), nVertices)
+    vertexXY = streetGraph.geometryCoords[vertices]
+
+    # Distance along each edge geometry, restarting at the first vertex of every edge
+    steps = np.hypot(*np.diff(vertexXY, axis = 0, prepend = vertexXY[:1]).T)
+    firstVertices = np.cumsum(nVertices) - nVertices
+    steps[firstVertices] = 0
+    distance = np.cumsum(steps)
+    distance -= np.repeat(distance[firstVertices], nVertices)
+    edgeLengths = distance[firstVertices + nVertices - 1]
+
+    fractions = np.divide(distance, edgeLengths[vertexEdge],
+                          out = np.zeros_like(distance),
+                          where = edgeLengths[vertexEdge] > 0)
+    vertexTimes = edgeStartTimes[vertexEdge] + fractions * travelTimes[vertexEdge]
+
+    return vertexXY, vertexTimes
+
+
+def pruneDeadEnds(boundaryToTarget, targetToBoundary):
+    # Copies of the leg matrices without the legs into nodes that have no leg out (and
+    # so on, until every remaining leg can be followed by another one). Chaining legs
+    # then never gets stuck; the baseline route generation backtracked out of these.
+    toTarget, toBoundary = boundaryToTarget.copy(), targetToBoundary.copy()
+    while True:
+        deadTargets = ~(toBoundary >= 0).any(axis = 1)
+        deadBoundary = ~(toTarget >= 0).any(axis = 1)
+        if not ((toTarget[:, deadTargets] >= 0).any() or
+                (toBoundary[:, deadBoundary] >= 0).any()):
+            return toTarget, toBoundary
+        toTarget[:, deadTargets] = -1
+        toBoundary[:, deadBoundary] = -1
+
+
+class LegLibrary:
+    # Precomputed boundary <-> target area routes ("legs"). Leg i follows the nodes
+    # legNodes[legNodeOffsets[i]:legNodeOffsets[i + 1]] and its sampled geometry is
+    # stored as polyline vertices with passing times.
+    # `boundaryToTarget[b, t]` and `targetToBoundary[t, b]` hold the leg index
+    # between boundary node b and target node t, or -1 if there is no path.
+    # Boundary nodes are drawn like generatePts draws them and weighted by the number
+    # of draws that hit them.
+    arrayNames = ['boundaryNodes', 'boundaryWeights', 'targetNodes',
+                  'boundaryToTarget', 'targetToBoundary',
+                  'legTravelTime', 'legNodes', 'legNodeOffsets',
+                  'legVertexXY', 'legVertexTime', 'legVertexOffsets']
+
+    def __init__(self, **arrays):
+        for name in self.arrayNames:
+            setattr(self, name, arrays[name])
+        self.chainToTarget, self.chainToBoundary = pruneDeadEnds(self.boundaryToTarget,
+                                                                 self.targetToBoundary)
+
+    @classmethod
+    def build(cls, streetNetwork, targetSite, seed = randomSeed,
+              nBoundaryNodes = nLibraryBoundaryNodes, nTargetNodes = nLibraryTargetNodes):
+        streetGraph = streetNetwork.streetGraph
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key = (1,)))
+
+        boundaryPts = [generateRandomBoundaryPoint(streetNetwork, rng)
+                       for _ in range(nBoundaryNodes)]
+        boundaryNodes, boundaryWeights = np.unique(
+            streetGraph.nearestNodes(*np.transpose(boundaryPts)),
+            return_counts = True
+        )
+
+        targetNodes = streetGraph.nodesWithin(targetSite, targetAreaRadius)
+        if len(targetNodes) == 0:
+            raise ValueError(f'No street network nodes within {targetAreaRadius} m '
+                             f'of the target {targetSite}')
+        if len(targetNodes) > nTargetNodes:
+            targetNodes = np.sort(rng.choice(targetNodes, nTargetNodes, replace = False))
+
+        legs = {'legTravelTime' : [], 'legNodes' : [], 'legVertexXY' : [],
+                'legVertexTime' : []}
+        def addLegs(sources, targets):
+            distances, predecessors = streetGraph.shortestPathTrees(sources)
+            legIndex = np.full((len(sources), len(targets)), -1)
+            for i, source in enumerate(sources):
+                for j, target in enumerate(targets):
+                    if source == target or not np.isfinite(distances[i, target]):
+                        continue
+                    path = streetGraph.tracePath(predecessors[i], target)
+                    vertexXY, vertexTimes = legPolyline(streetGraph, path)
+                    legIndex[i, j] = len(legs['legNodes'])
+                    legs['legTravelTime'].append(streetGraph.routeTravelTime(path))
+                    legs['legNodes'].append(np.asarray(path))
+                    legs['legVertexXY'].append(vertexXY)
+                    legs['legVertexTime'].append(vertexTimes)
+            return legIndex
+
+        boundaryToTarget = addLegs(boundaryNodes, targetNodes)
+        if (boundaryToTarget < 0).all():
+            raise ValueError(f'No street network path from the {len(boundaryNodes)} boundary '
+                             f'nodes to the {len(targetNodes)} nodes of the target area '
+                             f'around {targetSite}')
+        targetToBoundary = addLegs(targetNodes, boundaryNodes)
+
+        offsets = lambda parts: np.concatenate(([0], np.cumsum([len(p) for p in parts])))
+        return cls(
+            boundaryNodes = boundaryNodes,
+            boundaryWeights = boundaryWeights,
+            targetNodes = targetNodes,
+            boundaryToTarget = boundaryToTarget,
+            targetToBoundary = targetToBoundary,
+            legTravelTime = np.array(legs['legTravelTime']),
+            legNodes = np.concatenate(legs['legNodes']),
+            legNodeOffsets = offsets(legs['legNodes']),
+            legVertexXY = np.concatenate(legs['legVertexXY']),
+            legVertexTime = np.concatenate(legs['legVertexTime']),
+            legVertexOffsets = offsets(legs['legVertexTime'])
+        )
+
+    @classmethod
+    def load(cls, libraryFile):
+        with np.load(libraryFile) as arrays:
+            return cls(**{name : arrays[name] for name in cls.arrayNames})
+
+    def save(self, libraryFile):
+        libraryFile.parent.mkdir(parents = True, exist_ok = True)
+        tmpFile = libraryFile.with_suffix('.tmp')
+        with open(tmpFile, 'wb') as fileOut:
+            np.savez(fileOut, **{name : getattr(self, name) for name in self.arrayNames})
+        os.replace(tmpFile, libraryFile)
+
+    @classmethod
+    def fetch(cls, streetNetwork, targetSite, seed = randomSeed,
+              nBoundaryNodes = nLibraryBoundaryNodes, nTargetNodes = nLibraryTargetNodes):
+        # Loads the library for these inputs from the cache, building it if needed
+        if streetNetwork.cacheKey is None:
+            return cls.build(streetNetwork, targetSite, seed, nBoundaryNodes, nTargetNodes)
+
+        key = hashlib.sha256(json.dumps({
+            'version' : legLibraryVersion,
+            'streetNetwork' : streetNetwork.cacheKey,
+            'targetSite' : [float(c) for c in targetSite],
+            'targetAreaRadius' : targetAreaRadius,
+            'seed' : seed,
+            'nBoundaryNodes' : nBoundaryNodes,
+            'nTargetNodes' : nTargetNodes
+        }).encode()).hexdigest()[:20]
+        libraryFile = streetNetworkCacheDir / f'legLibrary-{key}.npz'
+
+        if libraryFile.is_file():
+            return cls.load(libraryFile)
+        library = cls.build(streetNetwork, targetSite, seed, nBoundaryNodes, nTargetNodes)
+        library.save(libraryFile)
+        return library
+
+    def assembleLegs(self, UE_ID, seed = randomSeed):
+        # Chains legs boundary -> target -> boundary -> ... until the UE has been
+        # moving for the whole simulation. Every UE uses its own random stream.
+        rng = np.random.default_rng([seed, UE_ID])
+        targetWeights = np.ones(len(self.targetNodes))
+
+        startRows = np.flatnonzero((self.chainToTarget >= 0).any(axis = 1))
+        if len(startRows) == 0:
+            raise ValueError('The leg library has no legs from a boundary node to the '
+                             'target area that lead back to the boundary')
+        weights = self.boundaryWeights[startRows]
+        row = rng.choice(startRows, p = weights / weights.sum())
+        toTarget = True
+        legIds = []
+        totalTime = 0
+        while not legIds or totalTime < nMinutes * 60:
+            legRow = (self.chainToTarget if toTarget else self.chainToBoundary)[row]
+            columns = np.flatnonzero(legRow >= 0)
+            weights = (targetWeights if toTarget else self.boundaryWeights)[columns]
+            row = rng.choice(columns, p = weights / weights.sum())
+
+            legIds.append(legRow[row])
+            totalTime += self.legTravelTime[legIds[-1]]
+            toTarget = not toTarget
+
+        return np.array(legIds)
+
+    def legRoute(self, legIds, streetGraph):
+        # OSM node IDs along the chained legs
+        nodes = [self.legNodes[self.legNodeOffsets[i]:self.legNodeOffsets[i + 1]]
+                 for i in legIds]
+        route = np.concatenate([nodes[0]] + [legNodes[1:] for legNodes in nodes[1:]])
+        return streetGraph.toNodeIds(route).tolist()
+
+    def sampleLegs(self, legIds, UE_ID):
+        # Locations once per second along the chained legs, interpolated from the
+        # stored polylines. The UE stays at the last node once the legs are exhausted.
+        legStartTimes = np.cumsum(self.legTravelTime[legIds]) - self.legTravelTime[legIds]
+        vertices = raggedTake(self.legVertexOffsets, legIds)
+        nVertices = np.diff(self.legVertexOffsets)[legIds]
+        vertexTimes = self.legVertexTime[vertices] + np.repeat(legStartTimes, nVertices)
+        vertexXY = self.legVertexXY[vertices]
+
+        sampleTimes = np.arange(0, nMinutes * 60 + 1, dtype = float)
+        pathData = pd.DataFrame(
+            index = pd.Index(sampleTimes, name = 'Time(s)'),
+            data = {'x' : np.interp(sampleTimes, vertexTimes, vertexXY[:, 0]),
+                    'y' : np.interp(sampleTimes, vertexTimes, vertexXY[:, 1])}
+        )
+        pathData['UE_ID'] = UE_ID
+        return pathData
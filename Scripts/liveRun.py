@@ -0,0 +1,347 @@
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from .traceStore import TraceStore, traceColumns, traceStoreVersion, compactTraceChunk
+from .visualizationHelp import parseLogChunk, RRCEventRecognizer, UETimeIndex, HOwindowBounds
+from .servingLinks import ServingLinkFrames
+from .signalBundles import SignalBundleCache, recognizedEvents
+from .runData import HOwindows
+
+liveIdleTime = 60        # a run whose files did not grow for this long is finished [s]
+liveReadBytes = 1 << 26  # bytes of a followed file read per update
+HOsettleTime = 5         # trace after a handover needed for its window (HOwindowBounds) [s]
+
+
+def runIsLive(runDir, idleTime = liveIdleTime):
+    # Whether the simulation of a run is still writing its trace
+    csvFile = Path(runDir) / 'rsrp_rsrq_trace.csv'
+    return csvFile.is_file() and time.time() - csvFile.stat().st_mtime < idleTime
+
+
+class GrowingArray:
+    # Append-only array with amortized constant time appends; `values` is a view of
+    # the filled part (views taken earlier stay valid, they do not see later rows)
+    def __init__(self, dtype, capacity = 1024):
+        self.buffer = np.empty(capacity, dtype = dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        size = self.size + len(values)
+        if size > len(self.buffer):
+            buffer = np.empty(max(size, 2 * len(self.buffer)), dtype = self.buffer.dtype)
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        self.buffer[self.size:size] = values
+        self.size = size
+
+    @property
+    def values(self):
+        return self.buffer[:self.size]
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes
+
+
+class FileTail:
+    # Follows a file that is being written: read() returns the complete lines added
+    # since the saved byte offset and moves the offset past them. replaced() tells
+    # when the offset no longer refers to the file, as it was truncated or recreated.
+    def __init__(self, path, offset = 0):
+        self.path = Path(path)
+        self.offset = offset
+        self.inode = None  # inode of the file read so far
+
+    def stat(self):
+        return self.path.stat() if self.path.is_file() else None
+
+    def size(self):
+        stat = self.stat()
+        return stat.st_size if stat is not None else 0
+
+    def replaced(self):
+        stat = self.stat()
+        if stat is None:
+            return self.offset > 0
+        return stat.st_size < self.offset or \
+               (self.inode is not None and stat.st_ino != self.inode)
+
+    def read(self, maxBytes = liveReadBytes):
+        if self.size() <= self.offset:
+            return b''
+        with open(self.path, 'rb') as fileIn:
+            inode = os.fstat(fileIn.fileno()).st_ino
+            if self.inode is not None and inode != self.inode:
+                return b''
+            self.inode = inode
+            fileIn.seek(self.offset)
+            data = fileIn.read(maxBytes)
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        return data
+
+
+class LiveSignalBundleCache(SignalBundleCache):
+    # SignalBundleCache of a LiveRun: the events of a UE are selected from the growing
+    # logs when its bundle is built, and the run drops the bundles of the UEs whose
+    # trace or events changed (see SignalBundleCache.invalidate)
+    def __init__(self, liveRun):
+        super().__init__(liveRun.traceStore, recognizedEvents(liveRun.logs))
+        self.liveRun = liveRun
+
+    def UElogs(self, UE_ID):
+        logs = self.liveRun.logs
+        return recognizedEvents(logs[logs['UE_ID'].to_numpy() == UE_ID])
+
+
+class LiveTraceStore(TraceStore):
+    # TraceStore in memory that grows as rows are appended. Rows keep their position in
+    # the trace (which is in time order), so row numbers stay valid; the rows of every
+    # UE are indexed instead of being stored contiguously.
+    def __init__(self):
+        self.storeDir = None
+        self.meta = {'version' : traceStoreVersion, 'nRows' : 0}
+        self.growing = {name : GrowingArray(dtype) for name, dtype in traceColumns.items()}
+        self.UErows = {}
+        self.UE_IDs = np.zeros(0, dtype = np.uint16)
+
+    def append(self, columns):
+        start = len(self)
+        for name, values in self.growing.items():
+            values.append(columns[name])
+        order = np.argsort(columns['UE_ID'], kind = 'stable')
+        UE_IDs, starts = np.unique(columns['UE_ID'][order], return_index = True)
+        for UE_ID, rows in zip(UE_IDs, np.split(start + order, starts[1:])):
+            self.UErows.setdefault(int(UE_ID), GrowingArray(np.int64)).append(rows)
+        self.UE_IDs = np.array(sorted(self.UErows), dtype = np.uint16)
+        self.meta['nRows'] += len(order)
+
+    def column(self, name):
+        return self.growing[name].values
+
+    def rowsOf(self, UE_ID):
+        rows = self.UErows.get(int(UE_ID))
+        return rows.values if rows is not None else np.zeros(0, dtype = np.int64)
+
+    def UEcolumn(self, name, UE_ID):
+        return self.column(name)[self.rowsOf(UE_ID)]
+
+    def frame(self, UE_IDs = None, rows = None):
+        if rows is None and UE_IDs is not None:
+            rows = np.concatenate([self.rowsOf(UE_ID) for UE_ID in np.atleast_1d(UE_IDs)] +
+                                  [np.zeros(0, dtype = np.int64)])
+        return super().frame(rows = rows)
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in [*self.growing.values(), *self.UErows.values()])
+
+
+class LiveRun:
+    # The dashboard data of a run whose simulation is still running (see RunData).
+    # update() follows rsrp_rsrq_trace.csv and out.txt from the byte offsets read so far
+    # and appends the new rows to the trace store, the map links and the handover
+    # windows without re-reading the files. The RRC events of the new log lines are
+    # recognized together with the last event of every UE, the only events new lines
+    # can still extend. Once the files stop growing the run is finished: `live` turns
+    # False and the dashboard replaces it with a RunData.
+    live = True
+
+    def __init__(self, outputDataPath, UEtrajectories, radioTowers, sliderStep):
+        self.outputDataPath = Path(outputDataPath)
+        self.UEtrajectories = UEtrajectories
+        self.radioTowers = radioTowers
+        self.sliderStep = sliderStep
+        self.reset()
+
+    def reset(self):
+        # Starts reading the run from the beginning of its files
+        self.live = True
+        self.recognizer = RRCEventRecognizer()
+        self.traceTail = FileTail(self.outputDataPath / 'rsrp_rsrq_trace.csv')
+        self.logTail = FileTail(self.outputDataPath / 'out.txt')
+        self.traceHeader = None
+        self.lastGrowth = time.time()
+
+        self.traceStore = LiveTraceStore()
+        self.traceTimes = GrowingArray(np.int32)
+        self.serving = {name : GrowingArray(dtype) for name, dtype in
+                        [('Times', np.int32), ('UEs', np.uint16), ('Lat', float), ('Lon', float)]}
+        self.servingLinks = ServingLinkFrames(
+            self.UEtrajectories, 0, self.sliderStep, frameTimes = np.zeros(0),
+            frameOffsets = np.zeros(1, dtype = np.int64), frameLat = np.zeros(0),
+            frameLon = np.zeros(0), traceTimes = self.traceTimes.values,
+            **{f'serving{name}' : values.values for name, values in self.serving.items()})
+
+        self.messageCodes = {}
+        self.log = {'Time(s)' : GrowingArray(np.float64), 'UE_ID' : GrowingArray(np.int32),
+                    'Message' : GrowingArray(np.int16), 'RecognizedMessage' : GrowingArray(object)}
+        self.openEvents = {}  # log row of the last event of every UE
+
+        self.HOtimes = GrowingArray(np.float64)
+        self.HOrows = GrowingArray(np.int64)
+        self.HOoffsets = GrowingArray(np.int64)
+        self.HOoffsets.append([0])
+        self.HOlogRows = set()  # log rows of the handovers that were windowed
+        self.changedUEs = set()  # UEs with new trace rows or events since the last refresh
+        self.signalBundles = LiveSignalBundleCache(self)
+        self.refresh()
+        self.update()
+
+    @property
+    def endTime(self):
+        # Simulation time covered by the trace so far [s]
+        traceTimes = self.traceTimes.values
+        return min(traceTimes[-1] / 1000 if len(traceTimes) else 0.0, self.UEtrajectories.endTime)
+
+    def update(self):
+        # Reads what the simulation wrote since the last update; True if there was any
+        if self.traceTail.replaced() or self.logTail.replaced():
+            self.reset()
+            return True
+        grew = False
+        while self.readTrace():
+            grew = True
+        logStart = len(self.log['Time(s)'])
+        while self.readLogs():
+            grew = True
+        if len(self.log['Time(s)']) > logStart:
+            self.recognizeEvents(logStart)
+
+        if grew:
+            self.lastGrowth = time.time()
+            self.addHandovers()
+            self.refresh()
+        elif time.time() - self.lastGrowth > liveIdleTime:
+            # Finished: no more trace will follow the last handovers
+            self.live = False
+            self.addHandovers(final = True)
+            self.refresh()
+        return grew
+
+    def refresh(self):
+        # Views of the grown data for the dashboard; the signal bundles of the UEs that
+        # changed are rebuilt on demand
+        self.HOdata = HOwindows(self.traceStore, self.HOtimes.values, self.HOrows.values,
+                                self.HOoffsets.values)
+        self.signalBundles.invalidate(self.changedUEs)
+        self.changedUEs = set()
+        recognized = pd.unique(self.log['RecognizedMessage'].values)
+        self.allMessageTypes = [message for message in recognized if pd.notna(message) and message]
+
+    def readTrace(self):
+        data = self.traceTail.read()
+        if self.traceHeader is None and data:
+            header, _, data = data.partition(b'\n')
+            self.traceHeader = header.decode().strip().split(',')
+        if not data:
+            return False
+
+        columns = compactTraceChunk(pd.read_csv(io.BytesIO(data), header = None,
+                                                names = self.traceHeader,
+                                                dtype = {'Status' : 'category'}))
+        self.traceStore.append(columns)
+        self.changedUEs.update(np.unique(columns['UE_ID']).tolist())
+
+        # Rows arrive in time order, so the map's time-sorted arrays only grow at the end
+        traceTimes = self.traceTimes.values
+        newTimes = np.unique(columns['time'])
+        self.traceTimes.append(newTimes[newTimes > traceTimes[-1]] if len(traceTimes)
+                               else newTimes)
+        serving = np.flatnonzero(columns['serving'])
+        lat, lon = ServingLinkFrames.towerCoordinates(self.radioTowers,
+                                                      columns['eNB_ID'][serving])
+        for name, values in [('Times', columns['time'][serving]),
+                             ('UEs', columns['UE_ID'][serving]), ('Lat', lat), ('Lon', lon)]:
+            self.serving[name].append(values)
+            setattr(self.servingLinks, f'serving{name}', self.serving[name].values)
+        self.servingLinks.traceTimes = self.traceTimes.values
+        return True
+
+    def readLogs(self):
+        data = self.logTail.read()
+        if not data:
+            return False
+        batch = parseLogChunk(data, self.messageCodes)
+        if batch is not None:
+            for name, values in batch.items():
+                self.log[name].append(values)
+            self.log['RecognizedMessage'].append(np.full(len(batch['Time(s)']), None))
+        return True
+
+    def recognizeEvents(self, start):
+        # Recognizes the events of the log rows from `start` on together with the last
+        # (possibly unfinished) event of every UE; earlier events are final, as the next
+        # message of their UE came more than the event gap later
+        UEs = self.log['UE_ID'].values
+        firstRow = min([start, *self.openEvents.values()])
+        rows = np.arange(firstRow, len(UEs))
+        openStart = np.full(UEs.max() + 1, start)
+        for UE_ID, row in self.openEvents.items():
+            openStart[UE_ID] = row
+        rows = rows[rows >= openStart[UEs[rows]]]
+
+        logs = self.logs.iloc[rows]
+        self.log['RecognizedMessage'].values[rows] = \
+            self.recognizer.recognize(logs).to_numpy()
+        self.changedUEs.update(np.unique(UEs[rows]).tolist())
+
+        # Last event of every UE in these rows (rows of a UE are in time order)
+        times = logs['Time(s)'].to_numpy()
+        order = np.argsort(UEs[rows], kind = 'stable')
+        newEvent = np.ones(len(order), dtype = bool)
+        newEvent[1:] = (np.diff(UEs[rows][order]) != 0) | \
+                       (np.diff(times[order]) > self.recognizer.gapThreshold)
+        for UE_ID, row in zip(UEs[rows][order][newEvent], rows[order][newEvent]):
+            self.openEvents[int(UE_ID)] = int(row)
+
+    def addHandovers(self, final = False):
+        # Windows of the handovers followed by HOsettleTime seconds of trace, or of all
+        # handovers once the trace is final
+        logs = self.logs
+        if not len(logs) or not len(self.traceTimes):
+            return
+        settled = np.inf if final else self.traceTimes.values[-1] / 1000 - HOsettleTime
+        times = logs['Time(s)'].to_numpy()
+        new = np.flatnonzero((logs['RecognizedMessage'] == 'Handover').to_numpy() &
+                             (times <= settled))
+        new = new[[row not in self.HOlogRows for row in new]]
+        self.HOlogRows.update(new.tolist())
+        if not len(new):
+            return
+
+        # Only the trace from HOsettleTime before the first new handover is indexed
+        firstRow = np.searchsorted(self.traceStore.column('time'),
+                                   np.floor((times[new].min() - HOsettleTime) * 1000))
+        rows = np.arange(firstRow, len(self.traceStore))
+        timeIndex = UETimeIndex(self.traceStore.frame(rows = rows))
+        HOtimes, lo, hi = HOwindowBounds(logs.iloc[new], timeIndex, window = HOsettleTime)
+        for HOtime, start, end in zip(HOtimes, lo, hi):
+            self.HOtimes.append([HOtime])
+            self.HOrows.append(rows[timeIndex.order[start:end]])
+            self.HOoffsets.append([len(self.HOrows)])
+
+    @property
+    def logs(self):
+        # Parsed logs with their RecognizedMessage column (see RunData.logs)
+        return pd.DataFrame({
+            'Time(s)' : self.log['Time(s)'].values,
+            'UE_ID' : self.log['UE_ID'].values,
+            'Message' : pd.Categorical.from_codes(self.log['Message'].values,
+                                                  list(self.messageCodes)),
+            'RecognizedMessage' : self.log['RecognizedMessage'].values
+        }, copy = False)
+
+    @property
+    def nbytes(self):
+        arrays = [self.traceTimes, *self.serving.values(), *self.log.values(), self.HOtimes,
+                  self.HOrows, self.HOoffsets]
+        return self.traceStore.nbytes + sum(values.nbytes for values in arrays) + \
+               self.signalBundles.nbytes
@@ -0,0 +1,239 @@
+import itertools
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+
+from .settings import simulatorCommand, sweepWorkers, sweepRunTimeout, sweepRetries
+
+sweepManifestVersion = 1
+
+# A sweep runs fairfield.cc once per point of a parameter grid. Every grid point is
+# one run of an episode (outputs/ep_X/run_Y) and outputs/ep_X/sweep.json records the
+# parameters, output directory and outcome of each run, so an interrupted sweep can be
+# resumed and the results can be matched to their parameters.
+
+
+def expandGrid(grid):
+    # {'Hysteresis' : [...], 'TimeToTrigger' : [...]} -> list of parameter dicts
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def pointKey(parameters):
+    # Identity of a parameter point, the same for 1 and 1.0
+    return json.dumps({name : float(value) for name, value in sorted(parameters.items())})
+
+
+def manifestFile(outputsDir, episode):
+    return Path(outputsDir) / f'ep_{episode}' / 'sweep.json'
+
+
+def readManifest(outputsDir, episode):
+    # Runs of the episode as {'run_Y' : record}; empty if it has no manifest yet
+    path = manifestFile(outputsDir, episode)
+    if not path.is_file():
+        return {}
+    with open(path) as fileIn:
+        return json.load(fileIn)['runs']
+
+
+def writeManifest(outputsDir, episode, runs):
+    path = manifestFile(outputsDir, episode)
+    path.parent.mkdir(parents = True, exist_ok = True)
+    tmpFile = path.with_name(path.name + '.tmp')
+    with open(tmpFile, 'w') as fileOut:
+        json.dump({'version' : sweepManifestVersion, 'episode' : episode, 'runs' : runs},
+                  fileOut, indent = 1)
+    os.replace(tmpFile, path)
+
+
+def runComplete(runDir):
+    return (Path(runDir) / 'out.txt').is_file() and \
+           (Path(runDir) / 'rsrp_rsrq_trace.csv').is_file()
+
+
+class SweepRunner:
+    # Runs the simulator for sweep points in a bounded pool. `command` is the simulator
+    # command line, run from `workDir` (fairfield.cc writes to outputs/ep_X/run_Y there)
+    # with --name=value appended for the parameters, the episode and the run ID.
+    # Its stdout and stderr (the ns-3 log) go to the run's out.txt. A run that fails,
+    # exits without a trace or exceeds `timeout` seconds is tried `retries` more times;
+    # a run stopped by abandon() or killAll() is not.
+    def __init__(self, command = simulatorCommand, workDir = '.', nWorkers = sweepWorkers,
+                 timeout = sweepRunTimeout, retries = sweepRetries):
+        self.command = list(command)
+        self.workDir = Path(workDir)
+        self.outputsDir = self.workDir / 'outputs'
+        self.nWorkers = nWorkers or os.cpu_count()
+        self.timeout = timeout
+        self.retries = retries
+        self.processes = {}  # running simulator processes by run directory
+        self.abandoned = set()  # run directories whose simulations were stopped early
+        self.stopping = False  # set by killAll(): no simulation is started any more
+        self.lock = threading.Lock()
+
+    def episodeDir(self, episode):
+        return self.outputsDir / f'ep_{episode}'
+
+    def runDir(self, episode, runID):
+        return self.episodeDir(episode) / f'run_{runID}'
+
+    def runSimulation(self, episode, runID, parameters):
+        # Runs one sweep point (with retries) and returns the outcome for the manifest
+        runDir = self.runDir(episode, runID)
+        runDir.mkdir(parents = True, exist_ok = True)
+        arguments = {**parameters, 'episode' : episode, 'runID' : runID}
+        commandLine = self.command + [f'--{name}={value}' for name, value in arguments.items()]
+
+        startTime = time.perf_counter()
+        returnCode = None
+        for attempt in range(1, self.retries + 2):
+            # Started under the lock, so killAll() either kills the process or keeps it
+            # from starting. A new session, so a timed out run is killed with all its
+            # children.
+            with self.lock:
+                if self.stopping:
+                    status = 'interrupted'
+                    break
+                with open(runDir / 'out.txt', 'w') as logFile:
+                    try:
+                        process = subprocess.Popen(commandLine, cwd = self.workDir,
+                                                   stdout = logFile, stderr = subprocess.STDOUT,
+                                                   start_new_session = True)
+                    except OSError as error:
+                        logFile.write(f'{commandLine}: {error}\n')
+                        return {'status' : 'failed', 'attempts' : attempt, 'returnCode' : None,
+                                'duration' : 0.0}
+                self.processes[runDir] = process
+            try:
+                returnCode = process.wait(timeout = self.timeout)
+                timedOut = False
+            except subprocess.TimeoutExpired:
+                self.kill(runDir)
+                returnCode = process.wait()
+                timedOut = True
+            finally:
+                with self.lock:
+                    self.processes.pop(runDir, None)
+
+            with self.lock:
+                abandoned = runDir in self.abandoned
+                stopping = self.stopping
+            if timedOut:
+                status = 'timeout'
+            elif returnCode == 0 and runComplete(runDir):
+                status = 'done'
+            elif abandoned:
+                status = 'abandoned'
+            elif stopping:
+                status = 'interrupted'
+            else:
+                status = 'failed'
+            if status in ('done', 'abandoned', 'interrupted'):
+                break
+
+        return {'status' : status, 'attempts' : attempt, 'returnCode' : returnCode,
+                'duration' : round(time.perf_counter() - startTime, 3)}
+
+    def kill(self, runDir):
+        with self.lock:
+            process = self.processes.get(runDir)
+        if process is not None and process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def abandon(self, runDir):
+        # Stops a run for good, without retrying it
+        with self.lock:
+            self.abandoned.add(runDir)
+        self.kill(runDir)
+
+    def killAll(self):
+        # Stops the running simulations without retrying them and starts no new ones
+        with self.lock:
+            self.stopping = True
+            runDirs = list(self.processes)
+        for runDir in runDirs:
+            self.kill(runDir)
+
+    def interrupt(self, futures, runs):
+        # Stops the runs of an interrupted sweep (futures of runSimulation by run name)
+        # and records their outcome in the manifest runs; runs that were not finished
+        # are left 'interrupted', so a resumed sweep runs them again
+        for future in futures:
+            future.cancel()
+        self.killAll()
+        wait(futures)
+        for future, runName in futures.items():
+            if not future.cancelled() and future.exception() is None:
+                runs[runName].update(future.result())
+        for record in runs.values():
+            if record['status'] in ('pending', 'running'):
+                record['status'] = 'interrupted'
+
+    def assignRuns(self, episode, points, runs):
+        # Run names of the parameter points: a point that is in the manifest keeps its
+        # run, new points get run IDs after every existing run of the episode (so runs
+        # not made by a sweep are never overwritten)
+        runNames = {pointKey(record['parameters']) : name for name, record in runs.items()}
+        existing = [int(p.name[4:]) for p in self.episodeDir(episode).glob('run_*')
+                    if p.name[4:].isdigit()]
+        existing += [int(name[4:]) for name in runs]
+        nextRunID = max(existing, default = -1) + 1
+
+        assigned = []
+        for parameters in points:
+            key = pointKey(parameters)
+            if key not in runNames:
+                runNames[key] = f'run_{nextRunID}'
+                nextRunID += 1
+            assigned.append(runNames[key])
+        return assigned
+
+    def run(self, episode, grid):
+        # Runs all points of `grid` (see expandGrid) as runs of `episode`, skipping the
+        # ones a previous sweep completed. Returns the manifest runs.
+        runs = readManifest(self.outputsDir, episode)
+        points = expandGrid(grid) if isinstance(grid, dict) else list(grid)
+        pending = []
+        for runName, parameters in zip(self.assignRuns(episode, points, runs), points):
+            runID = int(runName[4:])
+            record = runs.get(runName)
+            if record is not None and record['status'] == 'done' and \
+               runComplete(self.runDir(episode, runID)):
+                continue
+            runs[runName] = {'parameters' : parameters,
+                             'outputDir' : self.runDir(episode, runID).as_posix(),
+                             'status' : 'pending'}
+            pending.append((runID, parameters))
+        writeManifest(self.outputsDir, episode, runs)
+        print(f'Episode {episode}: {len(points)} sweep points, {len(pending)} to run, '
+              f'{len(points) - len(pending)} already done')
+
+        self.stopping = False
+        futures = {}  # run names by future
+        with ThreadPoolExecutor(max_workers = self.nWorkers) as executor:
+            try:
+                for runID, parameters in pending:
+                    future = executor.submit(self.runSimulation, episode, runID, parameters)
+                    futures[future] = f'run_{runID}'
+                for future in as_completed(futures):
+                    runName = futures[future]
+                    runs[runName].update(future.result())
+                    writeManifest(self.outputsDir, episode, runs)
+                    print(f'ep_{episode}/{runName} {runs[runName]["parameters"]}: '
+                          f'{runs[runName]["status"]} after {runs[runName]["attempts"]} '
+                          f'attempt(s), {runs[runName]["duration"]:.0f} s')
+            except BaseException:
+                # Interrupted: stop the queued and running simulations
+                self.interrupt(futures, runs)
+                writeManifest(self.outputsDir, episode, runs)
+                raise
+        return runs
@@ -0,0 +1,220 @@
+import re
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+from .visualizationHelp import readLogs, RRCEventRecognizer, TraceStoreTimeIndex, HOwindowBounds
+from .traceStore import loadTraceStore
+from .servingLinks import ServingLinkFrames
+from .signalBundles import SignalBundleCache, recognizedEvents
+from .sharedArrays import sourceSignature, materializeArrays
+
+runDataVersion = 1
+runCacheSize = 2 << 30  # memory budget of the runs loaded by the dashboard [bytes]
+runDirPattern = re.compile(r'ep_(\d+)/run_(\d+)$')
+
+
+def runKey(episode, runID):
+    return f'ep_{episode}/run_{runID}'
+
+
+def findRuns(outputsDir = 'outputs'):
+    # Keys ('ep_X/run_Y') of the simulation runs with a trace and logs, sorted by
+    # episode and run
+    runs = []
+    for runDir in Path(outputsDir).glob('ep_*/run_*'):
+        match = runDirPattern.search(runDir.as_posix())
+        hasTrace = (runDir / 'rsrp_rsrq_trace.csv').is_file() or \
+                   (runDir / 'rsrp_rsrq_trace' / 'meta.json').is_file()
+        if match and hasTrace and (runDir / 'out.txt').is_file():
+            runs.append((int(match[1]), int(match[2])))
+    return [runKey(*run) for run in sorted(runs)]
+
+
+class HOwindows:
+    # Trace slices around the recognized handovers of a run (see HOwindowBounds), as a
+    # sequence of (slice, HO time) built from the trace store on access
+    def __init__(self, traceStore, HOtimes, HOrows, HOoffsets):
+        self.traceStore = traceStore
+        self.HOtimes = HOtimes
+        self.HOrows = HOrows
+        self.HOoffsets = HOoffsets
+
+    def __len__(self):
+        return len(self.HOtimes)
+
+    def __getitem__(self, HO_ID):
+        rows = self.HOrows[self.HOoffsets[HO_ID]:self.HOoffsets[HO_ID + 1]]
+        return self.traceStore.frame(rows = rows), float(self.HOtimes[HO_ID])
+
+
+class RunData:
+    # Everything the dashboard shows of one simulation run. The data derived from the
+    # run directory is built once into <run>/dashboard/ and memory-mapped read-only,
+    # so all dashboard processes (gunicorn workers) share one copy of it. Runs that are
+    # still being written are shown by liveRun.LiveRun instead.
+    live = False
+
+    def __init__(self, outputDataPath, UEtrajectories, radioTowers, sliderStep):
+        self.outputDataPath = Path(outputDataPath)
+        self.endTime = UEtrajectories.endTime
+        self.traceStore = loadTraceStore(self.outputDataPath)
+
+        inputs = {
+            'version' : runDataVersion,
+            'trace' : self.traceStore.meta['source'],
+            'logs' : sourceSignature(self.outputDataPath / 'out.txt'),
+            'trajectories' : UEtrajectories.signature,
+            'radioTowers' : [radioTowers.index.tolist(),
+                             radioTowers[['lat', 'lon']].to_numpy().tolist()],
+            'sliderStep' : sliderStep
+        }
+        build = lambda: self.build(UEtrajectories, radioTowers, sliderStep)
+        self.arrays, self.meta = materializeArrays(self.outputDataPath / 'dashboard', inputs, build)
+        arrays = self.arrays
+
+        self.allMessageTypes = self.meta['allMessageTypes']
+        self.HOdata = HOwindows(self.traceStore, arrays['HOtimes'], arrays['HOrows'],
+                                arrays['HOoffsets'])
+
+        # UE - serving eNB lines for the map at every slider position
+        self.servingLinks = ServingLinkFrames(
+            UEtrajectories, 0, sliderStep,
+            **{name : arrays[f'links_{name}'] for name in ServingLinkFrames.arrayNames})
+
+        # Per-UE series of the signal strength graph, built on the first click on a UE
+        events = pd.DataFrame({
+            'UE_ID' : arrays['eventUE'],
+            'Time(s)' : arrays['eventTime'],
+            'RecognizedMessage' : pd.Categorical.from_codes(arrays['eventMessage'],
+                                                            self.meta['recognizedMessages'])
+        }, copy = False)
+        self.signalBundles = SignalBundleCache(self.traceStore, events)
+
+    def build(self, UEtrajectories, radioTowers, sliderStep):
+        # Parses the logs, extracts the handover windows and precomputes the map links
+        logs = readLogs(self.outputDataPath / 'out.txt')
+        logs['RecognizedMessage'] = pd.Categorical(RRCEventRecognizer().recognize(logs))
+        recognized = logs['RecognizedMessage'].cat
+
+        timeIndex = TraceStoreTimeIndex(self.traceStore)
+        HOtimes, lo, hi = HOwindowBounds(logs, timeIndex)
+        HOrows = [timeIndex.rows(lo[i], hi[i]) for i in range(len(HOtimes))]
+        events = recognizedEvents(logs)
+        links = ServingLinkFrames.build(self.traceStore, UEtrajectories, radioTowers,
+                                        0, sliderStep)
+
+        arrays = {
+            'logTime' : logs['Time(s)'].to_numpy(),
+            'logUE' : logs['UE_ID'].to_numpy(),
+            'logMessage' : logs['Message'].cat.codes.to_numpy(),
+            'logRecognized' : recognized.codes.to_numpy(),
+            'HOtimes' : HOtimes,
+            'HOrows' : np.concatenate(HOrows + [np.zeros(0, dtype = np.int64)]),
+            'HOoffsets' : np.concatenate(([0], np.cumsum([len(rows) for rows in HOrows]))),
+            'eventUE' : events['UE_ID'].to_numpy(),
+            'eventTime' : events['Time(s)'].to_numpy(),
+            'eventMessage' : events['RecognizedMessage'].cat.codes.to_numpy(),
+            **{f'links_{name}' : array for name, array in links.arrays.items()}
+        }
+        meta = {
+            'messages' : logs['Message'].cat.categories.tolist(),
+            'recognizedMessages' : recognized.categories.tolist(),
+            'allMessageTypes' : [msg for msg in logs['RecognizedMessage'].unique()
+                                 if pd.notna(msg) and msg]
+        }
+        return arrays, meta
+
+    @property
+    def logs(self):
+        # Parsed logs with their RecognizedMessage column (None where a message is part
+        # of a recognized event), as a frame over the memory-mapped arrays
+        return pd.DataFrame({
+            'Time(s)' : self.arrays['logTime'],
+            'UE_ID' : self.arrays['logUE'],
+            'Message' : pd.Categorical.from_codes(self.arrays['logMessage'],
+                                                  self.meta['messages']),
+            'RecognizedMessage' : pd.Categorical.from_codes(self.arrays['logRecognized'],
+                                                            self.meta['recognizedMessages'])
+        }, copy = False)
+
+    @property
+    def nbytes(self):
+        # Memory held by the run, counting the memory-mapped arrays (shared between
+        # processes) as well; the memory-mapped trace store is not counted
+        return sum(array.nbytes for array in self.arrays.values()) + self.signalBundles.nbytes
+
+
+class RunCache:
+    # Runs loaded on demand and kept in least recently used order. Runs are evicted
+    # once their total size exceeds `memoryBudget` bytes (the most recent run is
+    # always kept). Sizes are re-evaluated on every access, as the signal bundle
+    # caches of the runs grow while they are browsed. The dashboard serves callbacks
+    # on several threads: the cache itself is guarded by a lock, runs are loaded
+    # outside of it, and callbacks asking for a run that is being loaded wait for that
+    # load instead of starting another one.
+    def __init__(self, loadRun, memoryBudget = runCacheSize):
+        self.loadRun = loadRun
+        self.memoryBudget = memoryBudget
+        self.runs = OrderedDict()
+        self.loading = {}  # futures of the runs being loaded by key
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.runs:
+                self.hits += 1
+                self.runs.move_to_end(key)
+                self.evict()
+                return self.runs[key]
+            loading = self.loading.get(key)
+            loads = loading is None
+            if loads:
+                self.misses += 1
+                loading = self.loading[key] = Future()
+        if not loads:
+            return loading.result()
+
+        try:
+            run = self.loadRun(key)
+        except BaseException as error:
+            with self.lock:
+                del self.loading[key]
+            loading.set_exception(error)
+            raise
+        self.put(key, run)
+        loading.set_result(run)
+        return run
+
+    def put(self, key, run):
+        # Caches a loaded run as the most recently used one, replacing a cached run
+        with self.lock:
+            self.loading.pop(key, None)
+            self.runs[key] = run
+            self.runs.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        # Called with the lock held
+        while self.runsNbytes() > self.memoryBudget and len(self.runs) > 1:
+            self.runs.popitem(last = False)
+            self.evictions += 1
+
+    def runsNbytes(self):
+        return sum(run.nbytes for run in self.runs.values())
+
+    @property
+    def nbytes(self):
+        with self.lock:
+            return self.runsNbytes()
+
+    def stats(self):
+        with self.lock:
+            return {'runs' : list(self.runs), 'nbytes' : self.runsNbytes(), 'hits' : self.hits,
+                    'misses' : self.misses, 'evictions' : self.evictions}
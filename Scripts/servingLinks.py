@@ -0,0 +1,105 @@
+import numpy as np
+
+
+class ServingLinkFrames:
+    # Lines between every UE and its serving eNB, as drawn on the network map. The
+    # serving rows of the trace are kept sorted by time so the links at any time are
+    # a searchsorted away, and the links at every slider position are precomputed into
+    # flat lat/lon arrays: the links of frame k are [frameOffsets[k]:frameOffsets[k + 1]],
+    # with NaN separating consecutive lines.
+    arrayNames = ['traceTimes', 'servingTimes', 'servingUEs', 'servingLat', 'servingLon',
+                  'frameTimes', 'frameOffsets', 'frameLat', 'frameLon']
+
+    def __init__(self, UEtrajectories, frameStart, frameStep, **arrays):
+        self.UEtrajectories = UEtrajectories
+        self.frameStart = frameStart
+        self.frameStep = frameStep
+        for name in self.arrayNames:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, traceStore, UEtrajectories, radioTowers, frameStart, frameStep):
+        # Trace sample times (of all rows), as the map uses the sample closest in time
+        traceTimes = np.unique(traceStore.column('time'))
+
+        serving = np.flatnonzero(traceStore.column('serving'))
+        servingTimes = traceStore.column('time')[serving]
+        order = np.argsort(servingTimes, kind = 'stable')
+        servingUEs = traceStore.column('UE_ID')[serving][order]
+        servingLat, servingLon = cls.towerCoordinates(
+            radioTowers, traceStore.column('eNB_ID')[serving][order])
+
+        links = cls(UEtrajectories, frameStart, frameStep,
+                    traceTimes = traceTimes,
+                    servingTimes = servingTimes[order],
+                    servingUEs = servingUEs,
+                    servingLat = servingLat,
+                    servingLon = servingLon,
+                    frameTimes = np.zeros(0),
+                    frameOffsets = np.zeros(1, dtype = np.int64),
+                    frameLat = np.zeros(0),
+                    frameLon = np.zeros(0))
+
+        frameTimes = np.arange(frameStart, UEtrajectories.endTime + frameStep / 2, frameStep)
+        frames = [links.linksAt(t) for t in frameTimes]
+        links.frameTimes = frameTimes
+        links.frameOffsets = np.concatenate(([0], np.cumsum([len(lat) for lat, _ in frames])))
+        links.frameLat = np.concatenate([lat for lat, _ in frames])
+        links.frameLon = np.concatenate([lon for _, lon in frames])
+        return links
+
+    @staticmethod
+    def towerCoordinates(radioTowers, eNB_IDs):
+        # Tower (lat, lon) of every eNB ID; NaN for eNBs missing from the topology, whose
+        # links are dropped
+        towers = np.asarray(radioTowers.index)
+        eNB_IDs = np.asarray(eNB_IDs).astype(np.int64)
+        eNB_IDs[np.isin(eNB_IDs, towers, invert = True)] = -1
+        towerLat = np.full(max(towers.max(), 0) + 2, np.nan)
+        towerLon = towerLat.copy()
+        towerLat[towers] = radioTowers['lat'].to_numpy(dtype = float)
+        towerLon[towers] = radioTowers['lon'].to_numpy(dtype = float)
+        return towerLat[eNB_IDs], towerLon[eNB_IDs]
+
+    @property
+    def arrays(self):
+        return {name : getattr(self, name) for name in self.arrayNames}
+
+    def closestSamples(self, t):
+        # Range of serving rows at the trace sample time(s) closest to t
+        if not len(self.traceTimes):
+            return 0, 0
+        position = np.searchsorted(self.traceTimes, t * 1000)
+        candidates = self.traceTimes[max(position - 1, 0):position + 1]
+        distances = np.abs(candidates / 1000 - t)
+        closest = candidates[distances == distances.min()]
+        return np.searchsorted(self.servingTimes, closest[0]), \
+               np.searchsorted(self.servingTimes, closest[-1], side = 'right')
+
+    def linksAt(self, t):
+        # Link coordinates of the UEs located at time t, ordered by UE
+        positions = self.UEtrajectories.positionsAt(t)
+        lo, hi = self.closestSamples(t)
+        rows = lo + np.argsort(self.servingUEs[lo:hi], kind = 'stable')
+
+        UEs = positions['UE_ID'].to_numpy()
+        if len(UEs) == 0:
+            return np.zeros(0), np.zeros(0)
+        UEposition = np.minimum(np.searchsorted(UEs, self.servingUEs[rows]), len(UEs) - 1)
+        located = (UEs[UEposition] == self.servingUEs[rows]) & np.isfinite(self.servingLat[rows])
+        rows, UEposition = rows[located], UEposition[located]
+
+        separators = np.full(len(rows), np.nan)
+        lat = np.column_stack((self.servingLat[rows],
+                               positions['lat'].to_numpy()[UEposition], separators))
+        lon = np.column_stack((self.servingLon[rows],
+                               positions['lon'].to_numpy()[UEposition], separators))
+        return lat.ravel(), lon.ravel()
+
+    def at(self, t):
+        # Precomputed links for slider positions, computed on the fly for other times
+        frame = int(round((t - self.frameStart) / self.frameStep))
+        if 0 <= frame < len(self.frameTimes) and self.frameTimes[frame] == t:
+            links = slice(self.frameOffsets[frame], self.frameOffsets[frame + 1])
+            return self.frameLat[links], self.frameLon[links]
+        return self.linksAt(t)
@@ -1,12 +1,65 @@
 nUEs = 15
 nMinutes = 20
 UeMeasurementsFilterPeriod = 100 # ms
+randomSeed = 34                  # Seed for the per-UE random streams
+exportUElocationsCSV = True      # Also write UE_locations.csv next to the binary
+                                 # trajectory store
 
 # Settings for UEpaths
 minTravelDist = 5000             # Minimum Cartesian distance between start
                                  # and end points for purposes of UE routing
+targetAreaRadius = 500           # Radius around the target site in which
+                                 # routes towards the target end [m]
+nWorkers = None                  # Processes used to generate UE routes
+                                 # (None uses all cores, 1 disables the pool)
+useLegLibrary = False            # Assemble UE routes from a precomputed library of
+                                 # boundary <-> target area legs
+nLibraryBoundaryNodes = 200      # Boundary points drawn for the leg library
+nLibraryTargetNodes = 50         # Target area nodes in the leg library
 
 # Building parameters
 nBuildings = 20
 buildingMinSize = 25
 buildingMaxSize = 50
+
+# Settings for parameter sweeps (RunSweep.py)
+simulatorCommand = ['../../ns3', 'run', '--no-build', 'fairfield', '--']
+                                 # Runs fairfield.cc from this directory; the run
+                                 # parameters are appended as --name=value
+sweepHysteresis = [0.5, 1, 2, 3, 4.5]      # A3 hysteresis values [dB]
+sweepTimeToTrigger = [40, 100, 256, 480]   # A3 time to trigger values [ms]
+sweepWorkers = None              # Simulations run at the same time (None uses all cores)
+sweepRunTimeout = 4 * 3600       # Wall-clock limit of a single simulation [s]
+sweepRetries = 1                 # Extra attempts of a failed or timed out simulation
+
+# Settings for handover KPIs (AggregateKPIs.py)
+kpiPingPongTime = 1.0            # A handover back to the previous cell within this
+                                 # time is a ping-pong [s]
+kpiRSRPthreshold = -110          # Serving RSRP below this counts as poor coverage [dBm]
+kpiHOwindow = 5                  # Time around a handover searched for the RSRP
+                                 # crossing of its source and target cells [s]
+kpiWorkers = None                # Processes computing run KPIs (None uses all cores)
+
+# Settings for the offline A3 handover replay (ReplayA3.py)
+replayFilterCoefficient = 4      # RRC layer 3 filter coefficient of the UEs (ns-3 default)
+replayTolerance = 1.0            # Largest time difference of a replayed handover that
+                                 # matches a simulated one [s]
+replayHysteresis = [h / 2 for h in range(13)]
+                                 # Screened A3 hysteresis values [dB]
+replayTimeToTrigger = [0, 40, 64, 80, 100, 128, 160, 256, 320, 480, 512, 640, 1024, 1280,
+                       2560, 5120]
+                                 # Screened time to trigger values [ms]
+
+# Settings for adaptive sweeps (RunAdaptiveSweep.py)
+adaptiveHysteresis = [h / 2 for h in range(13)]
+                                 # Candidate A3 hysteresis values [dB]
+adaptiveTimeToTrigger = [0, 40, 64, 80, 100, 128, 160, 256, 320, 480, 512, 640, 1024, 1280]
+                                 # Candidate time to trigger values [ms]
+adaptiveRuns = 32                # Simulations started by one adaptive sweep
+adaptiveObjectives = ['HOrate', 'pingPongRatio', 'fractionBelowThreshold']
+                                 # Run KPIs that are minimized
+adaptiveRungs = [150, 300, 600]  # Simulated times at which running simulations are
+                                 # compared with the others at that time [s]
+adaptiveReduction = 2            # Only the best 1/adaptiveReduction of the runs that
+                                 # reached a rung continue past it
+adaptivePollInterval = 10        # Time between checks of the running simulations [s]
@@ -0,0 +1,79 @@
+import fcntl
+import json
+import os
+import shutil
+import numpy as np
+from contextlib import contextmanager
+from pathlib import Path
+
+# Arrays that several processes (e.g. the gunicorn workers of the dashboard) need are
+# written once to .npy files and memory-mapped read-only by every process, so they
+# share a single copy in the page cache instead of each building its own.
+
+
+def sourceSignature(sourceFile):
+    stat = Path(sourceFile).stat()
+    return {'size' : stat.st_size, 'mtime_ns' : stat.st_mtime_ns}
+
+
+@contextmanager
+def directoryLock(storeDir):
+    # Exclusive lock on `storeDir` (held through a sibling .lock file), so only one
+    # process builds it while the others wait and then use the result
+    storeDir = Path(storeDir)
+    storeDir.parent.mkdir(parents = True, exist_ok = True)
+    with open(storeDir.with_name(storeDir.name + '.lock'), 'w') as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+
+def readMeta(storeDir):
+    metaFile = Path(storeDir) / 'meta.json'
+    if not metaFile.is_file():
+        return None
+    with open(metaFile) as fileIn:
+        return json.load(fileIn)
+
+
+def writeArrays(storeDir, arrays, meta):
+    storeDir = Path(storeDir)
+    tmpDir = storeDir.with_name(storeDir.name + '.tmp')
+    shutil.rmtree(tmpDir, ignore_errors = True)
+    tmpDir.mkdir(parents = True)
+
+    for name, array in arrays.items():
+        np.save(tmpDir / f'{name}.npy', array)
+    with open(tmpDir / 'meta.json', 'w') as fileOut:
+        json.dump({**meta, 'arrays' : list(arrays)}, fileOut)
+
+    shutil.rmtree(storeDir, ignore_errors = True)
+    os.replace(tmpDir, storeDir)
+
+
+def openArrays(storeDir):
+    # Read-only memory maps of the arrays in storeDir and its metadata
+    meta = readMeta(storeDir)
+    arrays = {name : np.load(Path(storeDir) / f'{name}.npy', mmap_mode = 'r')
+              for name in meta['arrays']}
+    return arrays, meta
+
+
+def arraysUpToDate(storeDir, inputs):
+    # Whether storeDir holds arrays built from `inputs` (a JSON serializable description
+    # of everything they depend on)
+    meta = readMeta(storeDir)
+    return meta is not None and meta.get('inputs') == json.loads(json.dumps(inputs))
+
+
+def materializeArrays(storeDir, inputs, build):
+    # Memory-maps the arrays in storeDir, first building them with build() -> (arrays,
+    # meta) if they are missing or were built from different `inputs`
+    if not arraysUpToDate(storeDir, inputs):
+        with directoryLock(storeDir):
+            if not arraysUpToDate(storeDir, inputs):
+                arrays, meta = build()
+                writeArrays(storeDir, arrays, {**meta, 'inputs' : json.loads(json.dumps(inputs))})
+    return openArrays(storeDir)
@@ -0,0 +1,150 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from .downsampling import SeriesPyramid
+from .traceStore import cellIDs
+
+signalBundleCacheSize = 256 << 20  # memory budget of the per-UE signal bundles [bytes]
+
+
+def strongestPerTime(groups, times, RSRP):
+    # Positions of the strongest row per (group, time), sorted by group and time
+    order = np.lexsort((RSRP, times, groups))
+    last = np.ones(len(order), dtype = bool)
+    last[:-1] = (groups[order][1:] != groups[order][:-1]) | (times[order][1:] != times[order][:-1])
+    return order[last]
+
+
+class SignalBundle:
+    # Everything the signal strength graph of one UE shows: the RSRP series of every
+    # eNB it measured (one sample per time, the strongest), the serving RSRP/RSRQ
+    # series, the RSRP bounds of its serving cells and the times of its RRC events.
+    # Every series has a SeriesPyramid for drawing it at a bounded number of points.
+    def __init__(self, traceStore, UElogs, UE_ID):
+        self.UE_ID = UE_ID
+        times = traceStore.UEcolumn('time', UE_ID) / 1000
+        eNBs = cellIDs(traceStore.UEcolumn('eNB_ID', UE_ID))
+        serving = traceStore.UEcolumn('serving', UE_ID).astype(bool)
+        RSRP = traceStore.UEcolumn('RSRP', UE_ID)
+        RSRQ = traceStore.UEcolumn('RSRQ', UE_ID)
+
+        rows = strongestPerTime(eNBs, times, RSRP)
+        self.eNB_IDs, starts = np.unique(eNBs[rows], return_index = True)
+        self.eNBoffsets = np.append(starts, len(rows))
+        self.eNBtimes = times[rows]
+        self.eNB_RSRP = RSRP[rows]
+        self.servingENBs = np.unique(eNBs[serving])
+        self.isServingCell = np.isin(self.eNB_IDs, self.servingENBs)
+
+        servingRows = np.flatnonzero(serving)
+        servingRows = servingRows[strongestPerTime(np.zeros(len(servingRows), dtype = np.int8),
+                                                   times[servingRows], RSRP[servingRows])]
+        self.servingTimes = times[servingRows]
+        self.servingRSRP = RSRP[servingRows]
+        self.servingRSRQ = RSRQ[servingRows]
+
+        servingCellRSRP = RSRP[np.isin(eNBs, self.servingENBs)]
+        if len(servingCellRSRP):
+            self.bounds = [float(servingCellRSRP.min()) - 2, float(servingCellRSRP.max()) + 2]
+        else:
+            self.bounds = [np.nan, np.nan]
+
+        self.RRCtimes = {message : group['Time(s)'].to_numpy()
+                         for message, group in UElogs.groupby('RecognizedMessage', sort = False,
+                                                              observed = True)}
+
+        # Samples around serving cell changes and recognized handovers are kept at every
+        # level, so the handover crossings stay visible in downsampled views
+        servingENBs = eNBs[servingRows]
+        keepTimes = np.concatenate((self.servingTimes[1:][servingENBs[1:] != servingENBs[:-1]],
+                                    self.RRCtimes.get('Handover', [])))
+        def pyramid(x, y):
+            position = np.searchsorted(x, keepTimes)
+            keep = np.clip(np.concatenate((position - 1, position)), 0, max(len(x) - 1, 0))
+            return SeriesPyramid(x, y, keep if len(x) else None)
+
+        self.eNBpyramids = [pyramid(times, RSRP) for _, times, RSRP, _ in self.eNBseries()]
+        self.servingRSRQpyramid = pyramid(self.servingTimes, self.servingRSRQ)
+        self.servingRSRPpyramid = pyramid(self.servingTimes, self.servingRSRP)
+
+    @property
+    def nbytes(self):
+        arrays = [self.eNB_IDs, self.eNBoffsets, self.eNBtimes, self.eNB_RSRP, self.servingENBs,
+                  self.isServingCell, self.servingTimes, self.servingRSRP, self.servingRSRQ,
+                  *self.RRCtimes.values()]
+        pyramids = [*self.eNBpyramids, self.servingRSRQpyramid, self.servingRSRPpyramid]
+        return sum(array.nbytes for array in arrays) + sum(p.nbytes for p in pyramids)
+
+    def eNBseries(self):
+        # (eNB ID, times, RSRP, is a serving cell) for every measured eNB, by eNB ID
+        for i, eNB_ID in enumerate(self.eNB_IDs):
+            samples = slice(self.eNBoffsets[i], self.eNBoffsets[i + 1])
+            yield eNB_ID, self.eNBtimes[samples], self.eNB_RSRP[samples], self.isServingCell[i]
+
+    def view(self, startTime, endTime, maxPoints):
+        # (times, values) of the eNB RSRP series, the serving RSRQ and the serving RSRP
+        # series in [startTime, endTime], each with at most about maxPoints samples
+        pyramids = [*self.eNBpyramids, self.servingRSRQpyramid, self.servingRSRPpyramid]
+        return [p.select(startTime, endTime, maxPoints) for p in pyramids]
+
+
+def recognizedEvents(logs):
+    # The log rows with a RecognizedMessage, sorted by UE (in log order per UE)
+    events = logs.loc[logs['RecognizedMessage'].notna() & (logs['RecognizedMessage'] != ''),
+                      ['UE_ID', 'Time(s)', 'RecognizedMessage']]
+    return events.iloc[np.argsort(events['UE_ID'].to_numpy(), kind = 'stable')]
+
+
+class SignalBundleCache:
+    # Least recently used cache of SignalBundles, evicting bundles once their total
+    # size exceeds `memoryBudget` bytes (the most recent bundle is always kept).
+    # `events` are the recognized events grouped by UE (see recognizedEvents), so
+    # building a bundle does not scan all logs. Accesses hold a lock, as dashboard
+    # callbacks run on several threads.
+    def __init__(self, traceStore, events, memoryBudget = signalBundleCacheSize):
+        self.traceStore = traceStore
+        self.memoryBudget = memoryBudget
+        self.bundles = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.eventUEs = events['UE_ID'].to_numpy()
+        self.events = events
+
+    def UElogs(self, UE_ID):
+        lo, hi = np.searchsorted(self.eventUEs, [UE_ID, UE_ID + 1])
+        return self.events.iloc[lo:hi]
+
+    def get(self, UE_ID):
+        with self.lock:
+            if UE_ID in self.bundles:
+                self.hits += 1
+                self.bundles.move_to_end(UE_ID)
+                return self.bundles[UE_ID]
+
+            self.misses += 1
+            bundle = SignalBundle(self.traceStore, self.UElogs(UE_ID), UE_ID)
+            self.bundles[UE_ID] = bundle
+            self.nbytes += bundle.nbytes
+            while self.nbytes > self.memoryBudget and len(self.bundles) > 1:
+                _, evicted = self.bundles.popitem(last = False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+            return bundle
+
+    def invalidate(self, UE_IDs):
+        # Drops the bundles of UEs whose trace or events changed
+        with self.lock:
+            for UE_ID in UE_IDs:
+                bundle = self.bundles.pop(UE_ID, None)
+                if bundle is not None:
+                    self.nbytes -= bundle.nbytes
+
+    def stats(self):
+        with self.lock:
+            return {'bundles' : len(self.bundles), 'nbytes' : self.nbytes, 'hits' : self.hits,
+                    'misses' : self.misses, 'evictions' : self.evictions}
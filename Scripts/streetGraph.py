@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+# Number of source nodes whose shortest path trees are computed at once
+shortestPathBatchSize = 256
+
+
+class StreetGraph:
+    # Compressed sparse row (CSR) representation of the street network. Nodes are
+    # addressed by their position in `nodeIds`; the outgoing edges of node i are
+    # indices[indptr[i]:indptr[i + 1]]. Parallel edges are collapsed once: an edge
+    # carries the minimum travel time and length over all parallel edges and the
+    # geometry of the parallel edge with the lowest key.
+    def __init__(self, nodes, edges):
+        self.nodeIds = nodes.index.to_numpy()
+        self.nodeIndex = pd.Index(self.nodeIds)
+        self.x = nodes['x'].to_numpy(dtype = float)
+        self.y = nodes['y'].to_numpy(dtype = float)
+        nNodes = len(self.nodeIds)
+
+        u = self.nodeIndex.get_indexer(edges.index.get_level_values('u'))
+        v = self.nodeIndex.get_indexer(edges.index.get_level_values('v'))
+        keys = edges.index.get_level_values('key').to_numpy()
+        if 'travel_time' in edges:
+            travelTime = edges['travel_time'].fillna(1).to_numpy(dtype = float)
+        else:
+            travelTime = np.ones(len(edges))
+        length = shapely.length(edges.geometry.values)
+
+        # Sort by (u, v, key) and keep one entry per (u, v) pair
+        order = np.lexsort((keys, v, u))
+        pairKeys = u[order].astype(np.int64) * nNodes + v[order]
+        self.pairKeys, groupStarts = np.unique(pairKeys, return_index = True)
+
+        self.indices = v[order][groupStarts].astype(np.int32)
+        self.indptr = np.searchsorted(self.pairKeys // nNodes, np.arange(nNodes + 1)) \
+                        .astype(np.int32)
+        self.travelTime = np.minimum.reduceat(travelTime[order], groupStarts)
+        self.length = np.minimum.reduceat(length[order], groupStarts)
+        self.edgeRows = order[groupStarts]
+        self.geometry = edges.geometry.values[self.edgeRows]
+
+        _, self.geometryCoords, (self.geometryOffsets,) = \
+            shapely.to_ragged_array(self.geometry)
+
+        self.matrix = csr_matrix((self.travelTime, self.indices, self.indptr),
+                                 shape = (nNodes, nNodes))
+
+        # Typical speed along the edges (straight-line distance per travel time), used
+        # to bound single shortest path searches
+        self.edgeSources = np.repeat(np.arange(nNodes, dtype = np.int32), np.diff(self.indptr))
+        straightLength = np.hypot(self.x[self.indices] - self.x[self.edgeSources],
+                                  self.y[self.indices] - self.y[self.edgeSources])
+        moving = (straightLength > 0) & (self.travelTime > 0)
+        self.typicalSpeed = np.median(straightLength[moving] / self.travelTime[moving]) \
+                            if moving.any() else 1.0
+        self.typicalTravelTime = np.median(self.travelTime[self.travelTime > 0]) \
+                                 if (self.travelTime > 0).any() else 1.0
+
+        # Spatial index over the node coordinates and cached "nodes within R of a
+        # point" candidate sets
+        self.tree = cKDTree(np.column_stack((self.x, self.y)))
+        self._nodesWithin = {}
+
+    def __len__(self):
+        return len(self.nodeIds)
+
+    def toIndex(self, nodeIds):
+        return self.nodeIndex.get_indexer(nodeIds)
+
+    def toNodeIds(self, nodeIndices):
+        return self.nodeIds[nodeIndices]
+
+    def nearestNodes(self, x, y):
+        # Indices of the nodes closest to each of the points (x[i], y[i])
+        _, nearest = self.tree.query(np.column_stack((np.ravel(x), np.ravel(y))))
+        return nearest
+
+    def nodesWithin(self, point, radius):
+        # Sorted indices of the nodes at most `radius` away from `point`
+        key = (*map(float, point), float(radius))
+        if key not in self._nodesWithin:
+            candidates = np.sort(self.tree.query_ball_point(key[:2], radius))
+            self._nodesWithin[key] = candidates.astype(np.int64)
+        return self._nodesWithin[key]
+
+    def edgeIndex(self, u, v):
+        # Positions of the edges (u[i], v[i]) in the edge arrays; -1 if an edge is missing
+        pairKeys = np.asarray(u, dtype = np.int64) * len(self) + np.asarray(v)
+        position = np.searchsorted(self.pairKeys, pairKeys)
+        position = np.minimum(position, len(self.pairKeys) - 1)
+        return np.where(self.pairKeys[position] == pairKeys, position, -1)
+
+    def routeEdges(self, route):
+        route = np.asarray(route)
+        return self.edgeIndex(route[:-1], route[1:])
+
+    def routeTravelTime(self, route):
+        return self.travelTime[self.routeEdges(route)].sum()
+
+    def shortestPathTrees(self, sources):
+        # Travel times and predecessors from every source to all nodes
+        return dijkstra(self.matrix, indices = sources, return_predecessors = True)
+
+    def shortestPaths(self, sources, targets):
+        # Batched one-to-one queries; returns a list with the node indices of each
+        # shortest path, or None where the target cannot be reached. Queries sharing a
+        # source share its shortest path tree, so one-to-many queries cost a single run.
+        sources = np.asarray(sources)
+        targets = np.asarray(targets)
+        uniqueSources, sourceGroups = np.unique(sources, return_inverse = True)
+
+        paths = [None] * len(sources)
+        for batchStart in range(0, len(uniqueSources), shortestPathBatchSize):
+            batch = uniqueSources[batchStart:batchStart + shortestPathBatchSize]
+            distances, predecessors = self.shortestPathTrees(batch)
+
+            for query in np.flatnonzero((sourceGroups >= batchStart) &
+                                        (sourceGroups < batchStart + len(batch))):
+                row = sourceGroups[query] - batchStart
+                if np.isfinite(distances[row, targets[query]]):
+                    paths[query] = self.tracePath(predecessors[row], targets[query])
+
+        return paths
+
+    def shortestPath(self, source, target):
+        # Single query: searches only the nodes closer (in travel time) to the source
+        # than a limit instead of computing the whole shortest path tree. The limit
+        # starts at 1.5 times the straight-line distance at the typical speed (streets
+        # are rarely straight) and grows by half until the target is reached.
+        # None if the target cannot be reached.
+        limit = 1.5 * np.hypot(self.x[target] - self.x[source],
+                               self.y[target] - self.y[source]) / self.typicalSpeed
+        limit = max(limit, self.typicalTravelTime)
+        while True:
+            distances, predecessors = dijkstra(self.matrix, indices = source, limit = limit,
+                                               return_predecessors = True)
+            if np.isfinite(distances[target]):
+                return self.tracePath(predecessors, target)
+            # Unreachable once no edge leads out of the searched nodes
+            reached = np.isfinite(distances)
+            if not (reached[self.edgeSources] & ~reached[self.indices]).any():
+                return None
+            limit *= 1.5
+
+    @staticmethod
+    def tracePath(predecessors, target):
+        path = [target]
+        while predecessors[path[-1]] >= 0:
+            path.append(predecessors[path[-1]])
+        return path[::-1]
@@ -1,10 +1,22 @@
+import hashlib
+import json
+import os
+import geopandas as gpd
+import numpy as np
 import osmnx as ox
+import pandas as pd
 import pyproj
+import shapely
 from pathlib import Path
+from .streetGraph import StreetGraph
 
 # Name of the street network file
 roadNetworkFile = Path('inputData/roadNetwork.graphml')
 
+# Directory holding the projected street networks, keyed on their inputs
+streetNetworkCacheDir = Path('inputData/cache')
+streetNetworkCacheVersion = 2
+
 # Bounding box for the target region
 boundingBox = [-95.826972, 29.963325, -95.657067, 30.082114]
 
@@ -41,22 +53,136 @@ def fetchStreetNetwork():
     return ox.io.load_graphml(roadNetworkFile)
 
 
-class StreetNetwork:
-    def __init__(self):
-        oxgraph = fetchStreetNetwork()
+def streetNetworkCacheKey(projectionMap):
+    # Content hash of everything the projected network depends on
+    key = hashlib.sha256()
+    with open(roadNetworkFile, 'rb') as fileIn:
+        for block in iter(lambda: fileIn.read(1 << 20), b''):
+            key.update(block)
+    key.update(json.dumps({
+        'version' : streetNetworkCacheVersion,
+        'boundingBox' : boundingBox,
+        'projection' : projectionMap.srs
+    }).encode())
+    return key.hexdigest()[:20]
+
+
+def encodeObjectColumn(values):
+    # Object columns (OSM tags that are strings, lists of strings or NaN) are stored as
+    # JSON text, so the cache is read without unpickling anything
+    return np.array([json.dumps(value, default = lambda v: np.asarray(v).tolist())
+                     for value in values], dtype = str)
+
+
+def decodeObjectColumn(texts):
+    values = np.empty(len(texts), dtype = object)
+    values[:] = [json.loads(text) for text in texts.tolist()]
+    return values
+
+
+def saveProjectedNetwork(cacheFile, nodes, edges):
+    # Stores the node and edge tables column by column in a single .npz file. Edge
+    # geometries are stored as one coordinate array plus offsets, object columns as
+    # JSON text (under nodeJSON.<column> / edgeJSON.<column>).
+    arrays = {'nodeIndex' : nodes.index.to_numpy()}
+    for name in edges.index.names:
+        arrays[f'edgeIndex.{name}'] = edges.index.get_level_values(name).to_numpy()
+
+    for prefix, table in (('node', nodes), ('edge', edges)):
+        for column in table.columns.drop('geometry'):
+            values = table[column].to_numpy()
+            if values.dtype == object:
+                arrays[f'{prefix}JSON.{column}'] = encodeObjectColumn(values)
+            else:
+                arrays[f'{prefix}.{column}'] = values
+
+    _, coords, (offsets,) = shapely.to_ragged_array(edges.geometry.values)
+    arrays['edgeGeometry.coords'] = coords
+    arrays['edgeGeometry.offsets'] = offsets
+
+    cacheFile.parent.mkdir(parents = True, exist_ok = True)
+    tmpFile = cacheFile.with_suffix('.tmp')
+    with open(tmpFile, 'wb') as fileOut:
+        np.savez(fileOut, **arrays)
+    os.replace(tmpFile, cacheFile)
+
 
+def loadProjectedNetwork(cacheFile, crs):
+    with np.load(cacheFile) as arrays:
+        tables = {'node' : {}, 'edge' : {}}
+        for name in arrays.files:
+            prefix, _, column = name.partition('.')
+            if prefix in tables:
+                tables[prefix][column] = arrays[name]
+            elif prefix.endswith('JSON') and prefix[:-4] in tables:
+                tables[prefix[:-4]][column] = decodeObjectColumn(arrays[name])
+
+        nodes = gpd.GeoDataFrame(
+            tables['node'],
+            index = pd.Index(arrays['nodeIndex'], name = 'osmid'),
+            geometry = gpd.points_from_xy(tables['node']['x'], tables['node']['y']),
+            crs = crs
+        )
+
+        edgeIndexNames = [name.partition('.')[2] for name in arrays.files
+                          if name.startswith('edgeIndex.')]
+        edges = gpd.GeoDataFrame(
+            tables['edge'],
+            index = pd.MultiIndex.from_arrays(
+                [arrays[f'edgeIndex.{name}'] for name in edgeIndexNames],
+                names = edgeIndexNames
+            ),
+            geometry = shapely.from_ragged_array(
+                shapely.GeometryType.LINESTRING,
+                arrays['edgeGeometry.coords'],
+                (arrays['edgeGeometry.offsets'],)
+            ),
+            crs = crs
+        )
+
+    return nodes, edges
+
+
+class StreetNetwork:
+    def __init__(self, useCache = True):
         # Re-project the network so that the lower left corner has the coordinates (0, 0)
         oldX, oldY = _baseProjectionMap(boundingBox[0], boundingBox[1])
         self.projectionMap = pyproj.Proj('+proj=cea +lon=0 +lat_ts=37.5 '
                                         '+ellps=WGS84 +units=m +no_defs '
                                         f'+x_0={11000000 - oldX} '
                                         f'+y_0={-3200000 - oldY}')
-        self.oxgraph = ox.projection.project_graph(oxgraph,
-                                                 to_crs = self.projectionMap.crs)
-        self.nodes, self.edges = ox.convert.graph_to_gdfs(self.oxgraph)
+
+        self._oxgraph = None
+        self._streetGraph = None
+        self.cacheKey, cacheFile = None, None
+        if useCache and Path(roadNetworkFile).is_file():
+            self.cacheKey = streetNetworkCacheKey(self.projectionMap)
+            cacheFile = streetNetworkCacheDir / f'streetNetwork-{self.cacheKey}.npz'
+
+        if cacheFile is not None and cacheFile.is_file():
+            self.nodes, self.edges = loadProjectedNetwork(cacheFile, self.projectionMap.crs)
+        else:
+            self._oxgraph = ox.projection.project_graph(fetchStreetNetwork(),
+                                                        to_crs = self.projectionMap.crs)
+            self.nodes, self.edges = ox.convert.graph_to_gdfs(self._oxgraph)
+            if cacheFile is not None:
+                saveProjectedNetwork(cacheFile, self.nodes, self.edges)
 
         self.x_bounds, self.y_bounds = self.projectionMap(
             [boundingBox[0], boundingBox[2]],
             [boundingBox[1], boundingBox[3]]
         )
 
+    @property
+    def oxgraph(self):
+        # The networkx graph is only rebuilt from the node and edge tables when needed
+        if self._oxgraph is None:
+            self._oxgraph = ox.convert.graph_from_gdfs(self.nodes, self.edges)
+        return self._oxgraph
+
+    @property
+    def streetGraph(self):
+        # Array-backed graph used for routing, built from the node and edge tables
+        if self._streetGraph is None:
+            self._streetGraph = StreetGraph(self.nodes, self.edges)
+        return self._streetGraph
@@ -0,0 +1,263 @@
+import io
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from .sharedArrays import sourceSignature, directoryLock
+
+traceStoreVersion = 1
+traceChunkRows = 1 << 22  # CSV rows converted at a time
+traceChunkBytes = 1 << 22  # bytes of a trace that may still be written read at a time
+
+# Column dtypes of the store: time in integer milliseconds, the serving flag as int8
+# and eNB IDs as uint8 with `missingENB` standing for unknown cells. fairfield.cc
+# writes an unknown cell as -1 converted to its unsigned eNB ID type, so the trace
+# has 4294967295 for it (-1 in older traces).
+traceColumns = {
+    'time' : np.int32,
+    'UE_ID' : np.uint16,
+    'eNB_ID' : np.uint8,
+    'serving' : np.int8,
+    'RSRP' : np.float32,
+    'RSRQ' : np.float32
+}
+missingENB = np.iinfo(np.uint8).max
+unknownCellIDs = [-1, np.iinfo(np.uint32).max]
+
+
+def cellIDs(eNB_IDs):
+    # Stored eNB IDs as int16 with -1 for unknown cells, as the trace CSV has them
+    eNB_IDs = np.asarray(eNB_IDs).astype(np.int16)
+    eNB_IDs[eNB_IDs == missingENB] = -1
+    return eNB_IDs
+
+
+def compactTraceChunk(chunk):
+    # Converts a chunk of rsrp_rsrq_trace.csv rows to the store dtypes
+    UE_IDs = chunk['UE_ID'].to_numpy(dtype = np.int64)
+    eNB_IDs = chunk['eNB_ID'].to_numpy(dtype = np.int64)
+    if len(chunk) and (UE_IDs.min() < 0 or UE_IDs.max() >= np.iinfo(np.uint16).max):
+        raise ValueError('UE IDs must be in [0, 65535) to be stored as uint16')
+    unknown = np.isin(eNB_IDs, unknownCellIDs)
+    knownIDs = eNB_IDs[~unknown]
+    if len(knownIDs) and (knownIDs.min() < 0 or knownIDs.max() >= missingENB):
+        raise ValueError(f'eNB IDs must be in [0, {missingENB}) or one of {unknownCellIDs} '
+                         f'(unknown cell) to be stored as uint8')
+    eNB_IDs = np.where(unknown, missingENB, eNB_IDs)
+
+    return {
+        'time' : np.rint(chunk['Time(s)'].to_numpy(dtype = float) * 1000).astype(np.int32),
+        'UE_ID' : UE_IDs.astype(np.uint16),
+        'eNB_ID' : eNB_IDs.astype(np.uint8),
+        'serving' : (chunk['Status'] == 'Serving').to_numpy().astype(np.int8),
+        'RSRP' : chunk['RSRP'].to_numpy(dtype = np.float32),
+        'RSRQ' : chunk['RSRQ'].to_numpy(dtype = np.float32)
+    }
+
+
+def convertTrace(csvFile, storeDir, chunkRows = traceChunkRows):
+    # Converts rsrp_rsrq_trace.csv into one .npy file per column with the rows of
+    # every UE stored contiguously (in trace order). The CSV is streamed in chunks:
+    # each chunk is first written grouped by UE, then the per-UE pieces of all chunks
+    # are copied into the final columns, so memory use is bounded by the chunk size.
+    storeDir = Path(storeDir)
+    tmpDir = storeDir.with_name(storeDir.name + '.tmp')
+    shutil.rmtree(tmpDir, ignore_errors = True)
+    tmpDir.mkdir(parents = True)
+
+    # A failed or interrupted conversion leaves no partial store behind
+    try:
+        chunkCounts = []
+        reader = pd.read_csv(csvFile, chunksize = chunkRows,
+                             usecols = ['Time(s)', 'UE_ID', 'Status', 'eNB_ID', 'RSRP', 'RSRQ'],
+                             dtype = {'Status' : 'category'})
+        for chunkIndex, chunk in enumerate(reader):
+            columns = compactTraceChunk(chunk)
+            order = np.argsort(columns['UE_ID'], kind = 'stable')
+            for name, values in columns.items():
+                np.save(tmpDir / f'chunk{chunkIndex}.{name}.npy', values[order])
+            chunkCounts.append(np.bincount(columns['UE_ID'], minlength = 1 << 16))
+
+        counts = np.sum(chunkCounts, axis = 0) if chunkCounts else np.zeros(1 << 16, dtype = int)
+        UE_IDs = np.flatnonzero(counts)
+        offsets = np.concatenate(([0], np.cumsum(counts[UE_IDs])))
+        chunkOffsets = [np.concatenate(([0], np.cumsum(c))) for c in chunkCounts]
+
+        for name, dtype in traceColumns.items():
+            column = np.lib.format.open_memmap(tmpDir / f'{name}.npy', mode = 'w+',
+                                               dtype = dtype, shape = (int(offsets[-1]),))
+            chunkValues = [np.load(tmpDir / f'chunk{chunkIndex}.{name}.npy', mmap_mode = 'r')
+                           for chunkIndex in range(len(chunkCounts))]
+            for UEposition, UE_ID in enumerate(UE_IDs):
+                position = offsets[UEposition]
+                for values, valueOffsets in zip(chunkValues, chunkOffsets):
+                    lo, hi = valueOffsets[UE_ID], valueOffsets[UE_ID + 1]
+                    column[position:position + hi - lo] = values[lo:hi]
+                    position += hi - lo
+            column.flush()
+            del column, chunkValues
+
+        for chunkIndex in range(len(chunkCounts)):
+            for name in traceColumns:
+                os.remove(tmpDir / f'chunk{chunkIndex}.{name}.npy')
+
+        np.save(tmpDir / 'UE_IDs.npy', UE_IDs.astype(np.uint16))
+        np.save(tmpDir / 'offsets.npy', offsets.astype(np.int64))
+        with open(tmpDir / 'meta.json', 'w') as fileOut:
+            json.dump({'version' : traceStoreVersion,
+                       'nRows' : int(offsets[-1]),
+                       'source' : sourceSignature(csvFile)}, fileOut)
+    except BaseException:
+        shutil.rmtree(tmpDir, ignore_errors = True)
+        raise
+
+    shutil.rmtree(storeDir, ignore_errors = True)
+    os.replace(tmpDir, storeDir)
+
+
+class TraceStore:
+    # Memory-mapped columnar RSRP/RSRQ trace partitioned by UE: the rows of
+    # UE_IDs[i] are offsets[i]:offsets[i + 1] in every column. Columns are only
+    # mapped when first used and only the pages of the requested UEs are read.
+    def __init__(self, storeDir):
+        self.storeDir = Path(storeDir)
+        with open(self.storeDir / 'meta.json') as fileIn:
+            self.meta = json.load(fileIn)
+        if self.meta['version'] != traceStoreVersion:
+            raise ValueError(f'{storeDir} has trace store version {self.meta["version"]}, '
+                             f'expected {traceStoreVersion}')
+
+        self.UE_IDs = np.load(self.storeDir / 'UE_IDs.npy')
+        self.offsets = np.load(self.storeDir / 'offsets.npy')
+        self._columns = {}
+
+    def __len__(self):
+        return self.meta['nRows']
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(self.storeDir / f'{name}.npy', mmap_mode = 'r')
+        return self._columns[name]
+
+    def UEslice(self, UE_ID):
+        position = np.searchsorted(self.UE_IDs, UE_ID)
+        if position == len(self.UE_IDs) or self.UE_IDs[position] != UE_ID:
+            return slice(0, 0)
+        return slice(int(self.offsets[position]), int(self.offsets[position + 1]))
+
+    def UEcolumn(self, name, UE_ID):
+        return self.column(name)[self.UEslice(UE_ID)]
+
+    def frame(self, UE_IDs = None, rows = None):
+        # Rows of the given UEs (all UEs by default) or the given store rows in the
+        # rsrp_rsrq_trace.csv layout, indexed by Time(s) and with compact column dtypes
+        if rows is None and UE_IDs is None:
+            rows = slice(0, len(self))
+        elif rows is None:
+            rows = np.concatenate([np.arange(self.UEslice(UE_ID).start, self.UEslice(UE_ID).stop)
+                                   for UE_ID in np.atleast_1d(UE_IDs)] + [np.array([], int)])
+
+        eNB_IDs = cellIDs(self.column('eNB_ID')[rows])
+        return pd.DataFrame(
+            {
+                'UE_ID' : self.column('UE_ID')[rows],
+                'Status' : pd.Categorical.from_codes(self.column('serving')[rows],
+                                                     categories = ['Neighbor', 'Serving']),
+                'eNB_ID' : eNB_IDs,
+                'RSRP' : self.column('RSRP')[rows],
+                'RSRQ' : self.column('RSRQ')[rows]
+            },
+            index = pd.Index(self.column('time')[rows] / 1000, name = 'Time(s)')
+        )
+
+
+class MemoryTraceStore(TraceStore):
+    # TraceStore held in memory, built from columns in the store dtypes (see
+    # compactTraceChunk); used for the partial traces of running simulations
+    def __init__(self, columns):
+        order = np.argsort(columns['UE_ID'], kind = 'stable')
+        self.storeDir = None
+        self._columns = {name : np.asarray(columns[name])[order] for name in traceColumns}
+        self.meta = {'version' : traceStoreVersion, 'nRows' : len(order)}
+        self.UE_IDs, counts = np.unique(self._columns['UE_ID'], return_counts = True)
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+
+def readPartialTrace(csvFile, untilTime = None, chunkBytes = traceChunkBytes):
+    # Columns (store dtypes) of the complete rows of a trace that may still be written,
+    # up to and including untilTime [s]. The trace is in time order, so it is read in
+    # chunks of complete rows until the first chunk that ends past untilTime.
+    chunks = []
+    with open(csvFile, 'rb') as fileIn:
+        header = fileIn.readline()
+        remainder = b''
+        while header.endswith(b'\n'):
+            data = fileIn.read(chunkBytes)
+            if not data:
+                break
+            data = remainder + data
+            lastNewline = data.rfind(b'\n') + 1
+            data, remainder = data[:lastNewline], data[lastNewline:]
+            if not data:
+                continue
+
+            columns = compactTraceChunk(pd.read_csv(io.BytesIO(header + data),
+                                                    dtype = {'Status' : 'category'},
+                                                    usecols = ['Time(s)', 'UE_ID', 'Status',
+                                                               'eNB_ID', 'RSRP', 'RSRQ']))
+            if untilTime is not None:
+                keep = columns['time'] <= round(untilTime * 1000)
+                columns = {name : values[keep] for name, values in columns.items()}
+            chunks.append(columns)
+            if untilTime is not None and not keep[-1]:
+                break
+
+    return {name : np.concatenate([chunk[name] for chunk in chunks] +
+                                  [np.zeros(0, dtype = dtype)])
+            for name, dtype in traceColumns.items()}
+
+
+def traceEndTime(csvFile, tailBytes = 1 << 12):
+    # Time [s] of the last complete row of a trace that may still be written; None
+    # before the first row. Rows are written in time order, so the rows up to any
+    # earlier time are complete.
+    with open(csvFile, 'rb') as fileIn:
+        size = fileIn.seek(0, os.SEEK_END)
+        start = max(size - tailBytes, 0)
+        fileIn.seek(start)
+        lines = fileIn.read().split(b'\n')
+    # The last piece is an incomplete row (or empty), the first one may be cut
+    for line in reversed(lines[1 if start else 0:-1]):
+        try:
+            return float(line.split(b',', 1)[0])
+        except ValueError:
+            continue
+    return None
+
+
+def traceStoreUpToDate(storeDir, csvFile):
+    metaFile = Path(storeDir) / 'meta.json'
+    if not metaFile.is_file():
+        return False
+    with open(metaFile) as fileIn:
+        meta = json.load(fileIn)
+    return meta.get('version') == traceStoreVersion and \
+           (not csvFile.is_file() or meta['source'] == sourceSignature(csvFile))
+
+
+def loadTraceStore(outputDataPath):
+    # Opens the trace store of a run, converting rsrp_rsrq_trace.csv first if the
+    # store is missing or was built from a different version of the CSV. Concurrent
+    # processes wait for a single conversion and then share the memory-mapped store.
+    csvFile = Path(outputDataPath) / 'rsrp_rsrq_trace.csv'
+    storeDir = Path(outputDataPath) / 'rsrp_rsrq_trace'
+
+    if not traceStoreUpToDate(storeDir, csvFile):
+        with directoryLock(storeDir):
+            if not traceStoreUpToDate(storeDir, csvFile):
+                convertTrace(csvFile, storeDir)
+
+    return TraceStore(storeDir)
@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from .sharedArrays import sourceSignature, directoryLock
+
+trajectoryStoreVersion = 1
+
+# Stored coordinate columns. Each is kept as a float32 offset from a float64 origin,
+# which keeps lat/lon precise to well below a centimetre.
+coordinateColumns = ['x', 'y', 'lat', 'lon']
+
+# Fixed formats of the UE_locations.csv columns (millimetres, ~1 mm of lat/lon, ms),
+# much faster to write than the shortest exact representation DataFrame.to_csv uses
+locationFormats = {'Time(s)' : '%.3f', 'x' : '%.3f', 'y' : '%.3f', 'UE_ID' : '%d',
+                   'lat' : '%.8f', 'lon' : '%.8f'}
+locationChunkRows = 1 << 16  # rows of UE_locations.csv formatted at a time
+
+
+def writeLocationsCSV(UElocations, csvFile, chunkRows = locationChunkRows):
+    # Writes a frame in the UE_locations.csv layout (indexed by Time(s)) in chunks
+    columns = [UElocations.index.to_numpy()] + \
+              [UElocations[column].to_numpy() for column in UElocations.columns]
+    rowFormat = ','.join(locationFormats[name] for name in
+                         [UElocations.index.name, *UElocations.columns]) + '\n'
+    with open(csvFile, 'w') as fileOut:
+        fileOut.write(','.join([UElocations.index.name, *UElocations.columns]) + '\n')
+        for start in range(0, len(UElocations), chunkRows):
+            rows = zip(*[values[start:start + chunkRows].tolist() for values in columns])
+            fileOut.writelines(map(rowFormat.__mod__, rows))
+
+
+class TrajectoryStore:
+    # UE locations on a common time grid. Every coordinate is a time-major
+    # (nTimes, nUEs) array, so the positions of all UEs at one time are a single
+    # contiguous row. `firstIndex`/`lastIndex` hold the range of time indices in
+    # which each UE has samples; outside of it the coordinates are NaN.
+    def __init__(self, meta, times, firstIndex, lastIndex, arrays):
+        self.meta = meta
+        self.times = times
+        self.UE_IDs = np.asarray(meta['UE_IDs'])
+        self.firstIndex = firstIndex
+        self.lastIndex = lastIndex
+        self.arrays = arrays
+        self.origins = meta['origins']
+        self.signature = None  # identifies the files of an opened store
+
+    @classmethod
+    def fromFrame(cls, UElocations):
+        # Builds an in-memory store from a frame in the UE_locations.csv layout
+        times = np.unique(UElocations.index.to_numpy(dtype = float))
+        UE_IDs = np.unique(UElocations['UE_ID'].to_numpy())
+        timeIndex = np.searchsorted(times, UElocations.index.to_numpy(dtype = float))
+        UEindex = np.searchsorted(UE_IDs, UElocations['UE_ID'].to_numpy())
+
+        steps = np.diff(times)
+        meta = {
+            'version' : trajectoryStoreVersion,
+            'UE_IDs' : UE_IDs.tolist(),
+            'uniform' : bool(len(times) > 1 and np.all(steps == steps[0])),
+            'timeStart' : float(times[0]),
+            'timeStep' : float(steps[0]) if len(times) > 1 else 1.0,
+            'origins' : {}
+        }
+
+        arrays = {}
+        for column in coordinateColumns:
+            if column not in UElocations:
+                continue
+            values = UElocations[column].to_numpy(dtype = float)
+            origin = float(np.nanmin(values))
+            array = np.full((len(times), len(UE_IDs)), np.nan, dtype = np.float32)
+            array[timeIndex, UEindex] = values - origin
+            meta['origins'][column] = origin
+            arrays[column] = array
+
+        firstIndex = np.full(len(UE_IDs), len(times), dtype = np.int32)
+        lastIndex = np.full(len(UE_IDs), -1, dtype = np.int32)
+        np.minimum.at(firstIndex, UEindex, timeIndex)
+        np.maximum.at(lastIndex, UEindex, timeIndex)
+
+        return cls(meta, times, firstIndex, lastIndex, arrays)
+
+    @classmethod
+    def fromCSV(cls, csvFile):
+        return cls.fromFrame(pd.read_csv(csvFile, index_col = 'Time(s)'))
+
+    @classmethod
+    def open(cls, storeDir):
+        # Memory-maps a store written by `write`; nothing is parsed or copied
+        storeDir = Path(storeDir)
+        with open(storeDir / 'meta.json') as fileIn:
+            meta = json.load(fileIn)
+        if meta['version'] != trajectoryStoreVersion:
+            raise ValueError(f'{storeDir} has trajectory store version {meta["version"]}, '
+                             f'expected {trajectoryStoreVersion}')
+
+        load = lambda name: np.load(storeDir / f'{name}.npy', mmap_mode = 'r')
+        store = cls(meta, load('times'), load('firstIndex'), load('lastIndex'),
+                    {column : load(column) for column in meta['origins']})
+        store.signature = sourceSignature(storeDir / 'meta.json')
+        return store
+
+    def write(self, storeDir):
+        storeDir = Path(storeDir)
+        tmpDir = storeDir.with_name(storeDir.name + '.tmp')
+        shutil.rmtree(tmpDir, ignore_errors = True)
+        tmpDir.mkdir(parents = True)
+
+        np.save(tmpDir / 'times.npy', self.times)
+        np.save(tmpDir / 'firstIndex.npy', self.firstIndex)
+        np.save(tmpDir / 'lastIndex.npy', self.lastIndex)
+        for column, array in self.arrays.items():
+            np.save(tmpDir / f'{column}.npy', array)
+        with open(tmpDir / 'meta.json', 'w') as fileOut:
+            json.dump(self.meta, fileOut)
+
+        shutil.rmtree(storeDir, ignore_errors = True)
+        os.replace(tmpDir, storeDir)
+
+    @property
+    def startTime(self):
+        return float(self.times[0])
+
+    @property
+    def endTime(self):
+        return float(self.times[-1])
+
+    def timeIndex(self, t):
+        # Index of the grid time closest to t; O(1) on a uniform grid
+        if self.meta['uniform']:
+            index = int(round((t - self.meta['timeStart']) / self.meta['timeStep']))
+        else:
+            index = int(np.searchsorted(self.times, t))
+            if index > 0 and (index == len(self.times) or
+                              t - self.times[index - 1] < self.times[index] - t):
+                index -= 1
+        return min(max(index, 0), len(self.times) - 1)
+
+    def column(self, column, index):
+        return self.arrays[column][index].astype(float) + self.origins[column]
+
+    def positionsAt(self, t, columns = ('lat', 'lon')):
+        # Locations of all UEs that have a sample at time t
+        index = self.timeIndex(t)
+        present = (self.firstIndex <= index) & (self.lastIndex >= index)
+        if self.times[index] != t:
+            present[:] = False
+
+        positions = pd.DataFrame({column : self.column(column, index)[present]
+                                  for column in columns})
+        positions['UE_ID'] = self.UE_IDs[present]
+        return positions
+
+    def track(self, UE_ID, columns = ('lat', 'lon')):
+        # Locations of a single UE over its whole time range
+        UEindex = int(np.searchsorted(self.UE_IDs, UE_ID))
+        samples = slice(self.firstIndex[UEindex], self.lastIndex[UEindex] + 1)
+        return pd.DataFrame(
+            {column : self.arrays[column][samples, UEindex].astype(float) + self.origins[column]
+             for column in columns},
+            index = pd.Index(self.times[samples], name = 'Time(s)')
+        )
+
+    def toFrame(self):
+        # All samples in the UE_locations.csv layout (time-sorted per UE)
+        frames = []
+        columns = [c for c in coordinateColumns if c in self.arrays]
+        for UE_ID in self.UE_IDs:
+            frame = self.track(UE_ID, columns)
+            frame.insert(2, 'UE_ID', UE_ID)
+            frames.append(frame)
+        return pd.concat(frames)
+
+    def exportCSV(self, csvFile):
+        writeLocationsCSV(self.toFrame(), csvFile)
+
+
+def loadTrajectories(storeDir, csvFile):
+    # Memory-maps the binary store, rebuilding it from the CSV export first when it is
+    # missing or older than the CSV. Concurrent processes wait for a single rebuild
+    # and then share the memory-mapped store.
+    storeMeta, csvFile = Path(storeDir) / 'meta.json', Path(csvFile)
+    upToDate = lambda: storeMeta.is_file() and (
+        not csvFile.is_file() or storeMeta.stat().st_mtime >= csvFile.stat().st_mtime)
+
+    if not upToDate():
+        with directoryLock(storeDir):
+            if not upToDate():
+                TrajectoryStore.fromCSV(csvFile).write(storeDir)
+    return TrajectoryStore.open(storeDir)
@@ -1,69 +1,330 @@
 import re
+import time
+import numpy as np
 import pandas as pd
 
+from .traceStore import missingENB
+
 # Parse logs
-timeStampPattern = re.compile(r'^\+?(\d+\.\d+)s')
-IMSIIDPattern = re.compile(r'IMSI\s+(\d+)')
-RRCmessagePattern = re.compile(r'UeManager\s+(.*)')
-
-def importLogData(outputDataPath, UEmeasurements):
-    logData = []
-
-    with open(outputDataPath / 'out.txt', 'r') as fileIn:
-        for line in fileIn:
-            if re.search(r' IMSI \d+ ', line):
-                logData.append([
-                    float(timeStampPattern.match(line).group(1)),
-                    int(IMSIIDPattern.search(line).group(1)) - 1,
-                    RRCmessagePattern.search(line).group(1),
-                ])
-
-    logs = pd.DataFrame(logData, columns = ['Time(s)', 'UE_ID', 'Message'])
-
-    messageSequences = {
-        ('CONNECTED_NORMALLY --> HANDOVER_PREPARATION',
-        'HANDOVER_PREPARATION --> HANDOVER_LEAVING',
-        'HANDOVER_JOINING --> HANDOVER_PATH_SWITCH',
-        'HANDOVER_PATH_SWITCH --> CONNECTED_NORMALLY',
-        'CONNECTED_NORMALLY --> CONNECTION_RECONFIGURATION',
-        'CONNECTION_RECONFIGURATION --> CONNECTED_NORMALLY') : 'Handover',
-        ('INITIAL_RANDOM_ACCESS --> CONNECTION_SETUP',
-        'CONNECTION_SETUP --> ATTACH_REQUEST',
-        'ATTACH_REQUEST --> CONNECTED_NORMALLY',
-        'CONNECTED_NORMALLY --> CONNECTION_RECONFIGURATION',
-        'CONNECTION_RECONFIGURATION --> CONNECTED_NORMALLY') : 'Initial Connection'}
-
-    logs['RecognizedMessage'] = 'Uncategorized'
-    for _, UElogs in logs[['Time(s)', 'Message', 'UE_ID']].groupby('UE_ID'):
-        # We assume that messages within a 20 ms interval are from the same event
-        singleEvent = UElogs['Time(s)'].diff().gt(0.03).cumsum()
-        for _, subDF in UElogs.groupby(singleEvent):
-            messageSequence = tuple(subDF['Message'])
-            if messageSequence in messageSequences:
-                logs.loc[subDF.index[-1], 'RecognizedMessage'] = messageSequences[messageSequence]
-                logs.loc[subDF.index[:-1], 'RecognizedMessage'] = None
-
-    stillUncategorized = (logs['RecognizedMessage'] == 'Uncategorized')
-    logs.loc[stillUncategorized, 'RecognizedMessage'] = logs.loc[stillUncategorized, 'Message']
+# IMSI and UeManager state transition of a log line. The pattern starts with a literal,
+# so the regex engine can skip straight to the lines that mention an IMSI; the
+# timestamp is then matched at the start of those lines only.
+logLinePattern = re.compile(rb' IMSI (\d+) [^\n]*?UeManager\s+([^\r\n]*)')
+timeStampPattern = re.compile(rb'\+?(\d+\.\d+)s')
+logChunkSize = 1 << 24  # bytes read from out.txt at a time
+
+
+def parseLogChunk(chunk, messageCodes):
+    # Columnar RRC state transitions of a chunk of complete log lines (see
+    # readLogBatches), None if it has none
+    matches = []
+    for match in logLinePattern.finditer(chunk):
+        lineStart = chunk.rfind(b'\n', 0, match.start()) + 1
+        timeStamp = timeStampPattern.match(chunk, lineStart)
+        if timeStamp is not None:
+            matches.append((timeStamp.group(1), *match.groups()))
+    if not matches:
+        return None
+
+    times, IMSIs, messages = zip(*matches)
+    uniqueMessages, messageIndex = np.unique(messages, return_inverse = True)
+    for message in uniqueMessages:
+        messageCodes.setdefault(message.decode(), len(messageCodes))
+    chunkCodes = np.array([messageCodes[m.decode()] for m in uniqueMessages], dtype = np.int16)
+
+    return {
+        'Time(s)' : np.array(times).astype(np.float64),
+        'UE_ID' : np.array(IMSIs).astype(np.int32) - 1,
+        'Message' : chunkCodes[messageIndex]
+    }
+
+
+def readLogBatches(logFile, messageCodes, chunkSize = logChunkSize, stats = None):
+    # Streams the RRC state transitions of an ns-3 log as columnar batches
+    # (Time(s) float64, UE_ID int32, message code int16). The file is read in chunks
+    # of `chunkSize` bytes, so memory use does not depend on the size of the log.
+    # `messageCodes` maps message strings to codes and is extended with new messages.
+    if stats is None:
+        stats = {}
+    stats.update(lines = 0, bytes = 0, matches = 0)
+
+    with open(logFile, 'rb') as fileIn:
+        remainder = b''
+        while True:
+            chunk = fileIn.read(chunkSize)
+            if chunk:
+                chunk = remainder + chunk
+                lastNewline = chunk.rfind(b'\n') + 1
+                chunk, remainder = chunk[:lastNewline], chunk[lastNewline:]
+            else:
+                chunk, remainder = remainder, b''
+            if not chunk:
+                break
+
+            stats['lines'] += chunk.count(b'\n')
+            stats['bytes'] += len(chunk)
+
+            batch = parseLogChunk(chunk, messageCodes)
+            if batch is not None:
+                stats['matches'] += len(batch['Time(s)'])
+                yield batch
+
+
+def readLogs(logFile, chunkSize = logChunkSize, verbose = False, untilTime = None):
+    # Parses the RRC state transitions of an ns-3 log into a DataFrame with a
+    # categorical Message column. With untilTime [s] only the transitions up to it are
+    # parsed: the log is in time order, so reading stops at the first chunk past it.
+    messageCodes, stats = {}, {}
+    startTime = time.perf_counter()
+    batches = []
+    for batch in readLogBatches(logFile, messageCodes, chunkSize, stats):
+        if untilTime is not None:
+            keep = batch['Time(s)'] <= untilTime
+            batches.append({name : values[keep] for name, values in batch.items()})
+            if not keep[-1]:
+                break
+        else:
+            batches.append(batch)
+    elapsed = time.perf_counter() - startTime
+
+    if verbose:
+        print(f'Parsed {stats["lines"]:,} lines ({stats["bytes"] / 2**20:,.1f} MiB, '
+              f'{stats["matches"]:,} RRC messages) in {elapsed:.2f} s: '
+              f'{stats["lines"] / max(elapsed, 1e-9):,.0f} lines/s')
+
+    column = lambda name, dtype: np.concatenate([b[name] for b in batches]) \
+                                 if batches else np.array([], dtype = dtype)
+    return pd.DataFrame({
+        'Time(s)' : column('Time(s)', np.float64),
+        'UE_ID' : column('UE_ID', np.int32),
+        'Message' : pd.Categorical.from_codes(column('Message', np.int16),
+                                              categories = list(messageCodes))
+    })
+
+
+# RRC message sequences that make up a single recognized event
+messageSequences = {
+    ('CONNECTED_NORMALLY --> HANDOVER_PREPARATION',
+    'HANDOVER_PREPARATION --> HANDOVER_LEAVING',
+    'HANDOVER_JOINING --> HANDOVER_PATH_SWITCH',
+    'HANDOVER_PATH_SWITCH --> CONNECTED_NORMALLY',
+    'CONNECTED_NORMALLY --> CONNECTION_RECONFIGURATION',
+    'CONNECTION_RECONFIGURATION --> CONNECTED_NORMALLY') : 'Handover',
+    ('INITIAL_RANDOM_ACCESS --> CONNECTION_SETUP',
+    'CONNECTION_SETUP --> ATTACH_REQUEST',
+    'ATTACH_REQUEST --> CONNECTED_NORMALLY',
+    'CONNECTED_NORMALLY --> CONNECTION_RECONFIGURATION',
+    'CONNECTION_RECONFIGURATION --> CONNECTED_NORMALLY') : 'Initial Connection'}
+
+# We assume that messages of a UE less than 30 ms apart are from the same event
+eventGapThreshold = 0.03 # s
+
+
+class RRCEventRecognizer:
+    # Splits the RRC messages of every UE into events (runs of messages separated by
+    # less than `gapThreshold` seconds) and recognizes events whose message sequence
+    # is one of the registered sequences. Sequences are compiled into a trie-shaped
+    # automaton over integer message codes that is advanced for all events at once.
+    def __init__(self, sequences = None, gapThreshold = eventGapThreshold):
+        self.gapThreshold = gapThreshold
+        self.sequences = {}
+        for sequence, name in (messageSequences if sequences is None else sequences).items():
+            self.register(sequence, name)
+
+    def register(self, sequence, name):
+        self.sequences[tuple(sequence)] = name
+
+    def compile(self, categories):
+        # Transition table of the automaton for messages coded by their position in
+        # `categories`. State 0 rejects, state 1 is the start state; accepting[state]
+        # is the index of the recognized name in self.names, or -1.
+        codes = {message : code for code, message in enumerate(categories)}
+        self.names = list(dict.fromkeys(self.sequences.values()))
+        trie = [{}, {}]
+        accepting = [-1, -1]
+        for sequence, name in self.sequences.items():
+            if not all(message in codes for message in sequence):
+                continue
+            state = 1
+            for message in sequence:
+                if codes[message] not in trie[state]:
+                    trie[state][codes[message]] = len(trie)
+                    trie.append({})
+                    accepting.append(-1)
+                state = trie[state][codes[message]]
+            accepting[state] = self.names.index(name)
+
+        transitions = np.zeros((len(trie), max(len(categories), 1)), dtype = np.int32)
+        for state, edges in enumerate(trie):
+            for code, nextState in edges.items():
+                transitions[state, code] = nextState
+        return transitions, np.array(accepting), max(map(len, self.sequences), default = 0)
+
+    def recognize(self, logs):
+        # Returns the RecognizedMessage column: the event name on the last message of a
+        # recognized event, None on its other messages and the message itself elsewhere
+        messages = pd.Categorical(logs['Message'])
+        categories = np.asarray(messages.categories, dtype = object)
+        transitions, accepting, maxLength = self.compile(categories)
+
+        # Messages of a UE stay in log order; events start at a new UE or after a gap
+        order = np.argsort(logs['UE_ID'].to_numpy(), kind = 'stable')
+        times = logs['Time(s)'].to_numpy()[order]
+        UE_IDs = logs['UE_ID'].to_numpy()[order]
+        codes = messages.codes[order]
+
+        newEvent = np.ones(len(order), dtype = bool)
+        newEvent[1:] = (UE_IDs[1:] != UE_IDs[:-1]) | (np.diff(times) > self.gapThreshold)
+        eventStarts = np.flatnonzero(newEvent)
+        eventLengths = np.diff(np.append(eventStarts, len(order)))
+
+        states = np.ones(len(eventStarts), dtype = np.int32)
+        for position in range(maxLength):
+            active = eventLengths > position
+            states[active] = transitions[states[active], codes[eventStarts[active] + position]]
+        states[eventLengths > maxLength] = 0
+        recognized = np.flatnonzero(accepting[states] >= 0)
+
+        result = categories[codes]
+        result[np.repeat(accepting[states] >= 0, eventLengths)] = None
+        result[eventStarts[recognized] + eventLengths[recognized] - 1] = \
+            np.asarray(self.names, dtype = object)[accepting[states[recognized]]]
+
+        recognizedMessages = np.empty(len(order), dtype = object)
+        recognizedMessages[order] = result
+        return pd.Series(recognizedMessages, index = logs.index, name = 'RecognizedMessage')
 
+
+class UETimeIndex:
+    # Rows of a measurement trace (indexed by Time(s), with a UE_ID column) grouped
+    # by UE and sorted by time. The rows of UE_IDs[i] are
+    # order[offsets[i]:offsets[i + 1]], so a time window of a UE is found with two
+    # binary searches instead of masking the whole trace.
+    timeScale = 1  # units of `times` per second
+
+    def __init__(self, measurements):
+        self.measurements = measurements
+        times = measurements.index.to_numpy(dtype = float)
+        UEs = measurements['UE_ID'].to_numpy(dtype = np.int64, na_value = -1)
+
+        self.order = np.lexsort((times, UEs))
+        self.times = times[self.order]
+        self.UE_IDs, self.offsets = np.unique(UEs[self.order], return_index = True)
+        self.offsets = np.append(self.offsets, len(self.order))
+
+    def windowBounds(self, UE_IDs, startTimes, endTimes):
+        # Positions [lo, hi) in the sorted rows of startTimes < Time(s) < endTimes for
+        # each UE; vectorized over the windows of every UE
+        UE_IDs = np.asarray(UE_IDs)
+        startTimes, endTimes = np.asarray(startTimes), np.asarray(endTimes)
+        UEpos = np.searchsorted(self.UE_IDs, UE_IDs)
+        UEpos = np.minimum(UEpos, len(self.UE_IDs) - 1)
+        known = self.UE_IDs[UEpos] == UE_IDs if len(self.UE_IDs) else np.zeros(len(UE_IDs), bool)
+
+        lo = np.zeros(len(UE_IDs), dtype = np.int64)
+        hi = np.zeros(len(UE_IDs), dtype = np.int64)
+        for position in np.unique(UEpos[known]):
+            windows = np.flatnonzero(known & (UEpos == position))
+            blockStart, blockEnd = self.offsets[position], self.offsets[position + 1]
+            block = self.times[blockStart:blockEnd]
+            if self.timeScale != 1:
+                block = block / self.timeScale
+            lo[windows] = blockStart + np.searchsorted(block, startTimes[windows], side = 'right')
+            hi[windows] = blockStart + np.searchsorted(block, endTimes[windows], side = 'left')
+        return lo, np.maximum(lo, hi)
+
+    def rows(self, lo, hi):
+        # Trace rows of the sorted positions [lo, hi)
+        return self.order[lo:hi]
+
+    def servingCells(self, positions):
+        # (serving flags, eNB IDs with NaN for unknown cells) of sorted positions
+        rows = self.order[positions]
+        return (self.measurements['Status'].to_numpy()[rows] == 'Serving',
+                self.measurements['eNB_ID'].to_numpy(dtype = float, na_value = np.nan)[rows])
+
+    def window(self, UE_ID, startTime, endTime):
+        # Rows of a UE with startTime < Time(s) < endTime
+        lo, hi = self.windowBounds([UE_ID], [startTime], [endTime])
+        return self.measurements.iloc[self.rows(lo[0], hi[0])]
+
+
+class TraceStoreTimeIndex(UETimeIndex):
+    # UETimeIndex of a traceStore.TraceStore, whose rows are already grouped by UE in
+    # time order: the sorted positions are the store rows and only the memory-mapped
+    # time column is read, so the trace is never loaded as a whole
+    timeScale = 1000
+
+    def __init__(self, traceStore):
+        self.traceStore = traceStore
+        self.times = traceStore.column('time')
+        self.UE_IDs = traceStore.UE_IDs.astype(np.int64)
+        self.offsets = traceStore.offsets
+
+    def rows(self, lo, hi):
+        return np.arange(lo, hi, dtype = np.int64)
+
+    def servingCells(self, positions):
+        eNBs = self.traceStore.column('eNB_ID')[positions].astype(float)
+        eNBs[eNBs == missingENB] = np.nan
+        return self.traceStore.column('serving')[positions].astype(bool), eNBs
+
+    def window(self, UE_ID, startTime, endTime):
+        lo, hi = self.windowBounds([UE_ID], [startTime], [endTime])
+        return self.traceStore.frame(rows = self.rows(lo[0], hi[0]))
+
+
+def uniqueServingCells(timeIndex, lo, hi):
+    # For each range [lo, hi) of sorted rows: the serving eNB if all Serving rows in
+    # the range have the same eNB, else NaN. Only the rows of the ranges are read.
+    lengths = hi - lo
+    starts = np.concatenate(([0], np.cumsum(lengths)))
+    positions = np.repeat(lo - starts[:-1], lengths) + np.arange(starts[-1])
+    serving, eNBs = timeIndex.servingCells(positions)
+
+    # A sentinel row makes every range end a valid reduceat index
+    lowest = np.append(np.where(serving, eNBs, np.inf), np.inf)
+    highest = np.append(np.where(serving, eNBs, -np.inf), -np.inf)
+    bounds = np.column_stack((starts[:-1], starts[1:])).ravel()
+    minimum = np.minimum.reduceat(lowest, bounds)[::2]
+    maximum = np.maximum.reduceat(highest, bounds)[::2]
+
+    nServing = np.concatenate(([0], np.cumsum(serving)))
+    unique = (nServing[starts[1:]] > nServing[starts[:-1]]) & (minimum == maximum)
+    return np.where(unique, minimum, np.nan)
+
+
+def importLogData(outputDataPath, UEmeasurements, recognizer = None):
+    logs = readLogs(outputDataPath / 'out.txt')
+    if recognizer is None:
+        recognizer = RRCEventRecognizer()
+    logs['RecognizedMessage'] = recognizer.recognize(logs)
+
+    HOdata = extractHOwindows(logs, UETimeIndex(UEmeasurements))
+    return logs, HOdata
+
+
+def HOwindowBounds(logs, timeIndex, window = 5, margin = 1):
+    # Times and sorted row ranges [lo, hi) of the +-`window` second trace slices around
+    # every recognized handover whose serving cell is unique and different more than
+    # `margin` seconds before and after
     HOs = logs[logs['RecognizedMessage'] == 'Handover']
-    HOdata = []
-    for _, row in HOs.iterrows():
-        dataSlice = UEmeasurements[
-            (UEmeasurements['UE_ID'] == row['UE_ID']) &
-            (UEmeasurements.index < row['Time(s)'] + 5) & 
-            (UEmeasurements.index > row['Time(s)'] - 5)
-        ]
-
-        dataSliceBefore = dataSlice.loc[(dataSlice.index < row['Time(s)'] - 1) &
-                                        (dataSlice['Status'] == 'Serving'), 'eNB_ID'].unique()
-        dataSliceAfter = dataSlice.loc[(dataSlice.index > row['Time(s)'] + 1) &
-                                       (dataSlice['Status'] == 'Serving'), 'eNB_ID'].unique()
-
-        if ((len(dataSliceBefore) == 1) and
-            (len(dataSliceAfter) == 1) and
-            (dataSliceBefore[0] != dataSliceAfter[0])
-        ):
-            HOdata.append((dataSlice, row['Time(s)']))
-
-    return logs, HOdata
\ No newline at end of file
+    HOtimes = HOs['Time(s)'].to_numpy()
+    HO_UEs = HOs['UE_ID'].to_numpy()
+
+    lo, hi = timeIndex.windowBounds(HO_UEs, HOtimes - window, HOtimes + window)
+    _, beforeEnd = timeIndex.windowBounds(HO_UEs, HOtimes - window, HOtimes - margin)
+    afterStart, _ = timeIndex.windowBounds(HO_UEs, HOtimes + margin, HOtimes + window)
+
+    servingBefore = uniqueServingCells(timeIndex, lo, beforeEnd)
+    servingAfter = uniqueServingCells(timeIndex, afterStart, hi)
+    valid = ~np.isnan(servingBefore) & ~np.isnan(servingAfter) & \
+            (servingBefore != servingAfter)
+    return HOtimes[valid], lo[valid], hi[valid]
+
+
+def extractHOwindows(logs, timeIndex, window = 5, margin = 1):
+    # Trace slices around the handovers selected by HOwindowBounds
+    HOtimes, lo, hi = HOwindowBounds(logs, timeIndex, window, margin)
+    return [(timeIndex.measurements.iloc[timeIndex.rows(lo[i], hi[i])], HOtimes[i])
+            for i in range(len(HOtimes))]
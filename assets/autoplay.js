@@ -0,0 +1,86 @@
+// Autoplay of the network map in the browser. The server sends the map data of a
+// window of frames (see Scripts/autoplayFrames.py) into the autoplayFrames store; every
+// autoSlider tick draws the next frame from it and only asks the server for the next
+// window (through the autoplayRequest store) once half of the current one is played.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    autoplay: {
+        toggle: function(n_clicks, playing) {
+            playing = !playing;
+            return [playing, playing ? 'Autoplaying..' : 'Autoplay Off', !playing, null];
+        },
+
+        // Slider moves reach the server (update_map) only while autoplay is off; when it
+        // stops, the map is redrawn once at the time it stopped at
+        gate: function(selectedTime, playing) {
+            return playing ? window.dash_clientside.no_update : selectedTime;
+        },
+
+        tick: function(n_intervals, frames, request, playing, selectedTime, UE_ID, selectedRun,
+                       mapFigure, signalFigure) {
+            const noUpdate = window.dash_clientside.no_update;
+            const result = Array(7).fill(noUpdate);
+            // result: map figure, slider value, next window request, signal graph figure,
+            //         autoplay state, button label, autoSlider disabled
+            if (!playing) {
+                return result;
+            }
+            const requestWindow = function(startTime) {
+                if (!request || request.run !== selectedRun || request.time !== startTime) {
+                    result[2] = {run : selectedRun, time : startTime};
+                }
+            };
+
+            if (!frames || frames.run !== selectedRun) {
+                requestWindow(selectedTime);
+                return result;
+            }
+
+            const t = selectedTime + frames.step;
+            if (t > frames.endTime) {
+                result[4] = false;
+                result[5] = 'Autoplay Off';
+                result[6] = true;
+                return result;
+            }
+            const i = Math.round((t - frames.start) / frames.step);
+            const nFrames = frames.UElat.length;
+            if (i < 0 || i >= nFrames) {
+                // Waiting for the window that starts at t
+                requestWindow(t);
+                return result;
+            }
+            if (2 * i >= nFrames && frames.start + nFrames * frames.step <= frames.endTime &&
+                    (!request || request.time <= frames.start)) {
+                requestWindow(t);
+            }
+
+            const figure = Object.assign({}, mapFigure, {data : mapFigure.data.slice()});
+            figure.data[0] = Object.assign({}, figure.data[0],
+                                           {lat : frames.linkLat[i], lon : frames.linkLon[i]});
+            figure.data[1] = Object.assign({}, figure.data[1],
+                                           {lat : frames.UElat[i], lon : frames.UElon[i],
+                                            customdata : frames.UE_ID[i]});
+            if (UE_ID !== null && UE_ID !== undefined) {
+                const k = frames.UE_ID[i].indexOf(UE_ID);
+                figure.data[4] = Object.assign({}, figure.data[4],
+                                               {lat : k < 0 ? [] : [frames.UElat[i][k]],
+                                                lon : k < 0 ? [] : [frames.UElon[i][k]]});
+            }
+            result[0] = figure;
+            result[1] = t;
+
+            // Simulation time cursor of the signal strength graph (see cursorPatch)
+            if (UE_ID !== null && UE_ID !== undefined && signalFigure &&
+                    signalFigure.layout && signalFigure.layout.annotations) {
+                const signal = Object.assign({}, signalFigure, {data : signalFigure.data.slice()});
+                signal.data[0] = Object.assign({}, signal.data[0], {x : [t / 60, t / 60]});
+                const annotations = signalFigure.layout.annotations.slice();
+                annotations[0] = Object.assign({}, annotations[0], {x : t / frames.graphEndTime});
+                signal.layout = Object.assign({}, signalFigure.layout, {annotations : annotations});
+                result[3] = signal;
+            }
+            return result;
+        }
+    }
+});
@@ -0,0 +1,15 @@
+from Scripts.a3Replay import A3Replay
+from Scripts.traceStore import convertTrace, TraceStore
+
+traceHeader = 'Time(s),UE_ID,Status,eNB_ID,RSRP,RSRQ\n'
+
+
+def test_empty_trace_replays_to_no_handovers(tmp_path):
+    csvFile = tmp_path / 'rsrp_rsrq_trace.csv'
+    csvFile.write_text(traceHeader)
+    convertTrace(csvFile, tmp_path / 'store')
+    result = A3Replay(TraceStore(tmp_path / 'store')).run({'Hysteresis' : [0, 1],
+                                                           'TimeToTrigger' : [40]})
+
+    assert result.summary()['handovers'].tolist() == [0, 0]
+    assert len(result.handovers(0)) == 0
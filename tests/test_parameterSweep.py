@@ -0,0 +1,104 @@
+import os
+import sys
+import textwrap
+import threading
+import time
+
+from Scripts.parameterSweep import SweepRunner, readManifest
+
+# Stands in for the ns-3 simulator: --mode picks what it does, on cue
+#  0 succeeds, 1 fails on its first attempt only, 2 always fails, 3 hangs (with a child
+#  process, which a timeout has to kill as well)
+stubSimulator = textwrap.dedent('''
+    import os, subprocess, sys, time
+    args = dict(arg[2:].split('=', 1) for arg in sys.argv[1:])
+    runDir = f'outputs/ep_{args["episode"]}/run_{args["runID"]}'
+    os.makedirs(runDir, exist_ok = True)
+    with open(f'{runDir}/calls', 'a') as fileOut:
+        fileOut.write('call\\n')
+    mode = int(float(args['mode']))
+    nCalls = len(open(f'{runDir}/calls').readlines())
+    if mode == 3:
+        child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        open(f'{runDir}/child.pid', 'w').write(str(child.pid))
+        time.sleep(60)
+    if mode == 2 or (mode == 1 and nCalls == 1):
+        sys.exit(1)
+    with open(f'{runDir}/rsrp_rsrq_trace.csv', 'w') as fileOut:
+        fileOut.write('Time(s),UE_ID,Status,eNB_ID,RSRP,RSRQ\\n')
+    print('simulated', args)
+''')
+
+
+def makeRunner(tmp_path, **kwargs):
+    stub = tmp_path / 'stubSimulator.py'
+    stub.write_text(stubSimulator)
+    return SweepRunner(command = [sys.executable, str(stub)], workDir = tmp_path, **kwargs)
+
+
+def calls(runner, runName):
+    return len((runner.episodeDir(0) / runName / 'calls').read_text().splitlines())
+
+
+def test_sweep_outcomes_and_retries(tmp_path):
+    runner = makeRunner(tmp_path, nWorkers = 4, timeout = 30, retries = 1)
+    runs = runner.run(0, {'mode' : [0, 1, 2]})
+
+    statuses = {record['parameters']['mode'] : record for record in runs.values()}
+    assert statuses[0]['status'] == 'done' and statuses[0]['attempts'] == 1
+    assert statuses[1]['status'] == 'done' and statuses[1]['attempts'] == 2
+    assert statuses[2]['status'] == 'failed' and statuses[2]['attempts'] == 2
+    assert readManifest(runner.outputsDir, 0) == runs
+    assert 'simulated' in (runner.episodeDir(0) / 'run_0' / 'out.txt').read_text()
+
+
+def test_sweep_resumes_from_manifest(tmp_path):
+    runner = makeRunner(tmp_path, nWorkers = 2, timeout = 30, retries = 0)
+    first = runner.run(0, {'mode' : [0, 2]})
+    assert sorted(record['status'] for record in first.values()) == ['done', 'failed']
+
+    # Done runs are skipped, the failed one runs again in its own run directory, and a
+    # new point gets a new run ID
+    second = runner.run(0, {'mode' : [0, 2, 1]})
+    runNames = {record['parameters']['mode'] : name for name, record in second.items()}
+    assert runNames == {0 : 'run_0', 2 : 'run_1', 1 : 'run_2'}
+    assert calls(runner, 'run_0') == 1
+    assert calls(runner, 'run_1') == 2
+    assert second['run_2']['status'] == 'failed'
+
+
+def test_sweep_timeout_kills_process_group(tmp_path):
+    runner = makeRunner(tmp_path, nWorkers = 1, timeout = 2, retries = 0)
+    runs = runner.run(0, {'mode' : [3]})
+
+    assert runs['run_0']['status'] == 'timeout'
+    childPid = int((runner.episodeDir(0) / 'run_0' / 'child.pid').read_text())
+    try:
+        os.kill(childPid, 0)
+        # A killed child may linger as a zombie of the init process for a moment
+        status = open(f'/proc/{childPid}/status').read()
+        assert 'State:\tZ' in status
+    except (ProcessLookupError, FileNotFoundError):
+        pass
+
+
+def test_abandoned_run_is_not_retried(tmp_path):
+    runner = makeRunner(tmp_path, nWorkers = 1, timeout = 30, retries = 2)
+    runDir = runner.runDir(0, 0)
+    runner.abandon(runDir)
+    outcome = runner.runSimulation(0, 0, {'mode' : 2})
+
+    assert outcome['status'] == 'abandoned' and outcome['attempts'] == 1
+
+
+def test_killed_runs_are_not_relaunched(tmp_path):
+    runner = makeRunner(tmp_path, nWorkers = 1, timeout = 30, retries = 2)
+    killer = threading.Timer(1, runner.killAll)
+    killer.start()
+    startTime = time.perf_counter()
+    outcome = runner.runSimulation(0, 0, {'mode' : 3})
+
+    assert outcome['status'] == 'interrupted' and outcome['attempts'] == 1
+    assert time.perf_counter() - startTime < 10
+    assert calls(runner, 'run_0') == 1
+    assert runner.runSimulation(0, 1, {'mode' : 0})['status'] == 'interrupted'
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from Scripts.traceStore import convertTrace, TraceStore, missingENB
+
+traceHeader = 'Time(s),UE_ID,Status,eNB_ID,RSRP,RSRQ\n'
+
+
+def writeTrace(path, rows):
+    path.write_text(traceHeader + ''.join(f'{row}\n' for row in rows))
+    return path
+
+
+def test_convertTrace_groups_rows_by_UE(tmp_path):
+    csvFile = writeTrace(tmp_path / 'rsrp_rsrq_trace.csv', [
+        '0.2,1,Serving,0,-80.5,-10',
+        '0.2,0,Neighbor,1,-90,-12',
+        '0.4,1,Neighbor,2,-85,-11',
+        '0.4,0,Serving,0,-70,-9'
+    ])
+    convertTrace(csvFile, tmp_path / 'store', chunkRows = 3)
+    store = TraceStore(tmp_path / 'store')
+
+    assert len(store) == 4
+    assert store.UE_IDs.tolist() == [0, 1]
+    assert store.UEcolumn('time', 0).tolist() == [200, 400]
+    assert store.UEcolumn('eNB_ID', 1).tolist() == [0, 2]
+    assert store.UEcolumn('serving', 0).tolist() == [0, 1]
+    assert not (tmp_path / 'store.tmp').exists()
+
+
+def test_convertTrace_maps_unknown_cells(tmp_path):
+    # fairfield.cc writes an unknown cell as -1 cast to uint32
+    csvFile = writeTrace(tmp_path / 'rsrp_rsrq_trace.csv', [
+        '0.2,0,Serving,3,-80,-10',
+        '0.2,0,Neighbor,4294967295,-120,-20',
+        '0.4,0,Neighbor,-1,-121,-20'
+    ])
+    convertTrace(csvFile, tmp_path / 'store')
+    store = TraceStore(tmp_path / 'store')
+
+    assert store.UEcolumn('eNB_ID', 0).tolist() == [3, missingENB, missingENB]
+    assert store.frame()['eNB_ID'].tolist() == [3, -1, -1]
+
+
+def test_convertTrace_rejects_unstorable_eNB_IDs(tmp_path):
+    csvFile = writeTrace(tmp_path / 'rsrp_rsrq_trace.csv', ['0.2,0,Serving,255,-80,-10'])
+    with pytest.raises(ValueError):
+        convertTrace(csvFile, tmp_path / 'store')
+    assert not (tmp_path / 'store.tmp').exists()
+    assert not (tmp_path / 'store').exists()
@@ -1,42 +1,52 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from dash import Dash, dcc, html, Input, Output, State, no_update, callback_context, Patch
+from dash import Dash, dcc, html, Input, Output, State, no_update, Patch, ClientsideFunction
 import plotly.graph_objects as go
 
-from Scripts.visualizationHelp import importLogData
+from Scripts.trajectoryStore import loadTrajectories
+from Scripts.runData import RunData, RunCache, findRuns, runKey
+from Scripts.liveRun import LiveRun, runIsLive
+from Scripts.autoplayFrames import autoplayWindow
 
+# Run shown when the dashboard is opened (the first run found if it does not exist)
 learning_episode = 0
 learning_episode_runID = 0
-updateInterval = 250 # time between updates for the autoplay button [ms]
+updateInterval = 250 # time between autoplay frames at normal speed [ms]
+autoplaySpeeds = [0.5, 1, 2, 4, 8] # autoplay speeds, relative to updateInterval
+autoplayWindowFrames = 60 # autoplay frames sent to the browser per request
+sliderStep = 10 # time step of the slider and of autoplay [s]
+signalCursorTrace = 0 # index of the simulation time cursor in the signal strength graph
+maxPointsPerTrace = 2000 # samples per signal strength series at the current zoom level
+liveUpdateInterval = 5000 # time between reads of a running simulation's new output [ms]
 
 # Import topology and UEs
-UEroutes = pd.read_csv('inputData/UE_locations.csv', index_col = 'Time(s)')
+UEtrajectories = loadTrajectories('inputData/UE_locations', 'inputData/UE_locations.csv')
 radioTowers = pd.read_csv('inputData/networkTopo.csv')
 
-# Import RSRP values from the simulation
-outputDataPath = Path(f'outputs/ep_{learning_episode}/run_{learning_episode_runID}/')
-assert outputDataPath.is_dir()
-
-UEmeasurements = pd.read_csv(
-    outputDataPath / 'rsrp_rsrq_trace.csv',
-    index_col = 'Time(s)',
-    usecols = ['Time(s)', 'UE_ID', 'Status', 'eNB_ID', 'RSRP', 'RSRQ'],
-    dtype = {
-        'UE_ID' : 'Int64',
-        'Status' : str,
-        'eNB_ID' : 'Int64',
-        'RSRP' : float,
-        'RSRQ' : float
-    }
-)
+# Simulation runs are imported when first selected and kept in a cache bounded by
+# runCacheSize, evicting the least recently viewed runs. Their derived data is read
+# from the snapshot in <run>/dashboard/ (see PreprocessResults.py) when up to date.
+# Runs whose simulation is still running are followed as their output grows instead.
+outputsDir = Path('outputs')
+
+def loadRun(key):
+    runClass = LiveRun if runIsLive(outputsDir / key) else RunData
+    return runClass(outputsDir / key, UEtrajectories, radioTowers, sliderStep)
 
-# Import and parse logs
-logs, HOdata = importLogData(outputDataPath, UEmeasurements)
-allMessageTypes = [msg for msg in logs['RecognizedMessage'].unique() if msg]
+runCache = RunCache(loadRun)
+
+def defaultRun():
+    availableRuns = findRuns(outputsDir)
+    assert availableRuns, f'No simulation runs in {outputsDir}'
+    key = runKey(learning_episode, learning_episode_runID)
+    return availableRuns, key if key in availableRuns else availableRuns[0]
 
 
 # Time Slider
+def sliderMarks(endTime):
+    return {i: f'{i//60} min' for i in range(int(UEtrajectories.startTime), int(endTime) + 1, 300)}
+
 timeSlider = html.Div(
     className = 'slider-container',
     children = [
@@ -44,38 +54,37 @@ timeSlider = html.Div(
         dcc.Slider(
             id = 'time-slider',
             min = 0,
-            max = UEroutes.index.max(),
-            value = UEroutes.index[1],
-            step = 10,
-            marks = {i: f'{i//60} min' for i in range(int(UEroutes.index.min()),
-                                                      int(UEroutes.index.max()) + 1, 300)}
+            max = UEtrajectories.endTime,
+            value = UEtrajectories.times[1],
+            step = sliderStep,
+            marks = sliderMarks(UEtrajectories.endTime)
     )],
     style = {'textAlign' : 'center', 'marginBottom' : '20px'}
 )
 
-checklist = dcc.Checklist(
-    id = 'checkList',
-    options = allMessageTypes,
-    value = list(set(['Handover', 'Initial Connection']) & set(allMessageTypes)),
-    className = 'checklist-container'
-)
+def defaultMessageTypes(run):
+    return list(set(['Handover', 'Initial Connection']) & set(run.allMessageTypes))
 
-autoPlayButton = html.Div(
+autoPlayButton = html.Div([
     html.Button('Autoplay',
                 id = 'autoPlaySimulation',
                 style = {'backgroundColor' : 'lightBlue'}),
+    dcc.Dropdown([{'label' : f'{speed:g}x', 'value' : speed} for speed in autoplaySpeeds], 1,
+                 id = 'autoplay-speed', clearable = False, searchable = False,
+                 style = {'width' : '70px', 'fontSize' : '12px'})
+    ],
     style = {'position' : 'absolute', 'z-index' : '1002',
-             'top' : '10px', 'left' : '10px'})
+             'top' : '10px', 'left' : '10px', 'display' : 'flex', 'gap' : '5px'})
 
 
 app = Dash(__name__, title = 'ns-3 visualizer', update_title = None)
 
 ###################################################################################################
 
-def plotDataSlice(HO_ID):
+def plotDataSlice(run, HO_ID):
     hoGraph = go.Figure()
 
-    dataSlice, HOtime = HOdata[HO_ID]
+    dataSlice, HOtime = run.HOdata[HO_ID]
     eNB_Before = dataSlice[(dataSlice.index < HOtime - 1) &
                            (dataSlice['Status'] == 'Serving')]['eNB_ID'].unique()[0]
     eNB_After = dataSlice[(dataSlice.index > HOtime + 1) &
@@ -129,31 +138,22 @@ def plotDataSlice(HO_ID):
 
 @app.callback(
     Output('HOstat', 'figure'),
-    Input('HOselect', 'value'))
-def updateHOgraph(x):
-    return plotDataSlice(int(x))
+    Input('HOselect', 'value'),
+    State('run-select', 'value'))
+def updateHOgraph(x, selectedRun):
+    if x is None:
+        return no_update
+    return plotDataSlice(runCache.get(selectedRun), int(x))
 
 
 ###################################################################################################
 
-def generateFigure(selected_time, used_ID):
-    filtered_ue = UEroutes.loc[UEroutes.index == selected_time, ['lat', 'lon', 'UE_ID']]
-    filtered_ue = filtered_ue.drop_duplicates()
+def generateFigure(selected_time, used_ID, run):
+    filtered_ue = UEtrajectories.positionsAt(selected_time)
 
     networkMap = go.Figure()
 
-    closestMeasurements = UEmeasurements.iloc[
-        np.where(abs(UEmeasurements.index - selected_time) == \
-            (abs(UEmeasurements.index - selected_time)).min())[0]
-    ]
-    closestMeasurements = closestMeasurements[closestMeasurements['Status'] == 'Serving'].copy()
-
-    ptsLon, ptsLat = [], []
-    for UE_ID, subDF in filtered_ue.groupby('UE_ID'):
-        closestMeasurements_UE = closestMeasurements[closestMeasurements['UE_ID'] == UE_ID]
-        for eNB_ID in closestMeasurements_UE['eNB_ID']:
-            ptsLon.extend([radioTowers['lon'].loc[eNB_ID], subDF['lon'].iloc[0], None])
-            ptsLat.extend([radioTowers['lat'].loc[eNB_ID], subDF['lat'].iloc[0], None])
+    ptsLat, ptsLon = run.servingLinks.at(selected_time)
 
     networkMap.add_trace(go.Scattermap(
         lat = ptsLat,
@@ -222,22 +222,9 @@ def generateFigure(selected_time, used_ID):
     return networkMap, selected_time
 
 
-def updateFigure(selected_time, used_ID):
-    filtered_ue = UEroutes.loc[UEroutes.index == selected_time, ['lat', 'lon', 'UE_ID']]
-    filtered_ue = filtered_ue.drop_duplicates()
-
-    closestMeasurements = UEmeasurements.iloc[
-        np.where(abs(UEmeasurements.index - selected_time) == \
-            (abs(UEmeasurements.index - selected_time)).min())[0]
-    ]
-    closestMeasurements = closestMeasurements[closestMeasurements['Status'] == 'Serving'].copy()
-
-    ptsLon, ptsLat = [], []
-    for UE_ID, subDF in filtered_ue.groupby('UE_ID'):
-        closestMeasurements_UE = closestMeasurements[closestMeasurements['UE_ID'] == UE_ID]
-        for eNB_ID in closestMeasurements_UE['eNB_ID']:
-            ptsLon.extend([radioTowers['lon'].loc[eNB_ID], subDF['lon'].iloc[0], None])
-            ptsLat.extend([radioTowers['lat'].loc[eNB_ID], subDF['lat'].iloc[0], None])
+def updateFigure(selected_time, used_ID, run):
+    filtered_ue = UEtrajectories.positionsAt(selected_time)
+    ptsLat, ptsLon = run.servingLinks.at(selected_time)
 
     patch_figure = Patch()
     patch_figure['data'][0]['lon'] = ptsLon
@@ -252,186 +239,209 @@ def updateFigure(selected_time, used_ID):
         patch_figure['data'][4]['customdata'] = [f'{used_ID}']
         patch_figure['data'][4]['showlegend'] = True
 
-    return patch_figure, selected_time
+    return patch_figure
+
+
+def cursorPatch(selected_time, used_ID):
+    # Moves the simulation time cursor of the signal strength graph. The graph itself is
+    # only rebuilt by update_signal_graph, when a UE is clicked or the RRC messages change.
+    if used_ID is None:
+        return no_update
+
+    patch_figure = Patch()
+    patch_figure['data'][signalCursorTrace]['x'] = [selected_time / 60, selected_time / 60]
+    patch_figure['layout']['annotations'][0]['x'] = selected_time / UEtrajectories.endTime
+    return patch_figure
 
 
 @app.callback(
     Output('network-map-graph', 'figure'),
-    Output('time-slider', 'value'),
+    Output('signal-strength-graph', 'figure', allow_duplicate = True),
+    Input('shownTime', 'data'),
+    Input('selected_ue', 'data'),
+    State('time-slider', 'value'),
+    State('run-select', 'value'),
+    prevent_initial_call = True)
+def update_map(_, used_ID, selected_time, selectedRun):
+    # Slider moves while autoplay is off (see the autoplay gate) and UE selections
+    return updateFigure(selected_time, used_ID, runCache.get(selectedRun)), \
+           cursorPatch(selected_time, used_ID)
+
+
+# Autoplay runs in the browser (assets/autoplay.js): every autoSlider tick draws the
+# next frame of the window in autoplayFrames, and the server is only asked for the
+# next window of frames. Slider moves reach update_map only while autoplay is off.
+app.clientside_callback(
+    ClientsideFunction(namespace = 'autoplay', function_name = 'toggle'),
     Output('autoAnimate', 'data'),
     Output('autoPlaySimulation', 'children'),
     Output('autoSlider', 'disabled'),
-    Output('signal-strength-graph', 'figure', allow_duplicate = True),
+    Output('autoplayRequest', 'data'),
     Input('autoPlaySimulation', 'n_clicks'),
-    Input('autoSlider', 'n_intervals'),
+    State('autoAnimate', 'data'),
+    prevent_initial_call = True)
+
+app.clientside_callback(
+    ClientsideFunction(namespace = 'autoplay', function_name = 'gate'),
+    Output('shownTime', 'data'),
     Input('time-slider', 'value'),
-    Input('selected_ue', 'data'),
+    Input('autoAnimate', 'data'),
+    prevent_initial_call = True)
+
+app.clientside_callback(
+    ClientsideFunction(namespace = 'autoplay', function_name = 'tick'),
+    Output('network-map-graph', 'figure', allow_duplicate = True),
+    Output('time-slider', 'value'),
+    Output('autoplayRequest', 'data', allow_duplicate = True),
+    Output('signal-strength-graph', 'figure', allow_duplicate = True),
+    Output('autoAnimate', 'data', allow_duplicate = True),
+    Output('autoPlaySimulation', 'children', allow_duplicate = True),
+    Output('autoSlider', 'disabled', allow_duplicate = True),
+    Input('autoSlider', 'n_intervals'),
+    State('autoplayFrames', 'data'),
+    State('autoplayRequest', 'data'),
     State('autoAnimate', 'data'),
-    State('checkList', 'value'),
-    Input('network-map-graph', 'clickData'),
+    State('time-slider', 'value'),
+    State('selected_ue', 'data'),
+    State('run-select', 'value'),
+    State('network-map-graph', 'figure'),
+    State('signal-strength-graph', 'figure'),
     prevent_initial_call = True)
-def update_map(_, autoSlide, selected_time, used_ID, autoAnimate, listOfRRCs, clickData):
-    if autoAnimate is None:
-        autoAnimate = False
-    if callback_context.triggered_id == 'autoPlaySimulation':
-        if autoAnimate:
-            returnVars = False, 'Autoplay Off', True
-        else:
-            # Check if we reached the last record
-            selected_time = min(UEroutes.index.max(), selected_time)
-            if selected_time == UEroutes.index.max():
-                returnVars = False, 'Autoplay Off', True
-            returnVars = True, 'Autoplaying..', False
-
-        return no_update, selected_time, *returnVars, updateGraph(clickData, used_ID, selected_time, listOfRRCs, 'a')[0]
-
-
-    if callback_context.triggered_id == 'autoSlider':
-        if autoAnimate:
-            selected_time = min(UEroutes.index.max(), selected_time + 10)
-            if selected_time == UEroutes.index.max():
-                autoAnimate = False
-            
-            if clickData is not None and clickData['points'][0]['curveNumber'] == 1:
-                UE_ID = clickData['points'][0]['pointNumber']
-                patchIndex = UEmeasurements.loc[UEmeasurements['UE_ID'] == UE_ID, 'eNB_ID'].nunique() + 2
-
-                for RRCmessage in listOfRRCs:
-                    tStamps = logs.loc[(logs['UE_ID'] == UE_ID) & (logs['RecognizedMessage'] == RRCmessage),
-                                    'Time(s)']
-                    if len(tStamps) > 0:
-                        patchIndex += 1
-
-                patch_figure = Patch()
-                patch_figure['data'][patchIndex]['x'] = [selected_time / 60, selected_time / 60]
-                patch_figure['data'][patchIndex + 1]['x'] = [selected_time / 60, selected_time / 60]
-
-                return *updateFigure(selected_time, used_ID), \
-                    autoAnimate, 'Autoplaying..' if autoAnimate else 'Autoplay Off', not autoAnimate, \
-                    patch_figure
 
-        else:
-            return no_update
-    else:
-        autoSlide = selected_time // 10
+# Playback speed only changes the tick interval in the browser
+app.clientside_callback(
+    f'speed => {updateInterval} / speed',
+    Output('autoSlider', 'interval'),
+    Input('autoplay-speed', 'value'),
+    prevent_initial_call = True)
 
-    return *updateFigure(selected_time, used_ID), \
-           autoAnimate, 'Autoplaying..' if autoAnimate else 'Autoplay Off', not autoAnimate, \
-           updateGraph(clickData, used_ID, selected_time, listOfRRCs, 'a')[0]
+
+@app.callback(
+    Output('autoplayFrames', 'data'),
+    Input('autoplayRequest', 'data'),
+    prevent_initial_call = True)
+def fetch_autoplay_frames(request):
+    if request is None:
+        return no_update
+    run = runCache.get(request['run'])
+    frames = autoplayWindow(UEtrajectories, run.servingLinks, request['time'],
+                            autoplayWindowFrames, sliderStep, run.endTime)
+    return {**frames, 'run' : request['run']}
 
 
 ###################################################################################################
 
-def updateGraph(clickData, used_ID, selected_time, listOfRRCs, _):
+def emptySignalGraph():
+    fig = go.Figure()
+    fig.update_layout(
+        xaxis = {'visible' : False},
+        yaxis = {'visible' : False},
+        annotations = [{
+            'text' : 'Click a UE on the map to see its signal strength',
+            'xref' : 'paper',
+            'yref' : 'paper',
+            'showarrow' : False,
+            'font' : {'size': 16}
+        }]
+    )
+    return fig
+
+
+def signalGraph(UE_ID, selected_time, listOfRRCs, run):
+    bundle = run.signalBundles.get(UE_ID)
+
+    fig = go.Figure()
+
+    # The simulation time cursor is always the first trace, so that slider moves
+    # only patch its x values (see cursorPatch)
+    fig.add_trace(go.Scatter(
+        x = [selected_time / 60, selected_time / 60],
+        y = bundle.bounds,
+        name = 'Simulation time',
+        uid = 'simulationTime',
+        showlegend = False,
+        line = {'color' : 'green', 'width' : 0.5, 'dash' : 'dot'}
+    ))
+
+    # Series are drawn at a bounded number of samples and refined by zoom_signal_graph
+    series = bundle.view(0, UEtrajectories.endTime, maxPointsPerTrace)
+    for (eNB_ID, _, _, isServingCell), (times, RSRP) in zip(bundle.eNBseries(), series):
+        if isServingCell:
+            fig.add_trace(go.Scatter(
+                x = times / 60,
+                y = RSRP,
+                name = f'eNB {eNB_ID} RSRP (dBm)',
+                line = {'color' : 'blue', 'width' : 1})
+            )
+        else:
+            fig.add_trace(go.Scatter(
+                x = times / 60,
+                y = RSRP,
+                name = f'eNB {eNB_ID} RSRP (dBm)',
+                visible = 'legendonly',
+                line = {'color' : 'orange', 'width' : 0.5})
+            )
+
+    (RSRQtimes, RSRQ), (RSRPtimes, RSRP) = series[-2:]
+    fig.add_trace(go.Scatter(
+        x = RSRQtimes / 60,
+        y = RSRQ,
+        name = 'Serving RSRQ (dB)', yaxis = 'y2', visible = 'legendonly'))
+
+    # Add RSRP and RSRQ traces with two different y-axes
+    fig.add_trace(go.Scatter(
+        x = RSRPtimes / 60,
+        y = RSRP,
+        name = 'Serving RSRP (dBm)',
+        line = {'color' : 'red', 'width' : 3}))
+
+    # Update layout for two y-axes
+    bounds = bundle.bounds
+    # uirevision keeps the zoom while a live run's graph is redrawn (see follow_live_run)
+    fig.update_layout(
+        title_text = f'Signal Strength for UE {UE_ID}',
+        uirevision = UE_ID,
+        xaxis_title = 'Time (m)',
+        yaxis = {'title' : 'RSRP (dBm)', 'range' : bounds},
+        xaxis = {'range' : [0, UEtrajectories.endTime / 60]},
+        yaxis2 = {'title' : 'RSRQ (dB)', 'overlaying' : 'y', 'side' : 'right'},
+        legend = {
+            'orientation' : 'h',
+            'yanchor' : 'bottom',
+            'y' : -0.3,
+            'xanchor' : 'left',
+            'x' : 0
+        }
+    )
+
+    for RRCmessage in listOfRRCs:
+        if RRCmessage in bundle.RRCtimes:
+            tStamps = bundle.RRCtimes[RRCmessage] / 60
+            separators = np.full(len(tStamps), np.nan)
+            fig.add_trace(go.Scatter(
+                x = np.column_stack((tStamps, tStamps, separators)).ravel(),
+                y = np.column_stack((np.full((len(tStamps), 2), bounds), separators)).ravel(),
+                name = RRCmessage,
+                line = {'color' : 'black', 'width' : 0.5, 'dash' : 'dash'}
+            ))
+
+    fig.add_annotation(text = 'Simulation time',
+                       xref = 'paper', yref = 'paper',
+                       x = selected_time / UEtrajectories.endTime, y = 1, 
+                       showarrow = False,
+                       xanchor = 'center', yanchor = 'bottom',
+                       font = {'size' : 10})
+
+    return fig
+
+
+def updateGraph(clickData, used_ID, selected_time, listOfRRCs, _, selectedRun):
     if clickData is None:
-        fig = go.Figure()
-        fig.update_layout(
-            xaxis = {'visible' : False},
-            yaxis = {'visible' : False},
-            annotations = [{
-                'text' : 'Click a UE on the map to see its signal strength',
-                'xref' : 'paper',
-                'yref' : 'paper',
-                'showarrow' : False,
-                'font' : {'size': 16}
-            }]
-        )
-        return fig, None
+        return emptySignalGraph(), None
 
     if clickData['points'][0]['curveNumber'] == 1:
         UE_ID = clickData['points'][0]['pointNumber']
-        servingCellMeasurements = UEmeasurements[(UEmeasurements['UE_ID'] == UE_ID) &
-                                                 (UEmeasurements['Status'] == 'Serving')]
-
-        fig = go.Figure()
-
-        for eNB_ID, subDF in UEmeasurements[UEmeasurements['UE_ID'] == UE_ID].groupby('eNB_ID'):
-            subDF2 = subDF.reset_index() \
-                          .sort_values(['Time(s)', 'RSRP']) \
-                          .groupby('Time(s)').tail(1)
-            if eNB_ID in servingCellMeasurements['eNB_ID'].unique():
-                fig.add_trace(go.Scatter(
-                    x = subDF2['Time(s)'] / 60,
-                    y = subDF2['RSRP'],
-                    name = f'eNB {eNB_ID} RSRP (dBm)',
-                    line = {'color' : 'blue', 'width' : 1})
-                )
-            else:
-                fig.add_trace(go.Scatter(
-                    x = subDF2['Time(s)'] / 60,
-                    y = subDF2['RSRP'],
-                    name = f'eNB {eNB_ID} RSRP (dBm)',
-                    visible = 'legendonly',
-                    line = {'color' : 'orange', 'width' : 0.5})
-                )
-
-
-        servingCellMeasurements2 = servingCellMeasurements.reset_index() \
-                                                          .sort_values(['Time(s)', 'RSRP']) \
-                                                          .groupby('Time(s)').tail(1)
-
-        fig.add_trace(go.Scatter(
-            x = servingCellMeasurements2['Time(s)'] / 60,
-            y = servingCellMeasurements2['RSRQ'],
-            name = 'Serving RSRQ (dB)', yaxis = 'y2', visible = 'legendonly'))
-
-        # Add RSRP and RSRQ traces with two different y-axes
-        fig.add_trace(go.Scatter(
-            x = servingCellMeasurements2['Time(s)'] / 60,
-            y = servingCellMeasurements2['RSRP'],
-            name = 'Serving RSRP (dBm)',
-            line = {'color' : 'red', 'width' : 3}))
-
-        # Update layout for two y-axes
-        allServing = UEmeasurements[
-            (UEmeasurements['UE_ID'] == UE_ID) &
-            UEmeasurements['eNB_ID'].isin(servingCellMeasurements['eNB_ID'].unique())]
-        bounds = [allServing['RSRP'].min() - 2, allServing['RSRP'].max() + 2]
-        fig.update_layout(
-            title_text = f'Signal Strength for UE {UE_ID}',
-            xaxis_title = 'Time (m)',
-            yaxis = {'title' : 'RSRP (dBm)', 'range' : bounds},
-            xaxis = {'range' : [0, UEroutes.index.max() / 60]},
-            yaxis2 = {'title' : 'RSRQ (dB)', 'overlaying' : 'y', 'side' : 'right'},
-            legend = {
-                'orientation' : 'h',
-                'yanchor' : 'bottom',
-                'y' : -0.3,
-                'xanchor' : 'left',
-                'x' : 0
-            }
-        )
-
-        for RRCmessage in listOfRRCs:
-            tStamps = logs.loc[(logs['UE_ID'] == UE_ID) & (logs['RecognizedMessage'] == RRCmessage),
-                               'Time(s)']
-            if len(tStamps) > 0:
-                xs = []
-                ys = []
-                for tStamp in tStamps:
-                    xs.extend([tStamp / 60, tStamp / 60, None])
-                    ys.extend([*bounds, None])
-                
-                fig.add_trace(go.Scatter(
-                    x = xs, y = ys,
-                    name = RRCmessage,
-                    line = {'color' : 'black', 'width' : 0.5, 'dash' : 'dash'}
-                ))
-
-        fig.add_trace(go.Scatter(
-            x = [selected_time / 60, selected_time / 60],
-            y = bounds,
-            showlegend = False,
-            line = {'color' : 'green', 'width' : 0.5, 'dash' : 'dot'}
-        ))
-        fig.add_annotation(text = 'Simulation time',
-                           xref = 'paper', yref = 'paper',
-                           x = selected_time / UEroutes.index.max(), y = 1, 
-                           showarrow = False,
-                           xanchor = 'center', yanchor = 'bottom',
-                           font = {'size' : 10})
-
-        return fig, UE_ID
+        return signalGraph(UE_ID, selected_time, listOfRRCs, runCache.get(selectedRun)), UE_ID
     else:
         return no_update, used_ID
 
@@ -444,66 +454,185 @@ def updateGraph(clickData, used_ID, selected_time, listOfRRCs, _):
     State('time-slider', 'value'),
     State('checkList', 'value'),
     Input('RRCs-to-show', 'n_clicks'),
+    State('run-select', 'value'),
     prevent_initial_call = True)
 def update_signal_graph(*args):
     return updateGraph(*args)
 
+
+@app.callback(
+    Output('signal-strength-graph', 'figure', allow_duplicate = True),
+    Input('signal-strength-graph', 'relayoutData'),
+    State('selected_ue', 'data'),
+    State('run-select', 'value'),
+    prevent_initial_call = True)
+def zoom_signal_graph(relayoutData, used_ID, selectedRun):
+    # Resamples the signal strength series for the zoomed x range: the finest level
+    # of detail that fits in maxPointsPerTrace samples per trace
+    if used_ID is None or relayoutData is None:
+        return no_update
+    signalBundles = runCache.get(selectedRun).signalBundles
+
+    patch_figure = Patch()
+    if 'xaxis.range[0]' in relayoutData:
+        xRange = [relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']]
+    elif 'xaxis.range' in relayoutData:
+        xRange = relayoutData['xaxis.range']
+    elif relayoutData.get('xaxis.autorange'):
+        xRange = [0, UEtrajectories.endTime / 60]
+        patch_figure['layout']['yaxis']['range'] = signalBundles.get(used_ID).bounds
+    else:
+        return no_update
+    if 'yaxis.range[0]' in relayoutData:
+        patch_figure['layout']['yaxis']['range'] = [relayoutData['yaxis.range[0]'],
+                                                    relayoutData['yaxis.range[1]']]
+
+    series = signalBundles.get(used_ID).view(float(xRange[0]) * 60, float(xRange[1]) * 60,
+                                             maxPointsPerTrace)
+    for i, (times, values) in enumerate(series):
+        patch_figure['data'][signalCursorTrace + 1 + i]['x'] = times / 60
+        patch_figure['data'][signalCursorTrace + 1 + i]['y'] = values
+    patch_figure['layout']['xaxis']['range'] = xRange
+    return patch_figure
+
+###################################################################################################
+
+@app.callback(
+    Output('network-map-graph', 'figure', allow_duplicate = True),
+    Output('checkList', 'options'),
+    Output('checkList', 'value'),
+    Output('HOselect', 'options'),
+    Output('HOselect', 'value'),
+    Output('HOstat', 'figure', allow_duplicate = True),
+    Output('signal-strength-graph', 'figure', allow_duplicate = True),
+    Output('selected_ue', 'data', allow_duplicate = True),
+    Output('time-slider', 'max'),
+    Output('time-slider', 'marks'),
+    Output('liveUpdate', 'disabled'),
+    Input('run-select', 'value'),
+    State('time-slider', 'value'),
+    prevent_initial_call = 'initial_duplicate')
+def select_run(selectedRun, selected_time):
+    # Shows the selected run, also on page load; it is imported unless it is still in
+    # the run cache. Runs that are still being written are followed by follow_live_run.
+    run = runCache.get(selectedRun)
+    return generateFigure(selected_time, None, run)[0], \
+           run.allMessageTypes, defaultMessageTypes(run), \
+           [f'{i}' for i in range(len(run.HOdata))], '0' if len(run.HOdata) > 0 else None, \
+           plotDataSlice(run, 0) if len(run.HOdata) > 0 else go.Figure(), \
+           emptySignalGraph(), None, \
+           run.endTime, sliderMarks(run.endTime), not run.live
+
+
+@app.callback(
+    Output('time-slider', 'max', allow_duplicate = True),
+    Output('time-slider', 'marks', allow_duplicate = True),
+    Output('checkList', 'options', allow_duplicate = True),
+    Output('HOselect', 'options', allow_duplicate = True),
+    Output('HOselect', 'value', allow_duplicate = True),
+    Output('signal-strength-graph', 'figure', allow_duplicate = True),
+    Output('liveUpdate', 'disabled', allow_duplicate = True),
+    Input('liveUpdate', 'n_intervals'),
+    State('run-select', 'value'),
+    State('selected_ue', 'data'),
+    State('time-slider', 'value'),
+    State('checkList', 'value'),
+    State('HOselect', 'value'),
+    prevent_initial_call = True)
+def follow_live_run(_, selectedRun, used_ID, selected_time, listOfRRCs, HO_ID):
+    # Reads what a running simulation wrote since the last update and extends the
+    # slider, the message types, the handover list and the signal strength graph.
+    # A finished run is replaced by its RunData, built from the complete outputs.
+    run = runCache.get(selectedRun)
+    if not run.live:
+        return *[no_update] * 6, True
+    grew = run.update()
+    if not run.live:
+        run = RunData(outputsDir / selectedRun, UEtrajectories, radioTowers, sliderStep)
+        runCache.put(selectedRun, run)
+    elif not grew:
+        return *[no_update] * 6, False
+
+    HOs = [f'{i}' for i in range(len(run.HOdata))]
+    return run.endTime, sliderMarks(run.endTime), run.allMessageTypes, HOs, \
+           '0' if HO_ID is None and HOs else no_update, \
+           signalGraph(used_ID, selected_time, listOfRRCs, run) if used_ID is not None \
+           else no_update, not run.live
+
 ###################################################################################################
 
 
-app.layout = html.Div([
-    html.H2('LTE handover simulation results',
-            style = {'textAlign' : 'center', 'padding' : '0pt', 'fontSize' : '20px'}),
-    html.Hr(),
-    html.Div([
+def serveLayout():
+    # Built on every page load, so runs added to outputs/ since are listed. No run is
+    # loaded here: the figures are filled in by select_run once the page is shown.
+    availableRuns, selectedRun = defaultRun()
+
+    return html.Div([
+        html.H2('LTE handover simulation results',
+                style = {'textAlign' : 'center', 'padding' : '0pt', 'fontSize' : '20px'}),
+        html.Div(
+            dcc.Dropdown(availableRuns, selectedRun, id = 'run-select', clearable = False),
+            style = {'width' : '300px', 'margin' : 'auto'}),
+        html.Hr(),
         html.Div([
-            timeSlider,
-            dcc.Interval(id = 'autoSlider', interval = updateInterval,
-                         n_intervals = 0, disabled = True),
             html.Div([
-                autoPlayButton,
-                dcc.Graph(id = 'network-map-graph',
-                          style = {'height' : '70vh'},
-                          config = {'displayModeBar' : False},
-                          figure = generateFigure(UEroutes.index[1], None)[0])
-            ], style = {'position' : 'relative'})
-        ],
-
-        style = {'width' : '45%', 'display' : 'inline-block', 'padding' : '5px',
-                 'verticalAlign' : 'top'}),
-        html.Div([
+                timeSlider,
+                dcc.Interval(id = 'autoSlider', interval = updateInterval,
+                             n_intervals = 0, disabled = True),
+                dcc.Interval(id = 'liveUpdate', interval = liveUpdateInterval, disabled = True),
+                html.Div([
+                    autoPlayButton,
+                    dcc.Graph(id = 'network-map-graph',
+                              style = {'height' : '70vh'},
+                              config = {'displayModeBar' : False})
+                ], style = {'position' : 'relative'})
+            ],
+
+            style = {'width' : '45%', 'display' : 'inline-block', 'padding' : '5px',
+                     'verticalAlign' : 'top'}),
             html.Div([
-                checklist,
-                html.Div(
-                    html.Button('Update shown RRC messages', id = 'RRCs-to-show',
-                                style = {'backgroundColor' : 'lightBlue'}),
-                    style = {'textAlign' : 'center'}),
-                ],
-                className = 'slider-container'),
-
-                dcc.Tabs([
-                    dcc.Tab(label = 'RSRP/RSRQ', children = [
-                        dcc.Graph(id = 'signal-strength-graph',
-                                  config = {'displayModeBar' : False},
-                                  style = {'height' : '60vh'})
-                    ]),
-                    dcc.Tab(label = 'HO Stats', children = [
-                        dcc.Dropdown([f'{i}' for i in range(len(HOdata))], '0', id = 'HOselect'),
-                        dcc.Graph(id = 'HOstat',
-                                  config = {'displayModeBar' : False},
-                                  style = {'height' : '60vh'},
-                                  figure = plotDataSlice(0) if len(HOdata) > 0 else None)
-                    ]),
-                ])
-            ],             
-            style = {'width' : '50%', 'display' : 'inline-block',
-                     'verticalAlign' : 'top', 'padding' : '5px'}
-        )
-    ]),
-    dcc.Store(id = 'selected_ue', storage_type = 'memory'),
-    dcc.Store(id = 'autoAnimate', storage_type = 'memory'),
-    dcc.Store(id = 'listOfRRCs', storage_type = 'memory')
-])
+                html.Div([
+                    dcc.Checklist(
+                        id = 'checkList',
+                        options = [],
+                        value = [],
+                        className = 'checklist-container'
+                    ),
+                    html.Div(
+                        html.Button('Update shown RRC messages', id = 'RRCs-to-show',
+                                    style = {'backgroundColor' : 'lightBlue'}),
+                        style = {'textAlign' : 'center'}),
+                    ],
+                    className = 'slider-container'),
+
+                    dcc.Tabs([
+                        dcc.Tab(label = 'RSRP/RSRQ', children = [
+                            dcc.Graph(id = 'signal-strength-graph',
+                                      config = {'displayModeBar' : False},
+                                      style = {'height' : '60vh'})
+                        ]),
+                        dcc.Tab(label = 'HO Stats', children = [
+                            dcc.Dropdown([], None, id = 'HOselect'),
+                            dcc.Graph(id = 'HOstat',
+                                      config = {'displayModeBar' : False},
+                                      style = {'height' : '60vh'})
+                        ]),
+                    ])
+                ],             
+                style = {'width' : '50%', 'display' : 'inline-block',
+                         'verticalAlign' : 'top', 'padding' : '5px'}
+            )
+        ]),
+        dcc.Store(id = 'selected_ue', storage_type = 'memory'),
+        dcc.Store(id = 'autoAnimate', storage_type = 'memory'),
+        dcc.Store(id = 'shownTime', storage_type = 'memory'),
+        dcc.Store(id = 'autoplayFrames', storage_type = 'memory'),
+        dcc.Store(id = 'autoplayRequest', storage_type = 'memory'),
+        dcc.Store(id = 'listOfRRCs', storage_type = 'memory')
+    ])
+
+
+app.layout = serveLayout
 
 
 server = app.server